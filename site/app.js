@@ -19,9 +19,11 @@ const ONDEMAND_ENDPOINT = "https://yt-ondemand.araki-69c.workers.dev/ondemand";
 const POLL_INTERVAL_MS = 3000;
 const POLL_TRIES_INDEX = 60;
 const POLL_TRIES_DATA  = 60;
+const POLL_TRIES_STATUS = 100;
 
 const state = {
   index: null,
+  manifest: null,
   currentChannelId: null,
   mode: "views_days",
   yLog: false,
@@ -29,6 +31,7 @@ const state = {
   channelCache: new Map(),
 
   redPlotPoints: [],
+  redPlotPixels: [],
   pulseRunning: false,
   pulseT: 0,
   plotEventsAttached: false,
@@ -56,6 +59,69 @@ async function fetchJson(path) {
   return JSON.parse(fixed);
 }
 
+/* ★manifest（内容ハッシュ付きファイル名）経由の列指向 points。ファイル名が変わらない限りブラウザキャッシュを使う */
+async function fetchManifest() {
+  const m = await fetchJson(`${DATA_BASE}/manifest.json`).catch(() => null);
+  return (m && m.channels && typeof m.channels === "object") ? m : null;
+}
+
+async function fetchImmutableJson(path, gzPath) {
+  if (gzPath && typeof DecompressionStream !== "undefined") {
+    try {
+      const r = await fetch(gzPath, { cache: "force-cache" });
+      if (r.ok && r.body) {
+        return await new Response(r.body.pipeThrough(new DecompressionStream("gzip"))).json();
+      }
+    } catch (e) {
+      console.warn("gzip points fallback:", e);
+    }
+  }
+  const r = await fetch(path, { cache: "force-cache" });
+  if (!r.ok) throw new Error(`fetch failed: ${path} (${r.status})`);
+  return r.json();
+}
+
+function decodePointsColumns(js) {
+  const cols = js?.columns || {};
+  const dicts = js?.dicts || {};
+  const n = safeNum(js?.count, 0);
+  const keys = Object.keys(cols);
+  const points = new Array(n);
+  for (let i = 0; i < n; i++) {
+    const p = {};
+    for (const k of keys) {
+      const v = cols[k][i];
+      if (dicts[k]) p[k] = dicts[k][v];
+      else if (k === "isShort") p[k] = v === 1;
+      else p[k] = v;
+    }
+    points[i] = p;
+  }
+  return { run_at_utc: js?.run_at_utc, generator_version: js?.generator_version, points };
+}
+
+async function fetchChannelPoints(channelId) {
+  const base = `${DATA_BASE}/channels/${channelId}`;
+  const ent = state.manifest?.channels?.[channelId];
+  if (ent?.points) {
+    try {
+      const gz = ent.points_gz ? `${DATA_BASE}/${ent.points_gz}` : null;
+      return decodePointsColumns(await fetchImmutableJson(`${DATA_BASE}/${ent.points}`, gz));
+    } catch (e) {
+      console.warn("manifest points fallback:", e);
+    }
+  }
+  return fetchJson(`${base}/latest_points.json`);
+}
+
+/* ★大きいチャンネルだけ manifest に描画用の間引き版（lod）がある。無ければ null（全件で描く） */
+async function fetchChannelLod(channelId) {
+  const ent = state.manifest?.channels?.[channelId];
+  if (!ent?.lod) return null;
+  const gz = ent.lod_gz ? `${DATA_BASE}/${ent.lod_gz}` : null;
+  return decodePointsColumns(await fetchImmutableJson(`${DATA_BASE}/${ent.lod}`, gz));
+}
+
 async function fetchMaybeOk(path) {
   const r = await fetch(path, { cache: "no-store" });
   return r.ok;
@@ -204,8 +270,8 @@ function findChannelIdByManualInput(raw) {
 }
 
 /* ★ondemandレスポンスがJSONじゃない/空のときに黙らない */
-async function startOndemand(rawInput) {
-  const payload = { channel: normalizeManual(rawInput) };
+async function startOndemand(rawInput, requestId) {
+  const payload = { channel: normalizeManual(rawInput), request_id: requestId };
   const r = await fetch(ONDEMAND_ENDPOINT, {
     method: "POST",
     mode: "cors",
@@ -225,8 +291,9 @@ async function startOndemand(rawInput) {
 }
 
 async function refreshIndex() {
-  const index = await fetchJson(`${DATA_BASE}/index.json`);
+  const [index, manifest] = await Promise.all([fetchJson(`${DATA_BASE}/index.json`), fetchManifest()]);
   state.index = index;
+  state.manifest = manifest;
   renderChannelList(index);
   renderChannelSelect(index);
   return index;
@@ -259,6 +326,28 @@ async function waitChannelIdFromIndex(rawInput) {
   return null;
 }
 
+function newRequestId() {
+  if (globalThis.crypto?.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+/* ★キューの処理結果（ondemand_status.json）を待つ。request_id で引き、無ければ依頼後に積まれた同じ入力のもの */
+async function waitOndemandStatus(requestId, rawInput, requestedAtMs) {
+  const input = normalizeManual(rawInput).toLowerCase();
+  for (let i = 0; i < POLL_TRIES_STATUS; i++) {
+    showManualHint(`解析中…（キュー処理待ち ${i + 1}/${POLL_TRIES_STATUS}）`);
+    const js = await fetchJson(`${DATA_BASE}/ondemand_status.json`).catch(() => null);
+    const reqs = js?.requests || {};
+    const hit = reqs[requestId] || Object.values(reqs).find(r =>
+      String(r?.channel || "").toLowerCase() === input &&
+      Date.parse(r?.requested_at_utc || "") >= requestedAtMs - 60000
+    );
+    if (hit) return hit;
+    await sleep(POLL_INTERVAL_MS);
+  }
+  return null;
+}
+
 async function waitChannelDataReady(channelId) {
   const base = `${DATA_BASE}/channels/${channelId}`;
   const probe = `${base}/latest_points.json`;
@@ -378,19 +467,36 @@ async function loadChannelBundle(channelId) {
   if (state.channelCache.has(channelId)) return state.channelCache.get(channelId);
 
   const base = `${DATA_BASE}/channels/${channelId}`;
-  const [channel, latest, pointsJson, st] = await Promise.all([
+  const [channel, latest, pointsJson, lodJson, st] = await Promise.all([
     fetchJson(`${base}/channel.json`).catch(() => ({})),
     fetchJson(`${base}/latest.json`).catch(() => ({})),
-    fetchJson(`${base}/latest_points.json`).catch(() => ({})),
+    fetchChannelPoints(channelId).catch(() => ({})),
+    fetchChannelLod(channelId).catch((e) => { console.warn("points lod:", e); return null; }),
     fetchJson(`${base}/state.json`).catch(() => ({})),
   ]);
 
   const points = normalizePoints(pointsJson);
-  const bundle = { channel, latest, points, state: st };
+  const lod = lodJson ? normalizePoints(lodJson) : null;
+  const bundle = { channel, latest, points, lod, state: st };
   state.channelCache.set(channelId, bundle);
+  loadChannelParts(channelId, bundle).catch((e) => console.warn("points parts:", e));
   return bundle;
 }
 
+/* ★全履歴モードの残り（manifest の parts）を裏で1つずつ読み、読めた分から足して描き直す
+   （lod があるときはそれが parts も含めた全件からの間引きなので描き直さない） */
+async function loadChannelParts(channelId, bundle) {
+  const ent = state.manifest?.channels?.[channelId];
+  const parts = Array.isArray(ent?.parts) ? ent.parts : [];
+  for (const part of parts) {
+    const gz = ent.parts_gz ? `${DATA_BASE}/${part}.gz` : null;
+    const more = normalizePoints(decodePointsColumns(await fetchImmutableJson(`${DATA_BASE}/${part}`, gz)));
+    if (state.channelCache.get(channelId) !== bundle) return;
+    for (const p of more) bundle.points.push(p);
+    if (state.currentChannelId === channelId && !bundle.lod) await drawPlot(bundle);
+  }
+}
+
 async function setChannel(channelId) {
   state.currentChannelId = channelId;
   const sel = $("#channelSelect");
@@ -430,8 +536,38 @@ function linspace(xmin, xmax, n) {
   return arr;
 }
 
+/* ★run_weekly.py が出した曲線の標本（baseline.curves）。upper は倍率を掛けるだけ。無ければ null */
+function precomputedBaselineTraces(mode, baseline) {
+  const c = baseline?.curves?.[mode];
+  if (!c || !Array.isArray(c.views)) return null;
+  const NAT_UP = safeNum(baseline?.NAT_UPPER_RATIO, NaN) * UPPER_MULT;
+
+  if (mode === "views_days") {
+    if (!Array.isArray(c.days) || !Number.isFinite(NAT_UP)) return null;
+    return [
+      { type:"scatter", mode:"lines", name:"expected", x:c.days, y:c.views, hoverinfo:"skip", line:{ width:2, dash:"solid" } },
+      { type:"scatter", mode:"lines", name:"upper",    x:c.days, y:c.views.map(v => v * NAT_UP), hoverinfo:"skip", line:{ width:2, dash:"dot" } },
+    ];
+  }
+
+  if (!Array.isArray(c.likes)) return null;
+  const traces = [
+    { type:"scatter", mode:"lines", name:"expected", x:c.views, y:c.likes, hoverinfo:"skip", line:{ width:2, dash:"solid" } },
+  ];
+  if (Number.isFinite(NAT_UP)) {
+    traces.push({
+      type:"scatter", mode:"lines", name:"upper",
+      x: c.views.map(v => v * NAT_UP), y: c.likes,
+      hoverinfo:"skip", line:{ width:2, dash:"dot" }
+    });
+  }
+  return traces;
+}
+
 function buildBaselineTraces(mode, rows, baseline) {
   if (!rows.length) return [];
+  const pre = precomputedBaselineTraces(mode, baseline);
+  if (pre) return pre;
   const N = 400;
 
   if (mode === "views_days") {
@@ -440,8 +576,12 @@ function buildBaselineTraces(mode, rows, baseline) {
     const NAT_UP = safeNum(baseline?.NAT_UPPER_RATIO, NaN) * UPPER_MULT;
     if (!(Number.isFinite(a) && Number.isFinite(b) && Number.isFinite(NAT_UP))) return [];
 
-    const daysArr = rows.map(getDays).filter(v => Number.isFinite(v));
-    const tmax = Math.max(...daysArr, 1);
+    /* ★Math.max(...arr) は件数が多いと引数の上限で落ちるのでループで */
+    let tmax = 1;
+    for (const p of rows) {
+      const d = getDays(p);
+      if (d > tmax) tmax = d;
+    }
     const t_line = linspace(1, tmax, N);
 
     const log_center = t_line.map(t => a + b * t);
@@ -461,10 +601,15 @@ function buildBaselineTraces(mode, rows, baseline) {
   const NAT_UP = safeNum(baseline?.NAT_UPPER_RATIO, NaN) * UPPER_MULT;
   if (!(Number.isFinite(b0) && Number.isFinite(b1))) return [];
 
-  const likesArr = rows.map(getLikes).filter(v => v > 0);
-  if (!likesArr.length) return [];
-  const lmin = Math.min(...likesArr);
-  const lmax = Math.max(...likesArr);
+  let lmin = Infinity;
+  let lmax = -Infinity;
+  for (const p of rows) {
+    const l = getLikes(p);
+    if (!(l > 0)) continue;
+    if (l < lmin) lmin = l;
+    if (l > lmax) lmax = l;
+  }
+  if (!Number.isFinite(lmin)) return [];
 
   const logL_line = linspace(Math.log(lmin), Math.log(lmax), 300);
   const logV_line = logL_line.map(x => b0 + b1 * x);
@@ -525,6 +670,32 @@ function syncPulseCanvasToPlot() {
   const dpr = window.devicePixelRatio || 1;
   c.width  = Math.max(1, Math.floor(sz.w * dpr));
   c.height = Math.max(1, Math.floor(sz.h * dpr));
+
+  projectRedPlotPoints();
+}
+
+/* ★RED 点のピクセル座標は描画/ズーム/リサイズのときだけ計算し直す（毎フレームは使い回す） */
+function projectRedPlotPoints() {
+  const gd = $("#plot");
+  const c  = $("#plotPulse");
+  const out = [];
+  const pts = state.redPlotPoints;
+  if (gd && c && pts && pts.length) {
+    const dpr = window.devicePixelRatio || 1;
+    const w = c.width;
+    const h = c.height;
+    for (let i = 0; i < pts.length; i++) {
+      const p = pts[i];
+      const xy = dataToPixel(gd, p.x, p.y);
+      if (!xy) continue;
+
+      const x = xy.px * dpr;
+      const y = xy.py * dpr;
+      if (!(x >= -50 && x <= w + 50 && y >= -50 && y <= h + 50)) continue;
+      out.push({ x, y, strength: p.strength, phase: (i * 17) % 97 });
+    }
+  }
+  state.redPlotPixels = out;
 }
 
 function dataToPixel(gd, x, y) {
@@ -558,19 +729,14 @@ function drawPulses() {
   ctx.clearRect(0, 0, w, h);
 
   const t = state.pulseT;
-  const pts = state.redPlotPoints;
+  const pts = state.redPlotPixels;
   if (!pts || pts.length === 0) return;
 
   for (let i = 0; i < pts.length; i++) {
     const p = pts[i];
-    const xy = dataToPixel(gd, p.x, p.y);
-    if (!xy) continue;
-
-    const x = xy.px * dpr;
-    const y = xy.py * dpr;
-    if (!(x >= -50 && x <= w + 50 && y >= -50 && y <= h + 50)) continue;
-
-    const phase = (i * 17) % 97;
+    const x = p.x;
+    const y = p.y;
+    const phase = p.phase;
     const beat = 0.5 + 0.5 * Math.sin((t * 0.22 * PULSE_SPEED) + phase) * Math.sin((t * 0.07 * PULSE_SPEED) + phase * 0.3);
 
     const alpha = (0.10 + 0.28 * p.strength) * beat;
@@ -618,7 +784,8 @@ function attachPlotEventsOnce() {
 
 /* ---------- plot ---------- */
 async function drawPlot(bundle) {
-  const points = Array.isArray(bundle?.points) ? bundle.points : [];
+  /* ★大きいチャンネルは間引き版（RED/△ は全件＋OK は密度を保って数百件）で描く */
+  const points = Array.isArray(bundle?.lod) ? bundle.lod : Array.isArray(bundle?.points) ? bundle.points : [];
   const baseline = bundle?.latest?.baseline || {};
 
   /* ★ショートは両モード共通で完全除外（判定も表示もしない） */
@@ -798,12 +965,23 @@ async function boot() {
       if (already) { showManualHint(""); await setChannel(already); return; }
 
       showManualHint("解析中…（オンデマンド起動中）");
-      const res = await startOndemand(input);
+      const requestId = newRequestId();
+      const requestedAt = Date.now();
+      const res = await startOndemand(input, requestId);
 
       let channelId =
         (res && (res.channel_id || res.channelId || res.id)) ||
         (input.startsWith("UC") ? input : null);
 
+      if (!channelId) {
+        const st = await waitOndemandStatus(requestId, input, requestedAt);
+        if (st?.status === "error") {
+          showManualHint(`失敗: ${st.error || "ondemand error"}`);
+          return;
+        }
+        channelId = st?.channel_id || null;
+      }
+
       // JSONが返ってきてるなら、ここで少なくとも何か見える
       if (!channelId) {
         showManualHint("解析中…（index更新待ち）");
@@ -836,8 +1014,9 @@ async function boot() {
   updateYScaleButtons();
   setInputMode("select");
 
-  const index = await fetchJson(`${DATA_BASE}/index.json`);
+  const [index, manifest] = await Promise.all([fetchJson(`${DATA_BASE}/index.json`), fetchManifest()]);
   state.index = index;
+  state.manifest = manifest;
   renderChannelList(index);
   renderChannelSelect(index);
 
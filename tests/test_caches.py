@@ -0,0 +1,52 @@
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tools"))
+
+import run_weekly as rw  # noqa: E402
+
+
+def _fresh_channel_meta(monkeypatch, path):
+    monkeypatch.setattr(rw, "CHANNEL_META_CACHE", path)
+    monkeypatch.setattr(rw, "_CHANNEL_META", {"handles": {}, "channels": {}})
+    monkeypatch.setattr(rw, "_CHANNEL_META_LOCK", threading.Lock())
+    monkeypatch.setattr(rw, "_CHANNEL_META_LOADED", False)
+
+
+def test_save_channel_meta_without_load_keeps_file(tmp_path, monkeypatch):
+    # 一度もキャッシュを引かずに終わった run でも channel_meta.json は空にならない
+    path = tmp_path / "channel_meta.json"
+    disk = {"channels": {"UCa": {"item": {"id": "UCa"}, "fetched_at": 1}}, "handles": {"a": {"channel_id": "UCa", "fetched_at": 1}}}
+    path.write_text(json.dumps(disk, sort_keys=True, separators=(",", ":")) + "\n", encoding="utf-8")
+    _fresh_channel_meta(monkeypatch, path)
+
+    rw.save_channel_meta()
+
+    assert json.loads(path.read_text(encoding="utf-8")) == disk
+
+
+def test_save_channel_meta_merges_new_entries(tmp_path, monkeypatch):
+    path = tmp_path / "channel_meta.json"
+    path.write_text(json.dumps({"handles": {"a": {"channel_id": "UCa", "fetched_at": 1}}, "channels": {}}), encoding="utf-8")
+    _fresh_channel_meta(monkeypatch, path)
+
+    rw._channel_meta_put("handles", "b", {"channel_id": "UCb", "etag": None})
+    rw.save_channel_meta()
+
+    handles = json.loads(path.read_text(encoding="utf-8"))["handles"]
+    assert sorted(handles) == ["a", "b"]
+
+
+def test_save_shorts_cache_without_load_keeps_file(tmp_path, monkeypatch):
+    path = tmp_path / "shorts_cache.json"
+    disk = {"abcdefghijk": [1, 1700000000], "bcdefghijkl": [0, 1700000000]}
+    path.write_text(json.dumps(disk, sort_keys=True, separators=(",", ":")) + "\n", encoding="utf-8")
+    monkeypatch.setattr(rw, "SHORTS_CACHE", path)
+    monkeypatch.setattr(rw, "_SHORTS_URL_CACHE", {})
+    monkeypatch.setattr(rw, "_SHORTS_CACHE_LOADED", False)
+
+    rw.save_shorts_cache()
+
+    assert json.loads(path.read_text(encoding="utf-8")) == disk
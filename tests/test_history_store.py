@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tools"))
+
+import run_weekly as rw  # noqa: E402
+
+
+def test_append_skips_malformed_video_ids(tmp_path, capsys):
+    # 11文字でない video_id は行ごと落とし、残りの views/likes は揃ったまま書く
+    store = rw.HistoryStore(tmp_path / "history")
+    assert store.append(100, ["abcdefghijk", "short", "bcdefghijkl", "ÄÖÜabcdefgh"], [1, 2, 3, 4], [10, 20, 30, 40])
+
+    snap = store.snapshot(100)
+    assert snap["video_id"].tolist() == [b"abcdefghijk", b"bcdefghijkl"]
+    assert snap["views"].tolist() == [1, 3]
+    assert snap["likes"].tolist() == [10, 30]
+    assert "skipped 2 rows" in capsys.readouterr().out
+
+    # 同じストアを開き直しても行数と run が合っている
+    again = rw.HistoryStore(tmp_path / "history")
+    assert again.rows == 2 and again.runs() == [100]
+
+
+def test_velocity_with_malformed_video_id(tmp_path):
+    store = rw.HistoryStore(tmp_path / "history")
+    store.append(100, ["abcdefghijk"], [1000], [10])
+    points = [
+        {"video_id": "abcdefghijk", "views": 1500, "likes": 15, "days": 10.0},
+        {"video_id": "ÄÖÜabcdefgh", "views": 10, "likes": 1, "days": 10.0},
+    ]
+    rw.add_velocity_features(points, store, 100 + 86400)
+    assert [p["views_gain"] for p in points] == [500, None]
+    assert store.append(100 + 86400, [p["video_id"] for p in points], [p["views"] for p in points], [p["likes"] for p in points])
+    assert store.rows == 2
@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+TOOLS = Path(__file__).resolve().parents[1] / "tools"
+sys.path.insert(0, str(TOOLS / "bench"))
+
+from fake_api import FakeYouTube  # noqa: E402
+from synth import synth_channel  # noqa: E402
+
+N_CHANNELS = 3
+N_VIDEOS = 120
+CACHES = ("shorts_cache.json", "channel_meta.json")
+
+
+@pytest.fixture(scope="module")
+def fake():
+    channels = [synth_channel(i, N_VIDEOS, datetime.now(timezone.utc)) for i in range(N_CHANNELS)]
+    fake = FakeYouTube(channels)
+    fake.start()
+    fake.channel_ids = [ch["channel"]["id"] for ch in channels]
+    fake.watch_keys = ["@" + channels[0]["handle"]] + fake.channel_ids[1:]
+    yield fake
+    fake.stop()
+
+
+def run(base, fake, *args, check=True):
+    env = {**os.environ, **fake.env(), "YT_MONITOR_BASE_DIR": str(base)}
+    r = subprocess.run([sys.executable, str(TOOLS / "run_weekly.py"), *args], env=env, capture_output=True, text=True)
+    if check:
+        assert r.returncode == 0, r.stdout[-2000:] + r.stderr[-2000:]
+    return r
+
+
+def read_caches(base):
+    return {name: (base / "data" / name).read_text(encoding="utf-8") for name in CACHES}
+
+
+@pytest.fixture
+def base(tmp_path, fake):
+    # 全件取得を1回済ませ、両方のキャッシュが中身つきで残っている状態
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "watchlist.txt").write_text("\n".join(fake.watch_keys) + "\n", encoding="utf-8")
+    run(tmp_path, fake, "--concurrency", "2")
+    for name, text in read_caches(tmp_path).items():
+        assert len(json.loads(text)) > 0, name
+    return tmp_path
+
+
+def test_red_only_keeps_caches(base, fake):
+    before = read_caches(base)
+    run(base, fake, "--red_only")
+    assert read_caches(base) == before
+
+
+def test_replay_keeps_caches(base, fake):
+    before = read_caches(base)
+    requests = dict(fake.stats)
+    run(base, fake, "--replay", "--replay_workers", "2")
+    assert read_caches(base) == before
+    assert dict(fake.stats) == requests
+
+
+def test_failed_ondemand_keeps_caches(base, fake):
+    # 取得の前に失敗する（存在しないチャンネル）ときも、キャッシュは前のまま
+    before = read_caches(base)
+    r = run(base, fake, "--ondemand", "--channel", "UCdoesnotexist0000000000")
+    assert "ok=False" in r.stdout
+    assert read_caches(base) == before
+
+
+def test_failed_drain_keeps_caches(base, fake):
+    before = read_caches(base)
+    run(base, fake, "--enqueue", "--channel", "@nosuchhandle")
+    run(base, fake, "--enqueue", "--channel", "UCdoesnotexist0000000000")
+    run(base, fake, "--drain_queue")
+    status = json.loads((base / "data" / "ondemand_status.json").read_text(encoding="utf-8"))["requests"]
+    assert [st["status"] for st in status.values()] == ["error", "error"]
+    assert read_caches(base) == before
+
+
+
+def test_scheduled_nothing_chosen_keeps_caches(base, fake):
+    # 予算 0 で1チャンネルも回さない --scheduled
+    before = read_caches(base)
+    requests = dict(fake.stats)
+    r = run(base, fake, "--scheduled", "--daily_budget_units", "0")
+    assert "scheduled: 0/" in r.stdout
+    assert read_caches(base) == before
+    assert dict(fake.stats) == requests
+
+
+def test_resume_of_finished_run_keeps_caches(base, fake):
+    # 全部 written の journal に --resume しても取り直さず、キャッシュもそのまま
+    before = read_caches(base)
+    requests = dict(fake.stats)
+    run(base, fake, "--concurrency", "2", "--resume")
+    assert read_caches(base) == before
+    assert dict(fake.stats) == requests
+
+
+def test_merge_keeps_existing_cache_entries(base, fake):
+    before = {name: json.loads(text) for name, text in read_caches(base).items()}
+    run(base, fake, "--shard", "0/2")
+    run(base, fake, "--shard", "1/2")
+    run(base, fake, "--merge")
+    after = {name: json.loads(text) for name, text in read_caches(base).items()}
+    assert before["shorts_cache.json"].keys() <= after["shorts_cache.json"].keys()
+    for kind in ("handles", "channels"):
+        assert before["channel_meta.json"][kind].keys() <= after["channel_meta.json"][kind].keys()
+
+
+def _index(base):
+    idx = json.loads((base / "data" / "index.json").read_text(encoding="utf-8"))
+    rows = [{**ch, "max_anomaly_ratio": pytest.approx(ch["max_anomaly_ratio"])} for ch in idx["channels"]]
+    points = {
+        ch["channel_id"]: [
+            p["video_id"]
+            for p in json.loads((base / "data" / "channels" / ch["channel_id"] / "latest_points.json").read_text(encoding="utf-8"))["points"]
+        ]
+        for ch in idx["channels"]
+    }
+    return idx["watch_count"], rows, points
+
+
+# 2 シャードでは @bench0 と UC...0 が同じシャード、4 シャードでは別のシャードに入る
+@pytest.mark.parametrize("n", [2, 4])
+def test_shard_merge_matches_single_run(tmp_path, fake, n):
+    # 同じチャンネルを @handle と UC... の両方で登録しておく
+    keys = fake.watch_keys + [fake.channel_ids[0]]
+    for name in ("single", "sharded"):
+        (tmp_path / name / "data").mkdir(parents=True)
+        (tmp_path / name / "data" / "watchlist.txt").write_text("\n".join(keys) + "\n", encoding="utf-8")
+
+    run(tmp_path / "single", fake)
+    resolves = fake.stats.get("forHandle", 0)
+    for i in range(n):
+        run(tmp_path / "sharded", fake, "--shard", f"{i}/{n}")
+    run(tmp_path / "sharded", fake, "--merge")
+    # ハンドルは担当のシャードだけが解決する
+    assert fake.stats.get("forHandle", 0) - resolves == 1
+
+    watch_count, rows, points = _index(tmp_path / "single")
+    assert watch_count == N_CHANNELS
+    assert _index(tmp_path / "sharded") == (watch_count, rows, points)
+
+
+def test_scheduled_budget_counts_handle_resolution(tmp_path, fake):
+    # 重複まとめで解決した @handle の分（channels 1回 = 1 ユニット）は選ぶ前に予算から引き、台帳にも載せる
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "watchlist.txt").write_text("\n".join(fake.watch_keys) + "\n", encoding="utf-8")
+    run(tmp_path, fake, "--scheduled", "--daily_budget_units", "1000")
+
+    schedule = json.loads((tmp_path / "data" / "schedule.json").read_text(encoding="utf-8"))
+    index = json.loads((tmp_path / "data" / "index.json").read_text(encoding="utf-8"))
+    assert schedule["last_plan"]["budget_units"] == 999
+    assert list(schedule["ledger"].values()) == [index["metrics"]["quota_units"]]
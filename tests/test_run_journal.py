@@ -0,0 +1,49 @@
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tools"))
+
+import run_weekly as rw  # noqa: E402
+
+
+def test_checkpoint_while_shorts_probes_write(tmp_path, monkeypatch):
+    # 別スレッドの /shorts/ プローブがキャッシュに書いている最中に checkpoint しても落ちない
+    monkeypatch.setattr(rw, "SHORTS_CACHE", tmp_path / "shorts_cache.json")
+    monkeypatch.setattr(rw, "CHANNEL_META_CACHE", tmp_path / "channel_meta.json")
+    monkeypatch.setattr(rw, "RUN_JOURNAL_CACHE_FLUSH_SEC", 0)
+    monkeypatch.setattr(rw, "OFFLINE", False)
+    monkeypatch.setattr(rw, "_SHORTS_CACHE_LOADED", True)
+    # 走査に時間がかかるだけの件数を入れておき、スレッド切り替えも細かくする
+    monkeypatch.setattr(rw, "_SHORTS_URL_CACHE", {f"p{i:010d}": [0, 0] for i in range(100000)})
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    monkeypatch.setattr(rw, "_probe_shorts_url", lambda vid: 0)
+
+    journal = rw.RunJournal.start(tmp_path / "run_journal.jsonl", datetime(2026, 1, 11, tzinfo=timezone.utc))
+    stop = threading.Event()
+    errors = []
+
+    def probe(base):
+        for i in range(20000):
+            if stop.is_set():
+                return
+            rw.is_short_by_shorts_url(f"{base}{i:09d}")
+
+    writers = [threading.Thread(target=probe, args=(f"w{k}",), daemon=True) for k in range(2)]
+    for t in writers:
+        t.start()
+    try:
+        while any(t.is_alive() for t in writers):
+            journal.checkpoint()
+    except Exception as e:
+        errors.append(e)
+    finally:
+        stop.set()
+        for t in writers:
+            t.join()
+        sys.setswitchinterval(switch)
+
+    assert errors == []
+    assert (tmp_path / "shorts_cache.json").exists()
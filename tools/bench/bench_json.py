@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+JSON 書き出しのベンチマーク（ストリーミング版 vs 旧 _json_sanitize + json.dumps + write_text）。
+
+  python tools/bench/bench_json.py [--sizes 500,5000,50000] [--repeat 3]
+
+- latest_points.json 相当（pretty）と latest_500_playlistItems.json 相当（compact）を、
+  ファイルが無い状態から書く時間・スループット・tracemalloc のピークメモリで比較する
+- runs.jsonl への追記（1行ずつ）も比較する
+- 旧実装はこのファイルに参照用として残してある。出力バイト列が一致することも確認する
+"""
+import argparse, json, math, shutil, sys, tempfile, time, tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import run_weekly as rw  # noqa: E402
+from bench_points import prime_shorts_cache  # noqa: E402
+from synth import synth_videos  # noqa: E402
+
+
+# ============================
+# 旧実装（参照用）
+# ============================
+def _json_sanitize_legacy(x):
+    if isinstance(x, float):
+        if math.isnan(x) or math.isinf(x):
+            return None
+        return x
+    if isinstance(x, dict):
+        return {k: _json_sanitize_legacy(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_json_sanitize_legacy(v) for v in x]
+    return x
+
+
+def write_legacy(path, obj, profile):
+    indent, item_sep, key_sep = rw.JSON_PROFILES[profile]
+    text = json.dumps(
+        _json_sanitize_legacy(obj), ensure_ascii=False, allow_nan=False,
+        indent=2 if indent else None, separators=(item_sep, key_sep),
+    )
+    rw.write_text_if_changed(path, text)
+
+
+def append_legacy(path, obj):
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(_json_sanitize_legacy(obj), ensure_ascii=False, allow_nan=False) + "\n")
+
+
+def write_stream(path, obj, profile):
+    rw.write_json_if_changed(path, obj, profile=profile)
+
+
+# ============================
+# 入力
+# ============================
+def synth_docs(n, run_at):
+    videos = synth_videos(n, run_at)
+    prime_shorts_cache(videos)
+    points, baseline = rw.compute_points_and_baseline(videos, run_at)
+    pli = {
+        "full_fetch_at_utc": run_at.isoformat(),
+        "items": [
+            {"contentDetails": {"videoId": v["id"], "videoPublishedAt": v["snippet"]["publishedAt"]},
+             "snippet": {"title": v["snippet"]["title"]}}
+            for v in videos
+        ],
+    }
+    run_line = {"generator_version": rw.GENERATOR_VERSION, "run_at_utc": run_at.isoformat(), "baseline": baseline}
+    return {
+        "latest_points.json": ({"run_at_utc": run_at.isoformat(), "points": points}, "pretty"),
+        "latest_500_playlistItems.json": (pli, "compact"),
+    }, run_line
+
+
+def measure(fn, path, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        path.unlink(missing_ok=True)
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    path.unlink(missing_ok=True)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, path.read_bytes()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark JSON writers (streaming vs legacy sanitize+dumps)")
+    ap.add_argument("--sizes", default="500,5000,50000")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--appends", type=int, default=2000, help="runs.jsonl lines to append per measurement")
+    args = ap.parse_args()
+
+    run_at = datetime(2026, 1, 11, tzinfo=timezone.utc)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_json_"))
+    results = []
+    try:
+        for n in [int(x) for x in args.sizes.split(",") if x]:
+            docs, run_line = synth_docs(n, run_at)
+            for name, (obj, profile) in docs.items():
+                a, b = tmp / ("legacy_" + name), tmp / ("stream_" + name)
+                t_old, m_old, out_old = measure(lambda: write_legacy(a, obj, profile), a, args.repeat)
+                t_new, m_new, out_new = measure(lambda: write_stream(b, obj, profile), b, args.repeat)
+                mb = len(out_new) / 2**20
+                results.append({
+                    "n": n,
+                    "file": name,
+                    "profile": profile,
+                    "bytes": len(out_new),
+                    "legacy_sec": t_old,
+                    "stream_sec": t_new,
+                    "legacy_mib_per_sec": mb / t_old,
+                    "stream_mib_per_sec": mb / t_new,
+                    "speedup": t_old / t_new,
+                    "legacy_peak_bytes": m_old,
+                    "stream_peak_bytes": m_new,
+                    "identical_output": out_old == out_new,
+                })
+                print(
+                    f"n={n:>6}  {name:<30} {mb:7.2f} MiB  legacy {mb / t_old:7.1f} MiB/s {m_old / 2**20:7.1f} MiB  "
+                    f"stream {mb / t_new:7.1f} MiB/s {m_new / 2**20:7.1f} MiB  x{t_old / t_new:4.1f}  "
+                    f"identical={out_old == out_new}",
+                    file=sys.stderr,
+                )
+
+        a, b = tmp / "legacy_runs.jsonl", tmp / "stream_runs.jsonl"
+        t_old, _, out_old = measure(lambda: [append_legacy(a, run_line) for _ in range(args.appends)], a, args.repeat)
+        t_new, _, out_new = measure(lambda: [rw.append_jsonl(b, run_line) for _ in range(args.appends)], b, args.repeat)
+        results.append({
+            "file": "runs.jsonl",
+            "appends": args.appends,
+            "legacy_sec": t_old,
+            "stream_sec": t_new,
+            "speedup": t_old / t_new,
+            "identical_output": out_old == out_new,
+        })
+        print(
+            f"runs.jsonl x{args.appends}  legacy {t_old * 1e3:8.1f} ms  stream {t_new * 1e3:8.1f} ms  "
+            f"x{t_old / t_new:4.1f}  identical={out_old == out_new}",
+            file=sys.stderr,
+        )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(json.dumps({"benchmark": "json_writer", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+compute_points_and_baseline のベンチマーク（列指向版 vs 旧 DataFrame 版）。
+
+  python tools/bench/bench_points.py [--sizes 500,5000,50000] [--repeat 3]
+
+- 合成した videos API items を入力に、実行時間と tracemalloc のピークメモリを比較する
+- 旧実装（DataFrame + .copy() + iterrows）はこのファイルに参照用として残してある
+- 両者の出力（points / baseline）が一致することも確認する
+"""
+import argparse, json, math, sys, time, tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import run_weekly as rw  # noqa: E402
+from synth import synth_videos  # noqa: E402
+
+
+def prime_shorts_cache(videos):
+    # ベンチ中に /shorts/ プローブ（ネットワーク）が走らないよう、判定をキャッシュに入れておく
+    rw._SHORTS_CACHE_LOADED = True
+    for v in videos:
+        rw._SHORTS_URL_CACHE[v["id"]] = [0, int(time.time())]
+
+
+def compute_points_and_baseline_legacy(videos, run_at):
+    import pandas as pd
+
+    rows = []
+    for v in videos:
+        vid = v.get("id")
+        sn = v.get("snippet", {})
+        st = v.get("statistics", {})
+        cd = v.get("contentDetails", {})
+        if not vid:
+            continue
+        pub_s = sn.get("publishedAt")
+        if not pub_s:
+            continue
+        pub = datetime.fromisoformat(pub_s.replace("Z", "+00:00"))
+        t_days = max(float((run_at - pub).total_seconds() / (3600 * 24)), 1.0)
+        durationSec = rw.iso8601_duration_to_seconds(cd.get("duration", ""))
+        isShort = ((durationSec > 0 and durationSec <= 60) or rw.is_short_by_shorts_url(vid))
+        rows.append({
+            "video_id": vid, "title": sn.get("title", ""), "publishedAt": pub_s, "days": t_days,
+            "views": int(st.get("viewCount", 0) or 0), "likes": int(st.get("likeCount", 0) or 0),
+            "durationSec": int(durationSec), "isShort": bool(isShort),
+        })
+
+    df_all = pd.DataFrame(rows)
+    df_nat = df_all.copy()
+    df_nat["logv"] = np.log(np.clip(df_nat["views"].astype(float), 1.0, None))
+    df_fit = df_nat.copy()
+    df_fit = df_fit[df_fit["days"] >= float(rw.RECENT_DAYS_EXCLUDE)].copy()
+    vcut = np.percentile(df_fit["views"].astype(float), rw.NAT_BUZZ_TOP_PCT)
+    df_fit = df_fit[df_fit["views"].astype(float) <= float(vcut)].copy()
+    a_days, b_days = rw.fit_nat_baseline(
+        df_fit["days"].astype(float).to_numpy(), df_fit["logv"].astype(float).to_numpy(), rw.NAT_QUANTILE
+    )
+
+    t = df_nat["days"].astype(float).to_numpy()
+    ratio_nat = df_nat["views"].astype(float).to_numpy() / np.clip(np.exp(a_days + b_days * t), 1.0, None)
+    nat_level = np.array(["OK"] * len(df_nat), dtype=object)
+    nat_level[(ratio_nat >= rw.NAT_UPPER_RATIO) & (ratio_nat < rw.NAT_BIG_RATIO)] = "△"
+    nat_level[ratio_nat >= rw.NAT_BIG_RATIO] = "RED"
+
+    df_like_base = df_all[~df_all["isShort"]].copy()
+    df2 = df_like_base.copy()
+    df2 = df2[df2["likes"].astype(float) >= 1.0].copy()
+    df2 = df2[df2["views"].astype(float) >= float(rw.LIKES_GOOD_VIEWS_MIN)].copy()
+    vcut2 = np.percentile(df2["views"].astype(float), rw.LIKES_MID_VIEWS_PCT)
+    df2 = df2[df2["views"].astype(float) <= float(vcut2)].copy()
+    logL = np.log(df2["likes"].astype(float).to_numpy())
+    logV = np.log(np.clip(df2["views"].astype(float).to_numpy(), 1.0, None))
+    b1, b0 = np.linalg.lstsq(np.vstack([logL, np.ones_like(logL)]).T, logV, rcond=None)[0]
+
+    likes_all = np.clip(df_all["likes"].astype(float).to_numpy(), 1.0, None)
+    ratio_like_all = df_all["views"].astype(float).to_numpy() / np.clip(np.exp(b0 + b1 * np.log(likes_all)), 1.0, None)
+    mask = ~df_all["isShort"].to_numpy(dtype=bool)
+    ratio_like = np.full(len(df_all), np.nan)
+    ratio_like[mask] = ratio_like_all[mask]
+    like_level = np.array(["OK"] * len(df_all), dtype=object)
+    like_level[(ratio_like >= rw.LIKES_SUSPECT_RATIO) & (ratio_like < rw.LIKES_BIG_RATIO)] = "△"
+    like_level[ratio_like >= rw.LIKES_BIG_RATIO] = "RED"
+    like_level[~mask] = "NA"
+
+    points = []
+    for i, r in df_all.reset_index(drop=True).iterrows():
+        rl = ratio_like[i]
+        p = {
+            "video_id": r["video_id"], "title": r["title"], "publishedAt": r["publishedAt"],
+            "days": float(r["days"]), "views": int(r["views"]), "likes": int(r["likes"]),
+            "ratio_nat": float(ratio_nat[i]), "ratio_like": float(rl) if np.isfinite(rl) else None,
+            "nat_level": str(nat_level[i]), "like_level": str(like_level[i]),
+            "durationSec": int(r["durationSec"]), "isShort": bool(r["isShort"]),
+        }
+        if p["nat_level"] == "RED" or p["like_level"] == "RED":
+            p["display_label"] = "RED"
+        elif p["nat_level"] == "△" or p["like_level"] == "△":
+            p["display_label"] = "△"
+        else:
+            p["display_label"] = "OK"
+        p["anomaly_ratio"] = p["ratio_nat"] if p["ratio_like"] is None else float(max(p["ratio_nat"], p["ratio_like"]))
+        points.append(p)
+    return points, {"a_days": a_days, "b_days": b_days, "b0": float(b0), "b1": float(b1)}
+
+
+def measure(fn, videos, run_at, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(videos, run_at)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    out = fn(videos, run_at)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark compute_points_and_baseline (columnar vs legacy DataFrame)")
+    ap.add_argument("--sizes", default="500,5000,50000")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    run_at = datetime(2026, 1, 11, tzinfo=timezone.utc)
+    results = []
+    for n in [int(x) for x in args.sizes.split(",") if x]:
+        videos = synth_videos(n, run_at)
+        prime_shorts_cache(videos)
+
+        t_new, m_new, (p_new, b_new) = measure(rw.compute_points_and_baseline, videos, run_at, args.repeat)
+        t_old, m_old, (p_old, b_old) = measure(compute_points_and_baseline_legacy, videos, run_at, args.repeat)
+
+        same = json.dumps(p_new, allow_nan=True) == json.dumps(p_old, allow_nan=True) and all(
+            b_new[k] == b_old[k] for k in ("a_days", "b_days", "b0", "b1")
+        )
+        results.append({
+            "n": n,
+            "legacy_sec": t_old,
+            "columnar_sec": t_new,
+            "speedup": t_old / t_new if t_new else None,
+            "legacy_peak_bytes": m_old,
+            "columnar_peak_bytes": m_new,
+            "peak_ratio": m_old / m_new if m_new else None,
+            "identical_output": same,
+        })
+        print(
+            f"n={n:>6}  legacy {t_old * 1e3:9.1f} ms {m_old / 2**20:8.1f} MiB  "
+            f"columnar {t_new * 1e3:9.1f} ms {m_new / 2**20:8.1f} MiB  "
+            f"x{t_old / t_new:5.1f}  identical={same}",
+            file=sys.stderr,
+        )
+
+    print(json.dumps({"benchmark": "compute_points_and_baseline", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+run_weekly.py のベンチマークスイート（結果は JSON で出す。実行ごとに比較できるように）。
+
+  python tools/bench/bench_suite.py [--only compute,state,json,sync,main] [--out bench.json]
+      [--sizes 50,500,5000,50000,100000] [--channels 8] [--videos 500]
+      [--latency_ms 20] [--error_rate 0.02] [--concurrency 4]
+
+- compute : compute_points_and_baseline（合成 videos、サイズ別）
+- state   : update_state_and_red（state.json が無い初回 / sticky が溜まった2回目）
+- json    : latest_points.json の書き出し（初回 / 内容が同じで書かない2回目）
+- sync    : data/ → site/data/ の sync_tree（空の site への初回 / 変更なしの2回目）
+- main    : ローカルの API スタンドイン（fake_api.py）に向けて run_weekly.py を別プロセスで実行
+            1回目は全件取得、2回目は再生数を伸ばして --incremental
+- ondemand: 同じスタンドインで、watchlist 外の1チャンネルを --channel で頼んでからサイトにデータが出るまで
+            （watchlist ごと回し直す従来の経路と --ondemand）
+"""
+import argparse, json, math, os, platform, shutil, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+import run_weekly as rw  # noqa: E402
+from fake_api import FakeYouTube  # noqa: E402
+from synth import bump_stats, channel_id, synth_channel, synth_shorts, synth_videos  # noqa: E402
+
+RUN_AT = datetime(2026, 1, 11, tzinfo=timezone.utc)
+
+
+def best_of(fn, repeat, setup=None):
+    best = math.inf
+    out = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def prime_shorts(videos, shorts):
+    # プローブ（ネットワーク）を走らせないよう、判定を全部キャッシュに入れておく
+    rw._SHORTS_CACHE_LOADED = True
+    now = int(time.time())
+    for v in videos:
+        rw._SHORTS_URL_CACHE[v["id"]] = [1 if v["id"] in shorts else 0, now]
+
+
+def synth_points(n, seed=0):
+    videos = synth_videos(n, RUN_AT, seed)
+    prime_shorts(videos, synth_shorts(videos, seed))
+    return videos, rw.compute_points_and_baseline(videos, RUN_AT)[0]
+
+
+# ============================
+# 個別ベンチ
+# ============================
+def bench_compute(args, tmp):
+    out = []
+    for n in args.sizes:
+        videos = synth_videos(n, RUN_AT)
+        prime_shorts(videos, synth_shorts(videos))
+        sec, (points, _) = best_of(lambda: rw.compute_points_and_baseline(videos, RUN_AT), args.repeat)
+        out.append({"n": n, "sec": sec, "videos_per_sec": n / sec, "points": len(points)})
+        log(f"compute  n={n:>7}  {sec * 1e3:9.1f} ms")
+    return out
+
+
+def bench_state(args, tmp):
+    out = []
+    for n in args.sizes:
+        _, points = synth_points(n)
+        path = tmp / f"state_{n}.json"
+        cold, _ = best_of(lambda: rw.update_state_and_red(points, path), args.repeat, setup=lambda: path.unlink(missing_ok=True))
+        warm, st = best_of(lambda: rw.update_state_and_red(points, path), args.repeat)
+        out.append({"n": n, "cold_sec": cold, "warm_sec": warm, "sticky_red": len(st.get("sticky_red", []))})
+        log(f"state    n={n:>7}  cold {cold * 1e3:8.1f} ms  warm {warm * 1e3:8.1f} ms")
+    return out
+
+
+def bench_json(args, tmp):
+    out = []
+    for n in args.sizes:
+        _, points = synth_points(n)
+        obj = {"run_at_utc": RUN_AT.isoformat(), "generator_version": rw.GENERATOR_VERSION, "points": points}
+        path = tmp / f"latest_points_{n}.json"
+        cold, _ = best_of(lambda: rw.write_json_if_changed(path, obj), args.repeat, setup=lambda: path.unlink(missing_ok=True))
+        same, _ = best_of(lambda: rw.write_json_if_changed(path, obj), args.repeat)
+        size = path.stat().st_size
+        out.append({"n": n, "bytes": size, "cold_sec": cold, "unchanged_sec": same, "mib_per_sec": size / 2**20 / cold})
+        log(f"json     n={n:>7}  {size / 2**20:7.2f} MiB  cold {cold * 1e3:8.1f} ms  unchanged {same * 1e3:8.1f} ms")
+    return out
+
+
+def bench_sync(args, tmp):
+    src, dst = tmp / "sync_src", tmp / "sync_dst"
+    for i in range(args.channels):
+        _, points = synth_points(args.videos, seed=i)
+        ch_dir = src / "channels" / channel_id(i)
+        rw.write_json_if_changed(ch_dir / "latest_points.json", {"run_at_utc": RUN_AT.isoformat(), "points": points})
+        rw.write_points_columnar(ch_dir, points, RUN_AT.isoformat(), with_gzip=True)
+        rw.update_state_and_red(points, ch_dir / "state.json")
+    total = sum(p.stat().st_size for p in src.rglob("*") if p.is_file())
+
+    cold, rep_cold = best_of(lambda: rw.sync_tree(src, dst), args.repeat, setup=lambda: shutil.rmtree(dst, ignore_errors=True))
+    warm, rep_warm = best_of(lambda: rw.sync_tree(src, dst), args.repeat)
+    log(f"sync     {args.channels} ch  {total / 2**20:7.2f} MiB  cold {cold * 1e3:8.1f} ms  warm {warm * 1e3:8.1f} ms")
+    return {"channels": args.channels, "bytes": total, "cold_sec": cold, "warm_sec": warm, "cold": rep_cold, "warm": rep_warm}
+
+
+def run_main(base, fake, extra_args):
+    env = {**os.environ, **fake.env(), "YT_MONITOR_BASE_DIR": str(base)}
+    cmd = [sys.executable, str(BENCH_DIR.parent / "run_weekly.py"), *extra_args]
+    before = dict(fake.stats)
+    t0 = time.perf_counter()
+    r = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    sec = time.perf_counter() - t0
+    if r.returncode != 0:
+        raise RuntimeError(f"run_weekly.py failed ({r.returncode}):\n{r.stderr[-2000:]}")
+    idx = json.loads((base / "data" / "index.json").read_text(encoding="utf-8"))
+    return {
+        "sec": sec,
+        "channels_ok": len(idx.get("channels", [])),
+        "warnings": len(idx.get("warnings", [])),
+        "requests": {k: v - before.get(k, 0) for k, v in fake.stats.items() if v - before.get(k, 0)},
+    }
+
+
+def bench_main(args, tmp):
+    channels = [synth_channel(i, args.videos, RUN_AT) for i in range(args.channels)]
+    fake = FakeYouTube(channels, latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2, error_rate=args.error_rate)
+    fake.start()
+    base = tmp / "main"
+    try:
+        data = base / "data"
+        data.mkdir(parents=True, exist_ok=True)
+        # 先頭チャンネルだけハンドルで登録（forHandle の解決も通す）
+        keys = ["@" + channels[0]["handle"]] + [ch["channel"]["id"] for ch in channels[1:]]
+        (data / "watchlist.txt").write_text("\n".join(keys) + "\n", encoding="utf-8")
+
+        common = ["--concurrency", str(args.concurrency)]
+        cold = run_main(base, fake, common)
+        log(f"main     cold  {args.channels} ch x {args.videos}  {cold['sec']:7.2f} s  {cold['requests']}")
+
+        for i, ch in enumerate(channels):
+            bump_stats(ch, i)
+        fake.reindex()
+        warm = run_main(base, fake, common + ["--incremental"])
+        log(f"main     incr  {args.channels} ch x {args.videos}  {warm['sec']:7.2f} s  {warm['requests']}")
+    finally:
+        fake.stop()
+    return {
+        "channels": args.channels,
+        "videos_per_channel": args.videos,
+        "latency_ms": args.latency_ms,
+        "error_rate": args.error_rate,
+        "concurrency": args.concurrency,
+        "cold": cold,
+        "incremental": warm,
+    }
+
+
+def forget_shorts(path, videos):
+    cache = json.loads(path.read_text(encoding="utf-8"))
+    for v in videos:
+        cache.pop(v["id"], None)
+    path.write_text(json.dumps(cache, sort_keys=True, separators=(",", ":")) + "\n", encoding="utf-8")
+
+
+def bench_ondemand(args, tmp):
+    # 週次実行の後、watchlist に無いチャンネルを --channel で頼んだときにサイトにチャートが出るまでの時間
+    # （--ondemand / 従来の watchlist ごとの再実行）。どちらもそのチャンネルのデータと Shorts 判定が無い状態から測る
+    channels = [synth_channel(i, args.videos, RUN_AT) for i in range(args.channels + 1)]
+    fake = FakeYouTube(channels, latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2, error_rate=args.error_rate)
+    fake.start()
+    base = tmp / "ondemand"
+    target = channels[-1]["channel"]["id"]
+    try:
+        data = base / "data"
+        data.mkdir(parents=True, exist_ok=True)
+        (data / "watchlist.txt").write_text("\n".join(ch["channel"]["id"] for ch in channels[:-1]) + "\n", encoding="utf-8")
+
+        common = ["--concurrency", str(args.concurrency)]
+        run_main(base, fake, common)
+
+        out = {}
+        for mode, extra in (("ondemand", ["--ondemand"]), ("watchlist", [])):
+            for d in (data / "channels" / target, base / "site" / "data" / "channels" / target):
+                shutil.rmtree(d, ignore_errors=True)
+            forget_shorts(data / "shorts_cache.json", channels[-1]["videos"])
+            r = run_main(base, fake, common + ["--channel", target] + extra)
+            r["chart_ready"] = (base / "site" / "data" / "channels" / target / "latest_points.json").exists()
+            out[mode] = r
+            log(f"ondemand {mode:<9} {args.channels}+1 ch x {args.videos}  {r['sec']:7.2f} s  {r['requests']}")
+    finally:
+        fake.stop()
+    return {
+        "channels": args.channels,
+        "videos_per_channel": args.videos,
+        "latency_ms": args.latency_ms,
+        "concurrency": args.concurrency,
+        **out,
+        "speedup": out["watchlist"]["sec"] / out["ondemand"]["sec"],
+    }
+
+
+BENCHES = {
+    "compute": bench_compute,
+    "state": bench_state,
+    "json": bench_json,
+    "sync": bench_sync,
+    "main": bench_main,
+    "ondemand": bench_ondemand,
+}
+
+
+def log(msg):
+    print(msg, file=sys.stderr, flush=True)
+
+
+def git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark suite for tools/run_weekly.py (JSON output)")
+    ap.add_argument("--only", default=",".join(BENCHES), help="Comma-separated subset of: " + ",".join(BENCHES))
+    ap.add_argument("--sizes", default="50,500,5000,50000,100000", help="Videos per channel for compute/state/json.")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--channels", type=int, default=8, help="Channels for sync/main/ondemand.")
+    ap.add_argument("--videos", type=int, default=500, help="Videos per channel for sync/main/ondemand.")
+    ap.add_argument("--latency_ms", type=float, default=20.0, help="Stand-in API latency per request.")
+    ap.add_argument("--error_rate", type=float, default=0.02, help="Share of stand-in requests answered with 503/403.")
+    ap.add_argument("--concurrency", type=int, default=4, help="--concurrency passed to run_weekly.py.")
+    ap.add_argument("--out", default="", help="Write the JSON here instead of stdout.")
+    args = ap.parse_args()
+    args.sizes = [int(x) for x in args.sizes.split(",") if x]
+
+    only = [x.strip() for x in args.only.split(",") if x.strip()]
+    unknown = [x for x in only if x not in BENCHES]
+    if unknown:
+        raise SystemExit(f"unknown benchmark(s): {unknown}")
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_suite_"))
+    results = {}
+    try:
+        for name in only:
+            results[name] = BENCHES[name](args, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "benchmark": "run_weekly_suite",
+        "generator_version": rw.GENERATOR_VERSION,
+        "git_rev": git_rev(),
+        "measured_at_utc": datetime.now(timezone.utc).isoformat(),
+        "env": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+YouTube Data API v3 / /shorts/ のローカルスタンドイン（ベンチマーク用）。
+
+  python tools/bench/fake_api.py --channels 5 --videos 500 --port 8765 [--latency_ms 30] [--error_rate 0.02]
+
+  → YT_API_BASE=http://127.0.0.1:8765/youtube/v3 YT_SHORTS_BASE=http://127.0.0.1:8765 YT_API_KEY=bench で
+    run_weekly.py をこのサーバに向けられる
+
+- /youtube/v3/channels      : id= / forHandle=
+- /youtube/v3/playlistItems : playlistId= / maxResults= / pageToken=（50件ずつ）
+- /youtube/v3/videos        : id=（カンマ区切り最大50）/ part=（statistics だけなら snippet 等を省く）
+- /shorts/<id>              : ショートは 200、それ以外は 303 で /watch?v=<id> へ
+- latency_ms（±jitter）の遅延と、error_rate の確率で 503 / 403 rateLimitExceeded を返す
+- fields= は無視して全部返す（run_weekly.py 側は余分なキーがあっても困らない）
+- 200 には本文のハッシュで ETag をつけ、If-None-Match が一致すれば 304 を返す
+"""
+import argparse, hashlib, json, random, sys, threading, time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synth import synth_channel  # noqa: E402
+
+PAGE_SIZE = 50
+
+
+class FakeYouTube:
+    def __init__(self, channels, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        self.channels = {ch["channel"]["id"]: ch for ch in channels}
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.error_rate = float(error_rate)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {}
+        self._index()
+        self._server = None
+        self._thread = None
+
+    def _index(self):
+        self.by_handle = {ch["handle"].lower(): ch for ch in self.channels.values()}
+        self.by_uploads = {ch["uploads"]: ch for ch in self.channels.values()}
+        self.videos = {}
+        self.shorts = set()
+        for ch in self.channels.values():
+            for v in ch["videos"]:
+                self.videos[v["id"]] = v
+            self.shorts |= ch["shorts"]
+
+    def reindex(self):
+        # bump_stats などで channels を書き換えた後に呼ぶ
+        with self._lock:
+            self._index()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def _roll(self):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            fail = self._rng.random() < self.error_rate
+            kind = self._rng.choice(("503", "403")) if fail else None
+        return delay, kind
+
+    # ---- エンドポイント ----
+    def api(self, endpoint, q):
+        if endpoint == "channels":
+            if "forHandle" in q:
+                self._count("forHandle")  # channels の内数（ハンドル解決だけ）
+                ch = self.by_handle.get(q["forHandle"].lstrip("@").lower())
+                return {"items": [{"id": ch["channel"]["id"]}] if ch else []}
+            ch = self.channels.get(q.get("id", ""))
+            return {"items": [ch["channel"]] if ch else []}
+
+        if endpoint == "playlistItems":
+            ch = self.by_uploads.get(q.get("playlistId", ""))
+            if not ch:
+                return None
+            start = int(q.get("pageToken") or 0)
+            n = min(PAGE_SIZE, int(q.get("maxResults") or 5))
+            items = ch["playlist_items"][start:start + n]
+            out = {"items": items}
+            if start + n < len(ch["playlist_items"]):
+                out["nextPageToken"] = str(start + n)
+            return out
+
+        if endpoint == "videos":
+            ids = [x for x in (q.get("id") or "").split(",") if x][:PAGE_SIZE]
+            parts = set((q.get("part") or "").split(","))
+            items = []
+            for vid in ids:
+                v = self.videos.get(vid)
+                if not v:
+                    continue
+                items.append({"id": vid, **{k: v[k] for k in ("snippet", "statistics", "contentDetails") if k in parts}})
+            return {"items": items}
+
+        return None
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a):
+                pass
+
+            def _send(self, code, body=b"", headers=None):
+                self.send_response(code)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD" and body:
+                    self.wfile.write(body)
+                fake._count("bytes_out", len(body))
+
+            def _json(self, code, obj):
+                body = json.dumps(obj).encode("utf-8")
+                if code != 200:
+                    return self._send(code, body, {"Content-Type": "application/json"})
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    fake._count("not_modified")
+                    return self._send(304, b"", {"ETag": etag})
+                self._send(code, body, {"Content-Type": "application/json", "ETag": etag})
+
+            def _handle(self):
+                u = urlparse(self.path)
+                q = {k: v[-1] for k, v in parse_qs(u.query).items()}
+                delay, fail = fake._roll()
+                if delay:
+                    time.sleep(delay)
+
+                if u.path.startswith("/shorts/"):
+                    fake._count("shorts")
+                    vid = u.path[len("/shorts/"):]
+                    if fail == "503":
+                        fake._count("errors")
+                        return self._send(503)
+                    if vid in fake.shorts:
+                        return self._send(200, b"<html></html>", {"Content-Type": "text/html"})
+                    return self._send(303, b"", {"Location": f"/watch?v={vid}"})
+
+                if not u.path.startswith("/youtube/v3/"):
+                    return self._send(404)
+                endpoint = u.path.rsplit("/", 1)[-1]
+                fake._count(endpoint)
+                if not q.get("key"):
+                    return self._json(400, {"error": {"code": 400, "errors": [{"reason": "keyInvalid"}]}})
+                if fail:
+                    fake._count("errors")
+                    if fail == "403":
+                        return self._json(403, {"error": {"code": 403, "errors": [{"reason": "rateLimitExceeded"}]}})
+                    return self._json(503, {"error": {"code": 503, "errors": [{"reason": "backendError"}]}})
+                js = fake.api(endpoint, q)
+                if js is None:
+                    return self._json(404, {"error": {"code": 404, "errors": [{"reason": "notFound"}]}})
+                return self._json(200, js)
+
+            do_GET = _handle
+            do_HEAD = _handle
+
+        return Handler
+
+    # ---- 起動/停止 ----
+    def start(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), self.handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        # run_weekly.py をこのサーバに向ける環境変数
+        return {
+            "YT_API_BASE": f"{self.base_url}/youtube/v3",
+            "YT_SHORTS_BASE": self.base_url,
+            "YT_API_KEY": "bench",
+        }
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stand-in for the YouTube Data API and /shorts/ (benchmarks)")
+    ap.add_argument("--channels", type=int, default=5)
+    ap.add_argument("--videos", type=int, default=500, help="Videos per channel.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency_ms", type=float, default=0.0)
+    ap.add_argument("--jitter_ms", type=float, default=0.0)
+    ap.add_argument("--error_rate", type=float, default=0.0)
+    args = ap.parse_args()
+
+    run_at = datetime.now(timezone.utc)
+    fake = FakeYouTube(
+        [synth_channel(i, args.videos, run_at) for i in range(args.channels)],
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+    ).start(args.host, args.port)
+    for k, v in fake.env().items():
+        print(f"{k}={v}")
+    print("channels:", " ".join(fake.channels))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+ベンチマーク用の合成データ（videos / playlistItems / channels の API レスポンス相当）。
+
+- 再生数は投稿日数に緩く比例する対数正規、高評価は再生数に比例＋ノイズ
+- 2割ほどがショート（うち一部は 61 秒以上で /shorts/ プローブでしか分からないもの）
+- 数 % に再生数の水増し（高評価が伴わない）を入れて、RED/△ がそれなりに出るようにする
+- 動画IDは本物と同じ 11 文字（HistoryStore が S11 で持つため）
+"""
+import numpy as np
+from datetime import timedelta
+
+
+def video_id(seed, i):
+    return f"v{seed:03d}{i:07d}"
+
+
+def channel_id(seed):
+    return f"UCbench{seed:017d}"
+
+
+def synth_videos(n, run_at, seed=0, boost_pct=3.0):
+    rng = np.random.default_rng(seed)
+    days = rng.uniform(0.5, 3000.0, n)
+    views = np.exp(rng.normal(8.0, 1.6, n) + 0.0003 * days)
+    likes = np.maximum(0, views * np.exp(rng.normal(-3.8, 0.5, n)))
+    boost = rng.random(n) < boost_pct / 100.0
+    views = np.where(boost, views * rng.uniform(4.0, 40.0, n), views).astype(np.int64)
+    likes = likes.astype(np.int64)
+    dur = np.where(rng.random(n) < 0.2, rng.integers(10, 60, n), rng.integers(61, 3600, n))
+    out = []
+    for i in range(n):
+        pub = run_at - timedelta(days=float(days[i]))
+        out.append({
+            "id": video_id(seed, i),
+            "snippet": {"publishedAt": pub.strftime("%Y-%m-%dT%H:%M:%SZ"), "title": f"video {i}"},
+            "statistics": {"viewCount": str(int(views[i])), "likeCount": str(int(likes[i]))},
+            "contentDetails": {"duration": f"PT{int(dur[i]) // 60}M{int(dur[i]) % 60}S"},
+        })
+    # uploads プレイリストと同じく新しい順
+    out.sort(key=lambda v: v["snippet"]["publishedAt"], reverse=True)
+    return out
+
+
+def synth_shorts(videos, seed=0, long_short_pct=50.0):
+    # 60 秒以下は全部ショート、61〜180 秒も long_short_pct % はショート（プローブでしか判定できない）
+    rng = np.random.default_rng(seed + 1)
+    out = set()
+    for v in videos:
+        d = v["contentDetails"]["duration"]
+        m, s = d[2:-1].split("M")
+        sec = int(m) * 60 + int(s)
+        if sec <= 60 or (sec <= 180 and rng.random() < long_short_pct / 100.0):
+            out.add(v["id"])
+    return out
+
+
+def synth_channel(seed, n_videos, run_at, title=None):
+    cid = channel_id(seed)
+    uploads = "UU" + cid[2:]
+    videos = synth_videos(n_videos, run_at, seed)
+    return {
+        "channel": {
+            "id": cid,
+            "snippet": {
+                "title": title or f"bench channel {seed}",
+                "customUrl": f"@bench{seed}",
+                "publishedAt": (run_at - timedelta(days=3200)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+            "contentDetails": {"relatedPlaylists": {"uploads": uploads}},
+        },
+        "handle": f"bench{seed}",
+        "uploads": uploads,
+        "playlist_items": [
+            {"contentDetails": {"videoId": v["id"], "videoPublishedAt": v["snippet"]["publishedAt"]}}
+            for v in videos
+        ],
+        "videos": videos,
+        "shorts": synth_shorts(videos, seed),
+    }
+
+
+def bump_stats(ch, seed, growth=0.02):
+    # 次の週の実行を模して、全動画の再生数/高評価を少し伸ばす
+    rng = np.random.default_rng(seed + 2)
+    for v in ch["videos"]:
+        st = v["statistics"]
+        g = 1.0 + rng.exponential(growth)
+        st["viewCount"] = str(int(int(st["viewCount"]) * g) + 1)
+        st["likeCount"] = str(int(int(st["likeCount"]) * (1.0 + (g - 1.0) * 0.8)))
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+data/channels/* の points を横断して引くローカルのクエリサーバ（標準ライブラリ＋NumPy のみ、外部サービス不要）。
+
+  python tools/query_server.py [--data_dir data] [--host 127.0.0.1] [--port 8765] [--poll_sec 2] [--cache_size 256]
+
+  GET /points?label=RED&min_anomaly=3&max_days=30&short=0&channel=UC...,UC...&sort=-anomaly_ratio&limit=50&offset=0
+  GET /channels?sort=-max_anomaly_ratio&limit=100
+  GET /health
+
+- 起動時に全チャンネルの列指向 points（latest_points.cols.<hash>.json ＋全履歴モードの points_part.*、
+  無ければ latest_points.json）と state.json の sticky_red を読み、全チャンネル連結の列（NumPy 配列）にする
+- poll_sec ごとにチャンネルのディレクトリの mtime を見て、変わったチャンネルだけ読み直す
+  （run_weekly.py の書き出しは tmp + rename なので、中のファイルが変わればディレクトリの mtime も変わる）
+- 並び順（sort キーごとの置換）は世代ごとに1回だけ作り、クエリはマスクを当てて切り出すだけ
+- 応答は (世代, クエリ) の LRU にキャッシュし、本文のハッシュを ETag にする（If-None-Match なら 304）
+"""
+import argparse, hashlib, json, math, sys, threading, time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import run_weekly as rw  # noqa: E402
+
+LABEL_CODES = {"OK": rw.LEVEL_OK, "△": rw.LEVEL_WARN, "WARN": rw.LEVEL_WARN, "RED": rw.LEVEL_RED}
+LABEL_NAMES = {rw.LEVEL_OK: "OK", rw.LEVEL_WARN: "△", rw.LEVEL_RED: "RED"}
+POINT_SORT_KEYS = ("anomaly_ratio", "ratio_nat", "ratio_like", "views", "likes", "days")
+CHANNEL_SORT_KEYS = ("max_anomaly_ratio", "red", "sticky_red", "points")
+MAX_LIMIT = 1000
+COLUMN_DTYPES = {
+    "video_id": object, "title": object, "publishedAt": object, "days": float, "views": np.int64, "likes": np.int64,
+    "anomaly_ratio": float, "ratio_nat": float, "ratio_like": float, "label": np.int8, "isShort": bool, "sticky": bool,
+}
+
+
+# ============================
+# 読み込み（1チャンネル分）
+# ============================
+def _cols_from_file(path: Path):
+    # 列指向ファイル（points-cols-v1）をそのまま列にする（辞書符号化の列は名前に戻さずコードのまま使う）
+    js = json.loads(path.read_text(encoding="utf-8"))
+    cols, dicts = js.get("columns", {}), js.get("dicts", {})
+    n = int(js.get("count") or 0)
+    labels = dicts.get("display_label", [])
+    codes = np.asarray([LABEL_CODES.get(x, rw.LEVEL_OK) for x in labels] or [rw.LEVEL_OK], dtype=np.int8)
+    return n, {
+        "video_id": cols.get("video_id", [""] * n),
+        "title": cols.get("title", [""] * n),
+        "publishedAt": cols.get("publishedAt", [""] * n),
+        "days": cols.get("days", [math.nan] * n),
+        "views": cols.get("views", [0] * n),
+        "likes": cols.get("likes", [0] * n),
+        "anomaly_ratio": cols.get("anomaly_ratio", [math.nan] * n),
+        "ratio_nat": cols.get("ratio_nat", [math.nan] * n),
+        "ratio_like": cols.get("ratio_like", [math.nan] * n),
+        "label": codes[np.asarray(cols.get("display_label", [0] * n), dtype=np.int64)] if n else np.empty(0, np.int8),
+        "isShort": cols.get("isShort", [0] * n),
+    }
+
+
+def _cols_from_points(points):
+    return len(points), {
+        "video_id": [p.get("video_id", "") for p in points],
+        "title": [p.get("title", "") for p in points],
+        "publishedAt": [p.get("publishedAt", "") for p in points],
+        "days": [p.get("days") for p in points],
+        "views": [p.get("views") or 0 for p in points],
+        "likes": [p.get("likes") or 0 for p in points],
+        "anomaly_ratio": [p.get("anomaly_ratio") for p in points],
+        "ratio_nat": [p.get("ratio_nat") for p in points],
+        "ratio_like": [p.get("ratio_like") for p in points],
+        "label": np.asarray([LABEL_CODES.get(p.get("display_label"), rw.LEVEL_OK) for p in points], dtype=np.int8),
+        "isShort": [bool(p.get("isShort")) for p in points],
+    }
+
+
+def _floats(xs):
+    return np.asarray([math.nan if x is None else x for x in xs], dtype=float)
+
+
+def load_channel(ch_dir: Path):
+    """
+    ★1チャンネル分の列を読む。読めなければ None。
+      points は列指向ファイル（＋全履歴モードの parts）を優先、無ければ latest_points.json。
+    """
+    try:
+        names = sorted(x.name for x in ch_dir.glob(rw.POINTS_COLS_PREFIX + "*.json"))
+        if names:
+            parts = [_cols_from_file(ch_dir / names[-1])]
+            parts += [_cols_from_file(p) for p in sorted(ch_dir.glob(rw.POINTS_PARTS_PREFIX + "*.json"))]
+        else:
+            points = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8")).get("points", [])
+            parts = [_cols_from_points(points)]
+    except (OSError, ValueError):
+        return None
+
+    try:
+        sticky = set(json.loads((ch_dir / "state.json").read_text(encoding="utf-8")).get("sticky_red", []))
+    except (OSError, ValueError):
+        sticky = set()
+    try:
+        title = json.loads((ch_dir / "channel.json").read_text(encoding="utf-8")).get("snippet", {}).get("title", "")
+    except (OSError, ValueError):
+        title = ""
+
+    def cat(key, conv):
+        return np.concatenate([conv(c[key]) for _, c in parts]) if parts else conv([])
+
+    vids = cat("video_id", lambda xs: np.asarray(xs, dtype=object))
+    return {
+        "title": title,
+        "cols": {
+            "video_id": vids,
+            "title": cat("title", lambda xs: np.asarray(xs, dtype=object)),
+            "publishedAt": cat("publishedAt", lambda xs: np.asarray(xs, dtype=object)),
+            "days": cat("days", _floats),
+            "views": cat("views", lambda xs: np.asarray(xs, dtype=np.int64)),
+            "likes": cat("likes", lambda xs: np.asarray(xs, dtype=np.int64)),
+            "anomaly_ratio": cat("anomaly_ratio", _floats),
+            "ratio_nat": cat("ratio_nat", _floats),
+            "ratio_like": cat("ratio_like", _floats),
+            "label": cat("label", lambda xs: np.asarray(xs, dtype=np.int8)),
+            "isShort": cat("isShort", lambda xs: np.asarray(xs, dtype=bool)),
+            "sticky": np.asarray([v in sticky for v in vids.tolist()], dtype=bool),
+        },
+    }
+
+
+# ============================
+# 全チャンネル連結のスナップショット（作ったら書き換えない）
+# ============================
+class Snapshot:
+    def __init__(self, generation, channels):
+        # channels: [(channel_id, load_channel の戻り値)]
+        self.generation = generation
+        self.channel_ids = [cid for cid, _ in channels]
+        self.channel_titles = [ch["title"] for _, ch in channels]
+        self.channel_pos = {cid: i for i, cid in enumerate(self.channel_ids)}
+        sizes = [len(ch["cols"]["video_id"]) for _, ch in channels]
+        self.size = int(sum(sizes))
+        self.ch = np.repeat(np.arange(len(channels), dtype=np.int32), sizes)
+        self.cols = {
+            k: np.concatenate([ch["cols"][k] for _, ch in channels]) if channels else np.empty(0, dtype=dt)
+            for k, dt in COLUMN_DTYPES.items()
+        }
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def order(self, key, desc):
+        # sort キーごとの行の並び（NaN は昇順でも降順でも末尾、同値は行番号順）。世代ごとに1回だけ作る
+        with self._lock:
+            if (key, desc) not in self._orders:
+                v = self.cols[key].astype(float)
+                v = np.where(np.isnan(v), -np.inf if desc else np.inf, v)
+                self._orders[(key, desc)] = np.argsort(-v if desc else v, kind="stable")
+            return self._orders[(key, desc)]
+
+    def channel_stats(self):
+        # チャンネルごとの points 数 / RED 数 / sticky 数 / 最大 anomaly_ratio（世代ごとに1回だけ作る）
+        with self._lock:
+            if "channels" not in self._orders:
+                n = len(self.channel_ids)
+                worst = np.full(n, -np.inf)
+                np.fmax.at(worst, self.ch, np.nan_to_num(self.cols["anomaly_ratio"], nan=-np.inf))
+                self._orders["channels"] = {
+                    "points": np.bincount(self.ch, minlength=n).astype(float),
+                    "red": np.bincount(self.ch, weights=(self.cols["label"] == rw.LEVEL_RED).astype(float), minlength=n),
+                    "sticky_red": np.bincount(self.ch, weights=self.cols["sticky"].astype(float), minlength=n),
+                    "max_anomaly_ratio": worst,
+                }
+            return self._orders["channels"]
+
+
+class PointsIndex:
+    """
+    ★data/channels/* を読み込んだスナップショットを持ち、変わったチャンネルだけ読み直して差し替える。
+      クエリ側は self.snapshot を1回取ってから使う（差し替えはアトミック）。
+    """
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self._channels = {}  # channel_id -> (dir mtime_ns, load_channel の戻り値)
+        self._generation = 0
+        self.snapshot = Snapshot(0, [])
+        self.loaded_at = None
+        self.last_reload = {}
+
+    def refresh(self):
+        t0 = time.perf_counter()
+        root = self.data_dir / "channels"
+        seen = {}
+        if root.exists():
+            for d in root.iterdir():
+                if d.is_dir():
+                    try:
+                        seen[d.name] = d.stat().st_mtime_ns
+                    except OSError:
+                        pass
+
+        changed = [cid for cid, mt in seen.items() if self._channels.get(cid, (None,))[0] != mt]
+        removed = [cid for cid in self._channels if cid not in seen]
+        if not changed and not removed:
+            return False
+
+        for cid in removed:
+            del self._channels[cid]
+        for cid in changed:
+            ch = load_channel(root / cid)
+            if ch is None:
+                self._channels.pop(cid, None)
+            else:
+                self._channels[cid] = (seen[cid], ch)
+
+        self._generation += 1
+        snap = Snapshot(self._generation, [(cid, self._channels[cid][1]) for cid in sorted(self._channels)])
+        snap.order("anomaly_ratio", True)  # 既定の並びとチャンネル集計は差し替え前に作っておく
+        snap.channel_stats()
+        self.snapshot = snap
+        self.loaded_at = time.time()
+        self.last_reload = {
+            "changed": len(changed),
+            "removed": len(removed),
+            "sec": round(time.perf_counter() - t0, 4),
+        }
+        return True
+
+    def watch(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.refresh():
+                        print(f"[reload] generation={self._generation} {self.last_reload}", flush=True)
+                except Exception as e:
+                    print(f"[reload] failed: {e}", flush=True)
+
+        threading.Thread(target=loop, name="points-watch", daemon=True).start()
+
+
+# ============================
+# クエリ
+# ============================
+def _param(q, key, conv=str, default=None):
+    v = q.get(key)
+    if not v or v[-1] == "":
+        return default
+    try:
+        return conv(v[-1])
+    except ValueError:
+        raise ValueError(f"bad {key}: {v[-1]!r}")
+
+
+def _sort_param(q, allowed, default):
+    s = _param(q, "sort", default=default)
+    key, desc = (s[1:], True) if s.startswith("-") else (s, False)
+    if key not in allowed:
+        raise ValueError(f"bad sort: {s!r} (one of {', '.join(allowed)}, prefix - for descending)")
+    return key, desc
+
+
+def _page(q):
+    limit = min(max(_param(q, "limit", int, 50), 0), MAX_LIMIT)
+    offset = max(_param(q, "offset", int, 0), 0)
+    return limit, offset
+
+
+def _json_num(x):
+    return x if math.isfinite(x) else None
+
+
+def query_points(snap: Snapshot, q):
+    mask = np.ones(snap.size, dtype=bool)
+
+    labels = _param(q, "label")
+    if labels:
+        codes = [LABEL_CODES[x] for x in labels.split(",") if x in LABEL_CODES]
+        if len(codes) != len([x for x in labels.split(",") if x]):
+            raise ValueError(f"bad label: {labels!r} (OK, WARN/△, RED)")
+        mask &= np.isin(snap.cols["label"], codes)
+    channels = _param(q, "channel")
+    if channels:
+        pos = [snap.channel_pos[c] for c in channels.split(",") if c in snap.channel_pos]
+        mask &= np.isin(snap.ch, pos)
+    for key, col, op in (
+        ("min_anomaly", "anomaly_ratio", np.greater_equal), ("max_anomaly", "anomaly_ratio", np.less_equal),
+        ("min_days", "days", np.greater_equal), ("max_days", "days", np.less_equal),
+        ("min_views", "views", np.greater_equal), ("max_views", "views", np.less_equal),
+    ):
+        v = _param(q, key, float)
+        if v is not None:
+            mask &= op(snap.cols[col], v)
+    short = _param(q, "short")
+    if short is not None:
+        mask &= snap.cols["isShort"] == (short in ("1", "true"))
+    sticky = _param(q, "sticky")
+    if sticky is not None:
+        mask &= snap.cols["sticky"] == (sticky in ("1", "true"))
+
+    key, desc = _sort_param(q, POINT_SORT_KEYS, "-anomaly_ratio")
+    limit, offset = _page(q)
+    order = snap.order(key, desc)
+    rows = order[mask[order]]
+    page = rows[offset:offset + limit]
+
+    c = snap.cols
+    items = [
+        {
+            "channel_id": snap.channel_ids[ch],
+            "channel_title": snap.channel_titles[ch],
+            "video_id": vid,
+            "title": title,
+            "publishedAt": pub,
+            "days": _json_num(d),
+            "views": v,
+            "likes": l,
+            "anomaly_ratio": _json_num(ar),
+            "ratio_nat": _json_num(rn),
+            "ratio_like": _json_num(rl),
+            "display_label": LABEL_NAMES.get(lab, "OK"),
+            "isShort": sh,
+            "sticky_red": st,
+        }
+        for ch, vid, title, pub, d, v, l, ar, rn, rl, lab, sh, st in zip(
+            snap.ch[page].tolist(), c["video_id"][page].tolist(), c["title"][page].tolist(),
+            c["publishedAt"][page].tolist(), c["days"][page].tolist(), c["views"][page].tolist(),
+            c["likes"][page].tolist(), c["anomaly_ratio"][page].tolist(), c["ratio_nat"][page].tolist(),
+            c["ratio_like"][page].tolist(), c["label"][page].tolist(), c["isShort"][page].tolist(),
+            c["sticky"][page].tolist(),
+        )
+    ] if len(page) else []
+    return {"generation": snap.generation, "total": int(len(rows)), "offset": offset, "limit": limit, "items": items}
+
+
+def query_channels(snap: Snapshot, q):
+    table = snap.channel_stats()
+    key, desc = _sort_param(q, CHANNEL_SORT_KEYS, "-max_anomaly_ratio")
+    limit, offset = _page(q)
+    order = np.argsort(-table[key] if desc else table[key], kind="stable")
+    page = order[offset:offset + limit].tolist()
+    items = [
+        {
+            "channel_id": snap.channel_ids[i],
+            "title": snap.channel_titles[i],
+            "points": int(table["points"][i]),
+            "red": int(table["red"][i]),
+            "sticky_red": int(table["sticky_red"][i]),
+            "max_anomaly_ratio": _json_num(float(table["max_anomaly_ratio"][i])),
+        }
+        for i in page
+    ]
+    return {"generation": snap.generation, "total": len(snap.channel_ids), "offset": offset, "limit": limit, "items": items}
+
+
+# ============================
+# HTTP
+# ============================
+class ResponseCache:
+    """(世代, パス, クエリ) -> (本文, ETag) の LRU"""
+
+    def __init__(self, size):
+        self.size = int(size)
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._d:
+                self._d.move_to_end(key)
+                self.hits += 1
+                return self._d[key]
+            self.misses += 1
+        body = build()
+        ent = (body, '"' + hashlib.sha256(body).hexdigest()[:20] + '"')
+        with self._lock:
+            self._d[key] = ent
+            while len(self._d) > self.size:
+                self._d.popitem(last=False)
+        return ent
+
+
+ROUTES = {"/points": query_points, "/channels": query_channels}
+
+
+def make_handler(index: PointsIndex, cache: ResponseCache):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "yt-points-query/1"
+
+        def log_message(self, fmt, *a):
+            pass
+
+        def _send(self, status, body=b"", etag=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "no-cache")
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            snap = index.snapshot
+            if url.path == "/health":
+                body = {
+                    "generation": snap.generation,
+                    "channels": len(snap.channel_ids),
+                    "points": snap.size,
+                    "loaded_at": index.loaded_at,
+                    "last_reload": index.last_reload,
+                    "cache": {"entries": len(cache._d), "hits": cache.hits, "misses": cache.misses},
+                }
+                return self._send(200, json.dumps(body).encode("utf-8"))
+            fn = ROUTES.get(url.path)
+            if fn is None:
+                return self._send(404, json.dumps({"error": f"unknown path {url.path}"}).encode("utf-8"))
+
+            q = parse_qs(url.query, keep_blank_values=True)
+            key = (snap.generation, url.path, tuple(sorted((k, tuple(v)) for k, v in q.items())))
+            try:
+                body, etag = cache.get(key, lambda: json.dumps(fn(snap, q), ensure_ascii=False).encode("utf-8"))
+            except (ValueError, KeyError) as e:
+                return self._send(400, json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8"))
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, etag=etag)
+            self._send(200, body, etag)
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local cross-channel query server over data/channels/* (no external services)")
+    ap.add_argument("--data_dir", default=str(rw.DATA_DIR), help="data/ directory with channels/.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--poll_sec", type=float, default=2.0, help="Seconds between change checks (0 = load once).")
+    ap.add_argument("--cache_size", type=int, default=256, help="LRU entries for query responses.")
+    args = ap.parse_args()
+
+    index = PointsIndex(Path(args.data_dir))
+    index.refresh()
+    snap = index.snapshot
+    print(f"loaded {len(snap.channel_ids)} channels, {snap.size} points in {index.last_reload.get('sec', 0):.2f}s", flush=True)
+    if args.poll_sec > 0:
+        index.watch(args.poll_sec)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(index, ResponseCache(args.cache_size)))
+    print(f"serving on http://{args.host}:{args.port}/ (points, channels, health)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
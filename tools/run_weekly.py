@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
-import os, json, time, math, argparse
-from datetime import datetime, timezone
+import os, re, json, time, math, gzip, zlib, random, filecmp, hashlib, argparse, tempfile, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
-import pandas as pd
-import statsmodels.formula.api as smf
 
 # ============================
 # Generator version (超重要)
@@ -18,23 +20,99 @@ GENERATOR_VERSION = "sanitize+probe+shortfix-20260106-01"
 # JSONサニタイズ（重要）
 # - json.dumps はデフォルトで NaN/Infinity を出力してしまい、ブラウザが JSON.parse できず壊れる
 # - NaN/Inf を None(null) に落とし、allow_nan=False で混入時に即エラーにする
+# - ★オブジェクトを丸ごとコピーせず、エンコード中に float だけその場で null 化する（ストリーミング）
+#   JSON_STRICT=True（--json_strict）のときは null 化せず、NaN/Inf を見つけた時点で ValueError
 # ============================
-def _json_sanitize(x):
-    if isinstance(x, float):
-        if math.isnan(x) or math.isinf(x):
-            return None
-        return x
-    if isinstance(x, dict):
-        return {k: _json_sanitize(v) for k, v in x.items()}
-    if isinstance(x, (list, tuple)):
-        return [_json_sanitize(v) for v in x]
-    return x
+JSON_STRICT = False
+
+# 出力プロファイル: (indent, item_separator, key_separator)
+# - pretty : 人が git diff で読むファイル（従来の indent=2 と同じバイト列）
+# - line   : runs.jsonl の1行（従来の dumps_jsonl と同じバイト列）
+# - compact: 機械しか読まないファイル（区切りの空白も無し）
+JSON_PROFILES = {
+    "pretty": ("  ", ",", ": "),
+    "line": (None, ", ", ": "),
+    "compact": (None, ",", ":"),
+}
+
+def _json_floatstr(o, _repr=float.__repr__, _inf=math.inf, _neginf=-math.inf):
+    if o != o or o == _inf or o == _neginf:
+        if JSON_STRICT:
+            raise ValueError("Out of range float values are not JSON compliant: " + repr(o))
+        return "null"
+    return _repr(o)
+
+def _json_default(o):
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+def _iter_json_py(obj, profile):
+    # 標準 json の純 Python エンコーダ（indent 付き dumps が内部で使うのと同じもの）に float の扱いだけ差し替えて使う
+    indent, item_sep, key_sep = JSON_PROFILES[profile]
+    return json.encoder._make_iterencode(
+        {}, _json_default, json.encoder.encode_basestring, indent, _json_floatstr,
+        key_sep, item_sep, False, False, False,
+    )(obj, 0)
+
+def _iter_json_flat(obj, profile, enc, depth):
+    # インデント無し：上から depth 段だけ Python で開き、その下の要素は C エンコーダで1要素ずつ文字列にする。
+    # NaN/Inf を含む要素だけ純 Python 側でやり直す（ストリーミングの粒度は要素単位）
+    _, item_sep, key_sep = JSON_PROFILES[profile]
+    if depth > 0 and isinstance(obj, dict) and obj and all(isinstance(k, str) for k in obj):
+        yield "{"
+        first = True
+        for k, v in obj.items():
+            if not first:
+                yield item_sep
+            first = False
+            yield json.encoder.encode_basestring(k)
+            yield key_sep
+            yield from _iter_json_flat(v, profile, enc, depth - 1)
+        yield "}"
+    elif depth > 0 and isinstance(obj, (list, tuple)) and obj:
+        yield "["
+        first = True
+        for v in obj:
+            if not first:
+                yield item_sep
+            first = False
+            yield from _iter_json_flat(v, profile, enc, depth - 1)
+        yield "]"
+    else:
+        try:
+            yield enc.encode(obj)
+        except ValueError:
+            yield from _iter_json_py(obj, profile)
 
-def dumps_json(obj, *, indent=2):
-    return json.dumps(_json_sanitize(obj), ensure_ascii=False, indent=indent, allow_nan=False)
+def iter_json(obj, *, profile="pretty"):
+    """
+    ★obj を JSON の文字列チャンクとして順に返す（NaN/Inf はその場で null、strict なら ValueError）。
+      出力バイト列は従来の json.dumps(_json_sanitize(obj), ...) と同じ。
+    """
+    indent, item_sep, key_sep = JSON_PROFILES[profile]
+    if indent is not None:
+        return _iter_json_py(obj, profile)
+    enc = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(item_sep, key_sep))
+    return _iter_json_flat(obj, profile, enc, 2)
+
+def dumps_json(obj, *, indent=2, profile=None):
+    profile = profile or ("pretty" if indent else "line")
+    if JSON_PROFILES[profile][0] is None:
+        # インデント無しは C エンコーダで丸ごと。NaN/Inf が混じっていたときだけ要素単位でやり直す
+        _, item_sep, key_sep = JSON_PROFILES[profile]
+        try:
+            return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(item_sep, key_sep))
+        except ValueError:
+            pass
+    return "".join(iter_json(obj, profile=profile))
 
 def dumps_jsonl(obj):
-    return json.dumps(_json_sanitize(obj), ensure_ascii=False, allow_nan=False)
+    return dumps_json(obj, profile="line")
+
+def write_json(f, obj, *, profile="pretty"):
+    # テキストのファイルハンドルへチャンクごとに書く（巨大な中間文字列を作らない）
+    w = f.write
+    for chunk in iter_json(obj, profile=profile):
+        w(chunk)
 
 # ============================
 # make_plots.py のパラメータ（完全一致）
@@ -51,6 +129,13 @@ NAT_BUZZ_TOP_PCT = 95
 LIKES_GOOD_VIEWS_MIN = 100
 LIKES_MID_VIEWS_PCT = 80
 
+# ★NAT ベースラインの分位点回帰の実装
+# - "numpy": 下の quantreg_1d_batch（既定。statsmodels 不要）
+# - "statsmodels": 従来の smf.quantreg（遅延 import）
+# - "verify": 両方で解いて差が QUANTREG_VERIFY_TOL を超えたら警告（値は numpy 側を採用）
+QUANTREG_BACKEND = "numpy"
+QUANTREG_VERIFY_TOL = 1e-4
+
 # ============================
 # オンデマンド自動追加の追加条件（確定）
 # ============================
@@ -63,29 +148,511 @@ AUTO_WATCH_MIN_CHANNEL_AGE_DAYS = 180
 MAX_VIDEOS = 500
 RED_TRACK_MAX = 100
 
+# ★差分更新（--incremental）：この日数を超えたら全件取り直し（タイトル変更/削除/公開順の乱れを拾い直す）
+INCREMENTAL_FULL_REFRESH_DAYS = 28
+VIDEO_PARTS_FULL = "snippet,statistics,contentDetails"
+VIDEO_PARTS_STATS = "statistics"
+
+# ★partial response（fields=）：パイプラインが実際に読むフィールドだけを返させる
+CHANNEL_ID_FIELDS = "items(id)"
+CHANNEL_FIELDS = "items(id,snippet(title,customUrl,publishedAt),contentDetails(relatedPlaylists(uploads)))"
+PLAYLIST_ITEMS_FIELDS = "nextPageToken,items(contentDetails(videoId,videoPublishedAt))"
+VIDEO_FIELDS_FULL = "items(id,snippet(publishedAt,title),statistics(viewCount,likeCount),contentDetails(duration))"
+VIDEO_FIELDS_STATS = "items(id,statistics(viewCount,likeCount))"
+
+# ★並列実行/API制限（--concurrency / --qps / --quota_units で上書き）
+DEFAULT_CONCURRENCY = 1
+YT_API_QPS = 10.0
+YT_API_DAILY_QUOTA_UNITS = 10000
+# エンドポイントごとの消費ユニット（YouTube Data API v3 の list 系は 1）
+YT_QUOTA_COST = {
+    "channels": 1,
+    "playlistItems": 1,
+    "videos": 1,
+    "search": 100,
+}
+
+# ★API クライアント（接続プール/リトライ）
+YT_API_POOL_SIZE = 32
+YT_API_TIMEOUT_SEC = 30
+YT_API_MAX_RETRIES = 5
+YT_API_BACKOFF_BASE_SEC = 1.0
+YT_API_BACKOFF_MAX_SEC = 32.0
+YT_API_RETRY_STATUS = {429, 500, 502, 503, 504}
+# 403 でもレート制限系は待てば通る。quotaExceeded 系はその日はもう無理なので即打ち切り
+YT_API_RETRY_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+YT_API_QUOTA_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+
 # ★ショートは likes 側評価から除外
 EXCLUDE_SHORTS = True
 
 YT_API_KEY = os.environ.get("YT_API_KEY", "").strip()
 
-BASE_DIR = Path(__file__).resolve().parents[1]
+# ★接続先/出力先の上書き（ベンチマーク用のローカル API スタンドインに向けるときなど。本番では設定しない）
+YT_API_BASE = os.environ.get("YT_API_BASE", "https://www.googleapis.com/youtube/v3").rstrip("/")
+YT_SHORTS_BASE = os.environ.get("YT_SHORTS_BASE", "https://www.youtube.com").rstrip("/")
+
+BASE_DIR = Path(os.environ.get("YT_MONITOR_BASE_DIR") or Path(__file__).resolve().parents[1])
 DATA_DIR = BASE_DIR / "data"
 SITE_DATA_DIR = BASE_DIR / "site" / "data"
 WATCHLIST = DATA_DIR / "watchlist.txt"
 WATCHLIST_AUTO = DATA_DIR / "watchlist_auto.txt"
+SHORTS_CACHE = DATA_DIR / "shorts_cache.json"
+CHANNEL_META_CACHE = DATA_DIR / "channel_meta.json"
+
+# ★Shorts判定の永続キャッシュ/プローブ設定
+# - 判定が確定した動画（Short / 非Short）は二度とプローブしない
+# - 失敗（通信エラー/想定外のレスポンス）は SHORTS_PROBE_FAIL_TTL_SEC だけ覚えて再試行する
+SHORTS_PROBE_WORKERS = 8
+SHORTS_PROBE_QPS = 50.0
+SHORTS_PROBE_FAIL_TTL_SEC = 24 * 3600
+
+# ★ハンドル→チャンネルID / チャンネルのメタデータ（タイトル・uploads プレイリスト）の永続キャッシュ
+# - TTL 内は API を呼ばない。TTL を過ぎたら ETag で条件付きリクエスト（If-None-Match）し、304 ならそのまま使う
+# - ハンドルの付け替えはまれなので長め。チャンネルは週次実行なら毎回再検証される長さ（タイトル変更を拾う）
+CHANNEL_META_HANDLE_TTL_SEC = 30 * 86400
+CHANNEL_META_TTL_SEC = 6 * 86400
+
+# ★サイト配信用の列指向 points（内容ハッシュ付きファイル名）と manifest
+POINTS_COLS_FORMAT = "points-cols-v1"
+POINTS_COLS_PREFIX = "latest_points.cols."
+POINTS_COLS_HASH_LEN = 16
+POINTS_DICT_FIELDS = ("nat_level", "like_level", "display_label")
+MANIFEST = DATA_DIR / "manifest.json"
+
+# ★動画ごとの再生数/高評価の履歴（data/channels/<id>/history/, 列ごとの追記専用ファイル）
+HISTORY_DIRNAME = "history"
+HISTORY_MAX_RUNS = 26  # 週次で約半年
+HISTORY_COMPACT_SLACK = 4  # MAX_RUNS をこれだけ超えたらまとめて詰める
+
+# ★videos API の生レスポンス（--replay でネットワークなしに再解析するための入力）
+RAW_VIDEOS_NAME = "latest_videos.json.gz"
+
+# ★フィットのメモ化（data/channels/<id>/fit_memo.json。--refit で無視）
+# - マスク後のフィット入力＋パラメータ＋GENERATOR_VERSION の指紋が前回と同じなら係数をそのまま使う
+# - NAT は指紋が違っても、前回の解が通る2本（基底）の直線が今回のデータでも最適ならそれを使う（内点法を回さない）
+# - videos の入力（API レスポンス＋Shorts 判定）が前回とバイト単位で同じチャンネルは解析も書き出しも丸ごと飛ばす
+FIT_MEMO_NAME = "fit_memo.json"
+QUANTREG_VERTEX_TOL = 1e-9
+
+# ★全履歴モード（data/full_history.txt に書いたチャンネルだけ。書式は watchlist と同じで @handle か UC... で指定）
+# - MAX_VIDEOS で打ち切らず uploads を最大 FULL_HISTORY_MAX_VIDEOS 件まで見る（--full_history_max で変更）
+# - playlistItems のページ → videos → 列のチャンク（FULL_HISTORY_CHUNK 件）を生成器でつなぎ、チャンクは一時ディレクトリに逃がす
+# - フィットは全動画からの一様な無作為抽出（リザーバ、最大 FULL_HISTORY_FIT_SAMPLE 件、チャンネルごとに固定シード）に当てる
+#   動画数が抽出数以下なら全件フィットと同じ
+# - latest_points.json / 列指向ファイルは新しい MAX_VIDEOS 件＋それより古い RED/sticky だけ（履歴・伸び・state もこの集合）
+#   残りは FULL_HISTORY_PART_POINTS 件ずつ内容ハッシュ付きの points_part.NNNN.<hash>.json に分け、manifest の parts に並べる
+# - 生レスポンスは残さない（--replay の対象外。index は前回の行を引き継ぐ）
+FULL_HISTORY = DATA_DIR / "full_history.txt"
+FULL_HISTORY_MAX_VIDEOS = 20000
+FULL_HISTORY_CHUNK = 500
+FULL_HISTORY_FIT_SAMPLE = 5000
+FULL_HISTORY_PART_POINTS = 2000
+POINTS_PARTS_PREFIX = "points_part."
+
+# ★サイト用の描画データ（compute_points_and_baseline が points と同じパスで作る）
+# - baseline["curves"]：両モードの expected 曲線の標本（upper はブラウザが NAT_UPPER_RATIO×UPPER_MULT 倍して引く）
+#   範囲は表示対象（ショート除外・views>0）の days / likes を 2^(1/PLOT_CURVE_SNAP) 刻みに丸める（毎回少しずつ伸びて latest.json が変わらないように）
+# - points_lod.<hash>.json：表示対象が PLOT_LOD_MAX_POINTS 件を超えるチャンネルだけ書く間引き版（manifest の lod）
+#   RED/△（とブラウザが上限線超えで色を付けるもの）は全件。OK は (days, log views, log likes) の格子ごとに
+#   件数比例（最低1件）の確率で video_id のハッシュから決定的に選ぶ → 密度を保ったまま PLOT_LOD_TARGET 件前後
+PLOT_CURVE_DAYS_SAMPLES = 128
+PLOT_CURVE_LIKES_SAMPLES = 32
+PLOT_CURVE_SNAP = 8
+PLOT_LOD_MAX_POINTS = 600
+PLOT_LOD_TARGET = 300
+PLOT_LOD_DAYS_BINS = 16
+PLOT_LOD_LOG_STEP = 0.5
+POINTS_LOD_PREFIX = "points_lod."
+
+# ★優先度つきスケジューラ（--scheduled）。data/schedule.json にチャンネルごとの最終実行/コスト/ティアを持つ
+# - ティアごとの更新間隔（日）。上から順に条件に当たったもの
+#   hot : sticky_red_count >= 3 または max_anomaly_ratio >= NAT_BIG_RATIO
+#   warm: sticky_red_count >= 1 または max_anomaly_ratio >= NAT_UPPER_RATIO または週 SCHEDULE_BUSY_UPLOADS_PER_WEEK 本以上投稿
+#   cool: 週1本以上投稿
+#   cold: それ以外
+# - 1日の予算（ユニット）を超えない範囲で、期限切れの度合いが大きい順に選ぶ
+SCHEDULE_FILE = DATA_DIR / "schedule.json"
+SCHEDULE_TIERS = {"hot": 1, "warm": 7, "cool": 14, "cold": 30}
+SCHEDULE_BUSY_UPLOADS_PER_WEEK = 7
+SCHEDULE_UPLOAD_WINDOW_DAYS = 28
+SCHEDULE_DAILY_BUDGET_UNITS = 8000  # 残りは --red_only / オンデマンド用
+SCHEDULE_FAIL_RETRY_DAYS = 1
+
+# ★オンデマンドのキュー（--enqueue が1リクエスト1ファイルで積み、--drain_queue がまとめて処理して消す）と
+#   リクエストごとの状態（サイトがポーリングする。ONDEMAND_STATUS_KEEP_DAYS より古いものは落とす）
+ONDEMAND_QUEUE_DIR = DATA_DIR / "ondemand_queue"
+ONDEMAND_STATUS = DATA_DIR / "ondemand_status.json"
+ONDEMAND_STATUS_KEEP_DAYS = 7
+ONDEMAND_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# ★--shard i/N の部分結果（index の断片と Shorts キャッシュ）。--merge が読んで消す
+SHARDS_DIRNAME = "shards"
+
+# ★実行ジャーナル（data/run_journal.jsonl）：週次実行が途中で落ちても --resume で残りだけやり直す
+# - 1行目がヘッダ（run_id / run_at_utc）、以降はチャンネルごとに済んだ段階を1行ずつ追記する
+#   fetched  … videos を取り終えて raw_videos に保存した（--resume は保存分から解析だけやり直す）
+#   analyzed … points/state まで書いた（--resume はディスクから index の行を作る）
+#   written  … index の行まで出来た（--resume は行をそのまま使う。API は呼ばない）
+#   failed は記録だけ（--resume は最後に済んだ段階から）
+# - 通常実行は毎回新しいジャーナルで始める。--resume は RUN_JOURNAL_WINDOW_HOURS 以内のジャーナルを引き継ぎ、
+#   run_at もその run のものを使う（古ければ新しい run として始める）
+# - Shorts キャッシュ / チャンネルのメタは最後にしか保存していなかったので、RUN_JOURNAL_CACHE_FLUSH_SEC ごとにも保存する
+RUN_JOURNAL = DATA_DIR / "run_journal.jsonl"
+RUN_JOURNAL_WINDOW_HOURS = 48
+RUN_JOURNAL_CACHE_FLUSH_SEC = 60
+RUN_JOURNAL_RESUMABLE = ("fetched", "analyzed", "written")
+
+# サイトには不要なファイル/ディレクトリ（sync_tree で site/data に出さない）
+SITE_SYNC_EXCLUDE = {
+    "shorts_cache.json", "channel_meta.json", "heartbeat.json", "metrics.jsonl", "schedule.json",
+    HISTORY_DIRNAME, RAW_VIDEOS_NAME, FIT_MEMO_NAME, SHARDS_DIRNAME, ONDEMAND_QUEUE_DIR.name, RUN_JOURNAL.name,
+}
 
 # ★長めショート判定のためのHTTPセッション/キャッシュ
-_SHORTS_URL_CACHE = {}  # video_id -> bool
+_SHORTS_URL_CACHE = {}  # video_id -> [verdict(1=Short,0=非Short,-1=失敗), probed_at(epoch秒)]
+_SHORTS_CACHE_LOADED = False
+_SHORTS_CACHE_LOCK = threading.Lock()
+_CHANNEL_META = {"handles": {}, "channels": {}}  # handle(小文字) -> {channel_id, etag, fetched_at} / channel_id -> {item, etag, fetched_at}
+_CHANNEL_META_LOADED = False
+_CHANNEL_META_LOCK = threading.Lock()
 _HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=YT_API_POOL_SIZE))
 _HTTP.headers.update({
     "User-Agent": "yt-anomaly-monitor/shorts-detector",
 })
 
 
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+class RateLimiter:
+    """
+    ★全スレッド共有のトークンバケット（QPS）＋日次クォータ（units）。
+      - acquire() はクォータを予約し、QPS を超える分はスリープで待たせる
+      - 予約済みユニットが daily_units を超える呼び出しは QuotaExceededError
+    """
+
+    def __init__(self, qps=YT_API_QPS, daily_units=YT_API_DAILY_QUOTA_UNITS, burst=None):
+        self.qps = float(qps)
+        self.burst = float(burst if burst is not None else max(1.0, self.qps))
+        self.daily_units = int(daily_units or 0)
+        self.used_units = 0
+        self._tokens = self.burst
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units=1):
+        with self._lock:
+            if self.daily_units and self.used_units + units > self.daily_units:
+                raise QuotaExceededError(
+                    f"daily quota exhausted ({self.used_units}+{units} > {self.daily_units} units)"
+                )
+            self.used_units += units
+
+            if self.qps <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._t) * self.qps)
+            self._t = now
+            self._tokens -= 1.0
+            wait = (-self._tokens / self.qps) if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+_LIMITER = RateLimiter()
+_SHORTS_LIMITER = RateLimiter(qps=SHORTS_PROBE_QPS, daily_units=0)
+_API = None  # YouTubeApiClient（初回 yt_get で作る。main() では --qps/--quota_units を反映して作り直す）
+
+# ★--replay 中は True。API も /shorts/ プローブも一切叩かない
+OFFLINE = False
+
+# ★ページ/バッチ単位の並列実行用（main() で --concurrency に応じて作る。None なら逐次）
+_IO_POOL = None
+
+_WATCHLIST_LOCK = threading.Lock()
+_CHANNEL_LOCKS = {}
+_CHANNEL_LOCKS_GUARD = threading.Lock()
+
+
+def channel_lock(channel_id):
+    # 同じ channel_id（@handle と UC... の重複など）を並列に書き込まないためのロック
+    with _CHANNEL_LOCKS_GUARD:
+        lk = _CHANNEL_LOCKS.get(channel_id)
+        if lk is None:
+            lk = _CHANNEL_LOCKS[channel_id] = threading.Lock()
+        return lk
+
+
+def pmap(fn, xs):
+    # 入力順を保ったまま map（_IO_POOL があれば並列）
+    if _IO_POOL is None:
+        return [fn(x) for x in xs]
+    return list(_IO_POOL.map(METRICS.scoped(fn), xs))
+
+
+# ============================
+# 計測（段階ごとの所要時間 / HTTP / クォータ / Shorts キャッシュ命中率）
+# - 全体とチャンネル別に集計する。チャンネルはスレッドローカルで持ち、ワーカーへは scoped() で引き継ぐ
+# - 段階の時間は入れ子の内側を差し引いた「その段階だけ」の時間（fit の中の shorts を二重に数えない）
+#   チャンネル並列のときの全体の値は各スレッドの時間の合計（wall_sec とは一致しない）
+# - 全体は data/heartbeat.json の metrics、チャンネル別は data/channels/<id>/metrics.jsonl に1行ずつ
+# ============================
+METRICS_JSONL_NAME = "metrics.jsonl"
+METRICS_LATENCY_PCTS = (50, 90, 99)
+
+_METRICS_TLS = threading.local()
+
+
+def _metrics_bucket():
+    return {
+        "stages": {},
+        "http": {},
+        "shorts": {"lookups": 0, "hits": 0, "probes": 0, "probe_failures": 0},
+    }
+
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.total = _metrics_bucket()
+        self.channels = {}
+
+    def _buckets(self):
+        key = getattr(_METRICS_TLS, "channel", None)
+        if key is None:
+            return (self.total,)
+        ch = self.channels.get(key)
+        if ch is None:
+            ch = self.channels[key] = _metrics_bucket()
+        return (self.total, ch)
+
+    @contextmanager
+    def channel(self, key):
+        prev = getattr(_METRICS_TLS, "channel", None)
+        _METRICS_TLS.channel = key
+        with self._lock:
+            self.channels.setdefault(key, _metrics_bucket())["started"] = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                ch = self.channels[key]
+                ch["wall_sec"] = time.perf_counter() - ch["started"]
+            _METRICS_TLS.channel = prev
+
+    @contextmanager
+    def stage(self, name):
+        stack = _METRICS_TLS.__dict__.setdefault("stack", [])
+        frame = [0.0]  # 内側の段階に使った時間
+        stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                for b in self._buckets():
+                    st = b["stages"].setdefault(name, {"sec": 0.0, "count": 0})
+                    st["sec"] += elapsed - frame[0]
+                    st["count"] += 1
+
+    def http(self, endpoint, sec, nbytes=0, ok=True, retry=False, units=0, not_modified=False):
+        with self._lock:
+            for b in self._buckets():
+                h = b["http"].setdefault(endpoint, {
+                    "requests": 0, "errors": 0, "retries": 0, "not_modified": 0, "bytes": 0, "units": 0, "latency_ms": [],
+                })
+                h["requests"] += 1
+                h["errors"] += 0 if ok else 1
+                h["retries"] += 1 if retry else 0
+                h["not_modified"] += 1 if not_modified else 0
+                h["bytes"] += int(nbytes)
+                h["units"] += int(units)
+                h["latency_ms"].append(sec * 1000.0)
+
+    def shorts(self, **counts):
+        with self._lock:
+            for b in self._buckets():
+                for k, n in counts.items():
+                    b["shorts"][k] += int(n)
+
+    def scoped(self, fn):
+        # 呼び出し元スレッドのチャンネルをワーカースレッドに引き継ぐ
+        key = getattr(_METRICS_TLS, "channel", None)
+
+        def run(*a, **kw):
+            prev = getattr(_METRICS_TLS, "channel", None)
+            _METRICS_TLS.channel = key
+            try:
+                return fn(*a, **kw)
+            finally:
+                _METRICS_TLS.channel = prev
+        return run
+
+    @staticmethod
+    def _summary(b):
+        http = {}
+        for ep, h in sorted(b["http"].items()):
+            lat = np.asarray(h["latency_ms"], dtype=float)
+            http[ep] = {k: v for k, v in h.items() if k != "latency_ms"}
+            for q in METRICS_LATENCY_PCTS:
+                http[ep][f"p{q}_ms"] = round(float(np.percentile(lat, q)), 1) if lat.size else None
+        sh = dict(b["shorts"])
+        sh["hit_rate"] = round(sh["hits"] / sh["lookups"], 4) if sh["lookups"] else None
+        return {
+            "stages": {k: {"sec": round(v["sec"], 4), "count": v["count"]} for k, v in b["stages"].items()},
+            "http": http,
+            "quota_units": sum(h["units"] for h in b["http"].values()),
+            "shorts_cache": sh,
+        }
+
+    def export(self):
+        with self._lock:
+            return {"wall_sec": round(time.perf_counter() - self.started, 3), **self._summary(self.total)}
+
+    def export_channel(self, key):
+        with self._lock:
+            ch = self.channels.get(key) or _metrics_bucket()
+            wall = ch.get("wall_sec", time.perf_counter() - ch.get("started", time.perf_counter()))
+            return {"wall_sec": round(wall, 3), **self._summary(ch)}
+
+
+METRICS = RunMetrics()
+
+
+def _retry_after_sec(r):
+    v = (r.headers.get("Retry-After") or "").strip()
+    if not v:
+        return None
+    if v.isdigit():
+        return float(v)
+    try:
+        return max(0.0, (parsedate_to_datetime(v) - now_utc()).total_seconds())
+    except Exception:
+        return None
+
+
+def _error_reason(r):
+    try:
+        errs = r.json().get("error", {}).get("errors", [])
+        return (errs[0].get("reason") or "") if errs else ""
+    except Exception:
+        return ""
+
+
+class YouTubeApiClient:
+    """
+    ★YouTube Data API の呼び出しをここに集約する。
+      - keep-alive の接続プールを全スレッドで共有（毎回 TLS を張り直さない）
+      - gzip を要求（Google API は User-Agent に "gzip" を含めないと圧縮しない）
+      - 429/5xx/レート制限系 403/通信エラーは指数バックオフ＋ジッタで再試行（Retry-After 優先）
+      - エンドポイント別にリクエスト数/リトライ数/クォータユニットを数える
+      - get_conditional は If-None-Match つき（304 でも 1 リクエストとしてユニットは数える）
+    """
+
+    def __init__(self, limiter, pool_size=YT_API_POOL_SIZE, max_retries=YT_API_MAX_RETRIES):
+        self.limiter = limiter
+        self.max_retries = int(max_retries)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=int(pool_size)))
+        self.session.headers.update({
+            "Accept-Encoding": "gzip",
+            "User-Agent": "yt-anomaly-monitor (gzip)",
+        })
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _count(self, endpoint, key, n=1):
+        with self._lock:
+            st = self.stats.setdefault(endpoint, {"requests": 0, "retries": 0, "units": 0})
+            st[key] += n
+
+    def _backoff(self, attempt, r=None):
+        wait = _retry_after_sec(r) if r is not None else None
+        if wait is None:
+            wait = random.uniform(0, min(YT_API_BACKOFF_MAX_SEC, YT_API_BACKOFF_BASE_SEC * (2 ** attempt)))
+        time.sleep(min(wait, YT_API_BACKOFF_MAX_SEC))
+
+    def get(self, url, params):
+        return self._request(url, params).json()
+
+    def get_conditional(self, url, params, etag=None):
+        # 戻り値: (JSON, ETag)。304 のときは (None, 渡した etag)
+        r = self._request(url, params, {"If-None-Match": etag} if etag else None)
+        if r.status_code == 304:
+            return None, etag
+        js = r.json()
+        return js, r.headers.get("ETag") or js.get("etag")
+
+    def _request(self, url, params, headers=None):
+        endpoint = url.rstrip("/").rsplit("/", 1)[-1]
+        units = YT_QUOTA_COST.get(endpoint, 1)
+
+        for attempt in range(self.max_retries + 1):
+            last = attempt >= self.max_retries
+            # 失敗したリクエストもクォータを消費するので試行ごとに数える
+            self.limiter.acquire(units)
+            self._count(endpoint, "requests")
+            self._count(endpoint, "units", units)
+            if attempt:
+                self._count(endpoint, "retries")
+
+            t0 = time.perf_counter()
+            try:
+                r = self.session.get(url, params=params, headers=headers, timeout=YT_API_TIMEOUT_SEC)
+            except (requests.ConnectionError, requests.Timeout):
+                METRICS.http(endpoint, time.perf_counter() - t0, ok=False, retry=bool(attempt), units=units)
+                if last:
+                    raise
+                self._backoff(attempt)
+                continue
+            METRICS.http(
+                endpoint, time.perf_counter() - t0, len(r.content),
+                ok=r.status_code in (200, 304), retry=bool(attempt), units=units, not_modified=r.status_code == 304,
+            )
+
+            if r.status_code == 403:
+                reason = _error_reason(r)
+                if reason in YT_API_QUOTA_REASONS:
+                    raise QuotaExceededError(f"YouTube API quota exceeded ({reason})")
+                if reason in YT_API_RETRY_REASONS and not last:
+                    self._backoff(attempt, r)
+                    continue
+            elif r.status_code in YT_API_RETRY_STATUS and not last:
+                self._backoff(attempt, r)
+                continue
+
+            r.raise_for_status()
+            return r
+
+    def units_used(self):
+        with self._lock:
+            return {ep: st["units"] for ep, st in sorted(self.stats.items())}
+
+
+def _api_client(url):
+    global _API
+    if OFFLINE:
+        raise RuntimeError(f"network access in offline mode: {url}")
+    if _API is None:
+        _API = YouTubeApiClient(_LIMITER)
+    return _API
+
+
 def yt_get(url, params):
-    r = requests.get(url, params=params, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return _api_client(url).get(url, params)
+
+
+def yt_get_conditional(url, params, etag=None):
+    return _api_client(url).get_conditional(url, params, etag)
 
 
 def iso8601_duration_to_seconds(s):
@@ -111,31 +678,200 @@ def iso8601_duration_to_seconds(s):
     return total
 
 
+def load_shorts_cache():
+    global _SHORTS_CACHE_LOADED
+    with _SHORTS_CACHE_LOCK:
+        if _SHORTS_CACHE_LOADED:
+            return
+        _SHORTS_CACHE_LOADED = True
+        if not SHORTS_CACHE.exists():
+            return
+        try:
+            raw = json.loads(SHORTS_CACHE.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        for vid, ent in raw.items():
+            if isinstance(ent, list) and len(ent) == 2 and vid not in _SHORTS_URL_CACHE:
+                _SHORTS_URL_CACHE[vid] = [int(ent[0]), int(ent[1])]
+
+
+def save_shorts_cache(path=None):
+    # 期限切れの失敗エントリは捨てる。キーはソートして git diff を安定させる
+    # 先にファイルを取り込むので、判定を一度も引かなかった run（--red_only など）でも中身は消えない
+    path = path or SHORTS_CACHE
+    load_shorts_cache()
+    now = time.time()
+    with _SHORTS_CACHE_LOCK:
+        keep = {
+            vid: ent for vid, ent in _SHORTS_URL_CACHE.items()
+            if ent[0] >= 0 or now - ent[1] < SHORTS_PROBE_FAIL_TTL_SEC
+        }
+    ensure_dir(path.parent)
+    write_text_if_changed(path, json.dumps(keep, sort_keys=True, separators=(",", ":")) + "\n")
+
+
+def merge_shorts_cache(path: Path):
+    # 別プロセス（--shard）のキャッシュを取り込む。確定した判定を失敗より優先し、同格なら新しい方
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    load_shorts_cache()
+    with _SHORTS_CACHE_LOCK:
+        for vid, ent in raw.items():
+            if not (isinstance(ent, list) and len(ent) == 2):
+                continue
+            new = [int(ent[0]), int(ent[1])]
+            cur = _SHORTS_URL_CACHE.get(vid)
+            if cur is None or (cur[0] < 0 <= new[0]) or ((cur[0] < 0) == (new[0] < 0) and new[1] > cur[1]):
+                _SHORTS_URL_CACHE[vid] = new
+
+
+def _shorts_cached(vid):
+    ent = _SHORTS_URL_CACHE.get(vid)
+    if ent is None:
+        return None
+    if ent[0] < 0 and time.time() - ent[1] >= SHORTS_PROBE_FAIL_TTL_SEC:
+        return None
+    return ent
+
+
+def _probe_shorts_url(vid):
+    """
+    /shorts/<id> をリダイレクト追従なしで叩き、Location だけで判定する（本文はダウンロードしない）。
+      - 200: Shorts のまま表示される → Short
+      - 3xx で Location が /watch → 非Short
+      - それ以外（同意画面へのリダイレクト、4xx/5xx、通信エラー）→ 失敗(-1)
+    """
+    url = f"{YT_SHORTS_BASE}/shorts/{vid}"
+    _SHORTS_LIMITER.acquire()
+    t0 = time.perf_counter()
+    try:
+        r = _HTTP.head(url, allow_redirects=False, timeout=10)
+        if r.status_code == 405:
+            r = _HTTP.get(url, allow_redirects=False, timeout=10, stream=True)
+            r.close()
+    except Exception:
+        METRICS.http("shorts", time.perf_counter() - t0, ok=False)
+        return -1
+    METRICS.http("shorts", time.perf_counter() - t0, ok=r.status_code < 400)
+
+    if r.status_code == 200:
+        return 1
+    if 300 <= r.status_code < 400:
+        loc = r.headers.get("Location", "") or ""
+        if f"/shorts/{vid}" in loc:
+            return 1
+        if "/watch" in loc:
+            return 0
+    return -1
+
+
 def is_short_by_shorts_url(video_id: str) -> bool:
     """
     ★YouTube Data APIには「Shortsかどうか」の確実なフラグがないため、
-      /shorts/<id> にアクセスした際の最終URLで判定する。
-      - Shortsの場合: 最終URLが .../shorts/<id> のまま
+      /shorts/<id> にアクセスした際のリダイレクト先で判定する。
+      - Shortsの場合: リダイレクトされず .../shorts/<id> のまま
       - 非Shortsの場合: .../watch?v=<id> にリダイレクトされることが多い
+    判定結果は SHORTS_CACHE に永続化する（失敗時は False 扱いだが TTL 後に再プローブ）。
     """
     vid = (video_id or "").strip()
     if not vid:
         return False
-    if vid in _SHORTS_URL_CACHE:
-        return _SHORTS_URL_CACHE[vid]
+    load_shorts_cache()
+    ent = _shorts_cached(vid)
+    if ent is not None:
+        return ent[0] == 1
+    if OFFLINE:
+        return False
 
-    url = f"https://www.youtube.com/shorts/{vid}"
-    ok = False
-    try:
-        r = _HTTP.get(url, allow_redirects=True, timeout=10)
-        final = (r.url or "")
-        ok = (f"/shorts/{vid}" in final)
-        time.sleep(0.05)
-    except Exception:
-        ok = False
+    verdict = _probe_shorts_url(vid)
+    # 書き込みはロックの中で（save_shorts_cache が別スレッドから同時に走査するので）
+    with _SHORTS_CACHE_LOCK:
+        _SHORTS_URL_CACHE[vid] = [verdict, int(time.time())]
+    return verdict == 1
+
+
+def prefetch_shorts(video_ids):
+    # 未判定の動画だけを SHORTS_PROBE_WORKERS 本のワーカーでまとめてプローブする
+    if OFFLINE:
+        return
+    load_shorts_cache()
+    ids = {v for v in video_ids if v}
+    todo = sorted(v for v in ids if _shorts_cached(v) is None)
+    METRICS.shorts(lookups=len(ids), hits=len(ids) - len(todo))
+    if not todo:
+        return
+    with METRICS.stage("shorts"):
+        with ThreadPoolExecutor(max_workers=SHORTS_PROBE_WORKERS, thread_name_prefix="yt-shorts") as ex:
+            list(ex.map(METRICS.scoped(is_short_by_shorts_url), todo))
+    failed = sum(1 for v in todo if (_shorts_cached(v) or [-1])[0] == -1)
+    METRICS.shorts(probes=len(todo), probe_failures=failed)
+
+
+def load_channel_meta():
+    global _CHANNEL_META_LOADED
+    with _CHANNEL_META_LOCK:
+        if _CHANNEL_META_LOADED:
+            return
+        _CHANNEL_META_LOADED = True
+        if not CHANNEL_META_CACHE.exists():
+            return
+        try:
+            raw = json.loads(CHANNEL_META_CACHE.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        for kind in ("handles", "channels"):
+            for k, ent in (raw.get(kind) or {}).items():
+                _CHANNEL_META[kind].setdefault(k, ent)
+
+
+def save_channel_meta(path=None):
+    # 読み込まずに終わった run（--red_only や取得前に失敗した --ondemand など）でもファイルの中身を消さないように、先に取り込む
+    path = path or CHANNEL_META_CACHE
+    load_channel_meta()
+    with _CHANNEL_META_LOCK:
+        obj = {kind: dict(_CHANNEL_META[kind]) for kind in ("handles", "channels")}
+    ensure_dir(path.parent)
+    write_text_if_changed(path, json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")) + "\n")
+
+
+def merge_channel_meta(path: Path):
+    # 別プロセス（--shard）のキャッシュを取り込む。fetched_at が新しい方
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    load_channel_meta()
+    with _CHANNEL_META_LOCK:
+        for kind in ("handles", "channels"):
+            for k, ent in (raw.get(kind) or {}).items():
+                cur = _CHANNEL_META[kind].get(k)
+                if cur is None or ent.get("fetched_at", 0) > cur.get("fetched_at", 0):
+                    _CHANNEL_META[kind][k] = ent
+
+
+def _channel_meta_get(kind, key, ttl_sec):
+    # 戻り値: (エントリ or None, TTL 内か)
+    load_channel_meta()
+    with _CHANNEL_META_LOCK:
+        ent = _CHANNEL_META[kind].get(key)
+    if ent is None:
+        return None, False
+    return ent, time.time() - ent.get("fetched_at", 0) < ttl_sec
+
+
+def _channel_meta_put(kind, key, ent):
+    with _CHANNEL_META_LOCK:
+        _CHANNEL_META[kind][key] = {**ent, "fetched_at": int(time.time())}
+
+
+def _handle_key(watch_key):
+    key = (watch_key or "").strip()
+    return (key[1:] if key.startswith("@") else key).lower()
 
-    _SHORTS_URL_CACHE[vid] = ok
-    return ok
+
+def cached_channel_id(watch_key):
+    # API を呼ばずに分かる範囲のチャンネルID（UC... か、TTL 内のハンドル）
+    key = (watch_key or "").strip()
+    if key.startswith("UC"):
+        return key
+    ent, fresh = _channel_meta_get("handles", _handle_key(key), CHANNEL_META_HANDLE_TTL_SEC)
+    return ent["channel_id"] if ent and fresh else None
 
 
 def resolve_channel_id(watch_key):
@@ -146,29 +882,82 @@ def resolve_channel_id(watch_key):
         return key
 
     handle = key[1:] if key.startswith("@") else key
-
-    url = "https://www.googleapis.com/youtube/v3/channels"
-    params = {"part": "id", "forHandle": handle, "key": YT_API_KEY}
-    js = yt_get(url, params)
-    items = js.get("items", [])
-    if not items:
-        raise RuntimeError(f"handle not found: {watch_key}")
-    return items[0].get("id")
+    hkey = _handle_key(key)
+    ent, fresh = _channel_meta_get("handles", hkey, CHANNEL_META_HANDLE_TTL_SEC)
+    if fresh:
+        return ent["channel_id"]
+
+    url = f"{YT_API_BASE}/channels"
+    params = {"part": "id", "forHandle": handle, "fields": CHANNEL_ID_FIELDS, "key": YT_API_KEY}
+    with METRICS.stage("resolve"):
+        js, etag = yt_get_conditional(url, params, (ent or {}).get("etag"))
+    if js is None:
+        cid = ent["channel_id"]
+    else:
+        items = js.get("items", [])
+        if not items:
+            with _CHANNEL_META_LOCK:
+                _CHANNEL_META["handles"].pop(hkey, None)
+            raise RuntimeError(f"handle not found: {watch_key}")
+        cid = items[0].get("id")
+    _channel_meta_put("handles", hkey, {"channel_id": cid, "etag": etag})
+    return cid
 
 
 def fetch_channel(channel_id):
-    url = "https://www.googleapis.com/youtube/v3/channels"
-    params = {"part": "snippet,contentDetails", "id": channel_id, "key": YT_API_KEY}
-    js = yt_get(url, params)
-    items = js.get("items", [])
-    if not items:
-        raise RuntimeError(f"channel not found: {channel_id}")
-    return items[0]
+    ent, fresh = _channel_meta_get("channels", channel_id, CHANNEL_META_TTL_SEC)
+    if fresh:
+        return ent["item"]
+
+    url = f"{YT_API_BASE}/channels"
+    params = {"part": "snippet,contentDetails", "id": channel_id, "fields": CHANNEL_FIELDS, "key": YT_API_KEY}
+    with METRICS.stage("fetch_channel"):
+        js, etag = yt_get_conditional(url, params, (ent or {}).get("etag"))
+    if js is None:
+        item = ent["item"]
+    else:
+        items = js.get("items", [])
+        if not items:
+            raise RuntimeError(f"channel not found: {channel_id}")
+        item = items[0]
+    _channel_meta_put("channels", channel_id, {"etag": etag, "item": item})
+    return item
 
 
-def fetch_latest_playlist_items(playlist_id, max_results=500):
-    url = "https://www.googleapis.com/youtube/v3/playlistItems"
-    out = {"items": []}
+def dedupe_watch_keys(watch_run, workers=1):
+    """
+    ★同じチャンネルに解決される watch_key（@handle と UC... の両方、--channel と watchlist の重複など）を
+      取得処理の前に1つにまとめる。先に出てきた方を残す（--channel は先頭なので必ず残る）。
+      解決に失敗したものはそのまま残し、本処理の方で警告にする。
+    戻り値: (残した watch_key の list, [(落とした watch_key, 残した watch_key), ...])
+    """
+    def resolve(w):
+        with METRICS.channel(w):
+            try:
+                return resolve_channel_id(w)
+            except Exception:
+                return None
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yt-resolve") as ex:
+            cids = list(ex.map(resolve, watch_run))
+    else:
+        cids = [resolve(w) for w in watch_run]
+
+    kept, dropped, first = [], [], {}
+    for w, cid in zip(watch_run, cids):
+        if cid is not None and cid in first:
+            dropped.append((w, first[cid]))
+            continue
+        if cid is not None:
+            first[cid] = w
+        kept.append(w)
+    return kept, dropped
+
+
+def iter_playlist_pages(playlist_id, max_results=500):
+    # 1ページ（最大50件）ずつ items を返す。呼び出し側が break すれば残りのページは取りにいかない
+    url = f"{YT_API_BASE}/playlistItems"
 
     page_token = None
     remain = int(max_results)
@@ -180,16 +969,22 @@ def fetch_latest_playlist_items(playlist_id, max_results=500):
             "playlistId": playlist_id,
             "maxResults": n,
             "pageToken": page_token or "",
+            "fields": PLAYLIST_ITEMS_FIELDS,
             "key": YT_API_KEY,
         }
-        js = yt_get(url, params)
-        out["items"].extend(js.get("items", []))
+        with METRICS.stage("playlist"):
+            js = yt_get(url, params)
+        yield js.get("items", [])
         page_token = js.get("nextPageToken")
         remain -= n
         if not page_token:
             break
-        time.sleep(0.05)
 
+
+def fetch_latest_playlist_items(playlist_id, max_results=500):
+    out = {"items": []}
+    for items in iter_playlist_pages(playlist_id, max_results):
+        out["items"].extend(items)
     return out
 
 
@@ -204,22 +999,112 @@ def chunked(xs, n):
         yield buf
 
 
-def fetch_videos(video_ids):
-    url = "https://www.googleapis.com/youtube/v3/videos"
-    videos = []
-    for ch in chunked(video_ids, 50):
+def fetch_videos(video_ids, part=VIDEO_PARTS_FULL, fields=VIDEO_FIELDS_FULL):
+    url = f"{YT_API_BASE}/videos"
+
+    def fetch_batch(ch):
         params = {
-            "part": "snippet,statistics,contentDetails",
+            "part": part,
             "id": ",".join(ch),
             "maxResults": 50,
+            "fields": fields,
             "key": YT_API_KEY,
         }
-        js = yt_get(url, params)
-        videos.extend(js.get("items", []))
-        time.sleep(0.05)
+        return yt_get(url, params).get("items", [])
+
+    # ★50件バッチは互いに独立なので並列に投げる（結果は入力順で連結）
+    videos = []
+    with METRICS.stage("videos"):
+        for items in pmap(fetch_batch, list(chunked(video_ids, 50))):
+            videos.extend(items)
     return videos
 
 
+def playlist_video_id(it):
+    return it.get("contentDetails", {}).get("videoId")
+
+
+def video_item_from_point(p, statistics):
+    # 前回の latest_points.json の1点から videos API の item 相当を組み立てる（snippet/contentDetails は不変扱い）
+    return {
+        "id": p["video_id"],
+        "snippet": {"publishedAt": p["publishedAt"], "title": p.get("title", "")},
+        "statistics": statistics,
+        "contentDetails": {"duration": f"PT{int(p['durationSec'])}S"},
+    }
+
+
+def load_previous_fetch(ch_dir: Path, run_at):
+    """
+    ★差分更新に使える前回の取得結果を返す（使えなければ None = 全件取得）。
+      - latest_500_playlistItems.json / latest_points.json が揃っている
+      - 全 point に durationSec がある（古い generator の出力は不可）
+      - 最後の全件取得から INCREMENTAL_FULL_REFRESH_DAYS 以内
+    """
+    try:
+        pli = json.loads((ch_dir / "latest_500_playlistItems.json").read_text(encoding="utf-8"))
+        pts = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8")).get("points", [])
+    except Exception:
+        return None
+
+    full_at = pli.get("full_fetch_at_utc")
+    if not full_at:
+        return None
+    age_days = (run_at - datetime.fromisoformat(full_at)).total_seconds() / (3600 * 24)
+    if age_days >= INCREMENTAL_FULL_REFRESH_DAYS:
+        return None
+
+    points = {}
+    for p in pts:
+        if not p.get("video_id") or p.get("durationSec") is None or not p.get("publishedAt"):
+            return None
+        points[p["video_id"]] = p
+    return pli, points
+
+
+def fetch_incremental(uploads, prev_pli, prev_points, max_results):
+    """
+    ★前回既知の video_id に当たった時点でページングを止め、
+      - 新着だけ snippet,statistics,contentDetails を取得
+      - 既知の動画は part=statistics + fields で再生数/高評価だけ更新
+    戻り値は全件取得時と同じ形の (pli, videos)。
+    """
+    prev_items = prev_pli.get("items", [])
+    known = {playlist_video_id(it) for it in prev_items}
+
+    new_items = []
+    hit = False
+    for items in iter_playlist_pages(uploads, max_results):
+        for it in items:
+            if playlist_video_id(it) in known:
+                hit = True
+                break
+            new_items.append(it)
+        if hit:
+            break
+
+    merged = (new_items + prev_items) if hit else new_items
+    merged = merged[: int(max_results)]
+    order = [vid for vid in (playlist_video_id(it) for it in merged) if vid]
+
+    full_ids = [vid for vid in order if vid not in prev_points]
+    stat_ids = [vid for vid in order if vid in prev_points]
+
+    by_id = {v.get("id"): v for v in fetch_videos(full_ids)}
+    for v in fetch_videos(stat_ids, part=VIDEO_PARTS_STATS, fields=VIDEO_FIELDS_STATS):
+        vid = v.get("id")
+        if vid in prev_points:
+            by_id[vid] = video_item_from_point(prev_points[vid], v.get("statistics", {}))
+
+    # 削除/非公開になった動画（videos に返ってこない）は playlist 側からも落とす
+    pli = {
+        "full_fetch_at_utc": prev_pli.get("full_fetch_at_utc"),
+        "items": [it for it in merged if playlist_video_id(it) in by_id],
+    }
+    videos = [by_id[vid] for vid in order if vid in by_id]
+    return pli, videos
+
+
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
@@ -228,16 +1113,148 @@ def now_utc():
     return datetime.now(timezone.utc)
 
 
-def copy_tree(src: Path, dst: Path):
+def atomic_write_bytes(path: Path, data: bytes):
+    # tmp に書いてから rename（読み手が書きかけの JSON を見ることがない）
+    ensure_dir(path.parent)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _same_json_ignoring(old: bytes, new: bytes, ignore_keys):
+    try:
+        a = json.loads(old)
+        b = json.loads(new)
+    except ValueError:
+        return False
+    if not (isinstance(a, dict) and isinstance(b, dict)):
+        return False
+    for k in ignore_keys:
+        a.pop(k, None)
+        b.pop(k, None)
+    return a == b
+
+
+def write_text_if_changed(path: Path, text: str, ignore_keys=()):
+    """
+    ★内容が変わっていなければ書かない（git diff とリポジトリの肥大を抑える）。
+      ignore_keys: JSON のトップレベルで比較から外すキー（run_at_utc だけ動いた latest.json など）
+    戻り値: 書いたら True
+    """
+    data = text.encode("utf-8")
+    if path.exists():
+        old = path.read_bytes()
+        if old == data:
+            return False
+        if ignore_keys and _same_json_ignoring(old, data, ignore_keys):
+            return False
+    atomic_write_bytes(path, data)
+    return True
+
+
+def write_json_if_changed(path: Path, obj, *, profile="pretty", ignore_keys=()):
+    """
+    ★write_text_if_changed の JSON 版。文字列を作らず tmp へストリーミングで書いてから比較する。
+      変わっていなければ tmp を捨てる。エンコードに失敗したら（strict の NaN など）既存ファイルはそのまま。
+    戻り値: 書いたら True
+    """
+    ensure_dir(path.parent)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("w", encoding="utf-8", newline="") as f:
+            write_json(f, obj, profile=profile)
+        if path.exists():
+            if path.stat().st_size == tmp.stat().st_size and filecmp.cmp(path, tmp, shallow=False):
+                tmp.unlink()
+                return False
+            if ignore_keys and _same_json_ignoring(path.read_bytes(), tmp.read_bytes(), ignore_keys):
+                tmp.unlink()
+                return False
+        os.replace(tmp, path)
+        return True
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def append_jsonl(path: Path, obj):
+    # ★1行をファイルへ直接ストリーミングで追記。途中で失敗したら書きかけの行を切り詰めて戻す
+    with path.open("a", encoding="utf-8", newline="") as f:
+        pos = f.tell()
+        try:
+            write_json(f, obj, profile="line")
+            f.write("\n")
+        except BaseException:
+            f.flush()
+            f.truncate(pos)
+            raise
+
+
+def _sync_skip(rel: Path):
+    return bool(SITE_SYNC_EXCLUDE.intersection(rel.parts)) or rel.name.endswith(".tmp")
+
+
+def _sync_file(path: Path, target: Path, report):
+    data = path.read_bytes()
+    if (
+        target.is_file()
+        and target.stat().st_size == len(data)
+        and hashlib.sha256(target.read_bytes()).digest() == hashlib.sha256(data).digest()
+    ):
+        report["skipped_files"] += 1
+        report["skipped_bytes"] += len(data)
+        return
+    atomic_write_bytes(target, data)
+    report["copied_files"] += 1
+    report["copied_bytes"] += len(data)
+
+
+def sync_tree(src: Path, dst: Path):
+    """
+    ★data/ → site/data/ の差分同期。
+      - 内容ハッシュが同じファイルは書かない
+      - 書くときは tmp + rename（公開中のサイトが書きかけのファイルを配信しない）
+      - src に無くなったファイル/空ディレクトリは dst から消す
+    戻り値: コピー/スキップしたファイル数とバイト数、削除数
+    """
+    report = {"copied_files": 0, "copied_bytes": 0, "skipped_files": 0, "skipped_bytes": 0, "removed_files": 0}
     ensure_dir(dst)
-    for path in src.rglob("*"):
+
+    seen = set()
+    for path in sorted(src.rglob("*")):
         rel = path.relative_to(src)
-        target = dst / rel
-        if path.is_dir():
-            ensure_dir(target)
-        else:
-            ensure_dir(target.parent)
-            target.write_bytes(path.read_bytes())
+        if _sync_skip(rel) or not path.is_file():
+            continue
+        seen.add(rel)
+        _sync_file(path, dst / rel, report)
+
+    for path in sorted(dst.rglob("*"), key=lambda p: len(p.parts), reverse=True):
+        rel = path.relative_to(dst)
+        if path.is_file() and rel not in seen:
+            path.unlink()
+            report["removed_files"] += 1
+        elif path.is_dir() and not any(path.iterdir()):
+            path.rmdir()
+
+    return report
+
+
+def sync_paths(src: Path, dst: Path, rels):
+    """
+    ★src 配下の rels（ファイルかディレクトリ）だけを dst に同期する（--ondemand 用。他のチャンネルには触らない）。
+      ディレクトリは sync_tree と同じ（中で消えたファイルは消す）。戻り値も sync_tree と同じ形。
+    """
+    report = {"copied_files": 0, "copied_bytes": 0, "skipped_files": 0, "skipped_bytes": 0, "removed_files": 0}
+    for rel in map(Path, rels):
+        if _sync_skip(rel):
+            continue
+        if (src / rel).is_dir():
+            for k, v in sync_tree(src / rel, dst / rel).items():
+                report[k] += v
+        elif (src / rel).is_file():
+            _sync_file(src / rel, dst / rel, report)
+    return report
 
 
 def read_watchlist():
@@ -248,184 +1265,459 @@ def read_watchlist():
     return [ln for ln in ls if ln and not ln.startswith("#")]
 
 
-def compute_points_and_baseline(videos, run_at):
-    rows = []
+def read_full_history():
+    # 全履歴モードのチャンネル（watch_key か channel_id の集合）。ファイルが無ければ空
+    if not FULL_HISTORY.exists():
+        return set()
+    ls = [ln.strip() for ln in FULL_HISTORY.read_text(encoding="utf-8").splitlines()]
+    return {ln for ln in ls if ln and not ln.startswith("#")}
+
+
+# ============================
+# 分位点回帰（説明変数1つ, NumPy のみ）
+# - min Σ rho_q(y - a - b*x) を LP として内点法（Frisch-Newton, Koenker の rq.fit.fnb）で解く
+# - 説明変数が1つなので正規方程式は 2x2。複数チャンネル分をパディング＋マスクで一括に解ける
+# ============================
+QUANTREG_MAX_IT = 50
+QUANTREG_GAP_TOL = 1e-9
+QUANTREG_STEP_BETA = 0.99995
+
+
+def _solve2(M, v):
+    # (B,2,2) x (B,2) の連立を一括で解く
+    det = M[:, 0, 0] * M[:, 1, 1] - M[:, 0, 1] * M[:, 1, 0]
+    det = np.where(np.abs(det) < 1e-300, 1e-300, det)
+    return np.stack([
+        (M[:, 1, 1] * v[:, 0] - M[:, 0, 1] * v[:, 1]) / det,
+        (M[:, 0, 0] * v[:, 1] - M[:, 1, 0] * v[:, 0]) / det,
+    ], axis=1)
+
+
+def _step_bound(x, dx, mask):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = np.where((dx < 0) & mask, -x / dx, 1e20)
+    return b.min(axis=1)
+
+
+def quantreg_1d_batch(xs, ys, q):
+    """
+    y ≈ a + b*x の q 分位点回帰を複数系列まとめて解く。
+    xs, ys: 長さの違う 1 次元配列のリスト。戻り値は (a, b) の配列（点が2未満の系列は NaN）。
+    """
+    B = len(xs)
+    ns = np.array([len(x) for x in xs], dtype=int)
+    a_out = np.full(B, np.nan)
+    b_out = np.full(B, np.nan)
+    ok = ns >= 2
+    if not ok.any():
+        return a_out, b_out
+
+    idx = np.flatnonzero(ok)
+    m = int(ns[idx].max())
+    X = np.zeros((len(idx), m))
+    Y = np.zeros((len(idx), m))
+    mask = np.zeros((len(idx), m), dtype=bool)
+    for k, j in enumerate(idx):
+        n = ns[j]
+        X[k, :n] = np.asarray(xs[j], dtype=float)
+        Y[k, :n] = np.asarray(ys[j], dtype=float)
+        mask[k, :n] = True
+    n_eff = mask.sum(axis=1).astype(float)
+    fm = mask.astype(float)
+
+    # x は中心化/スケーリングしてから解く（days は数千まで取るので条件数対策）
+    x_mu = (X * fm).sum(axis=1) / n_eff
+    x_sd = np.sqrt((((X - x_mu[:, None]) * fm) ** 2).sum(axis=1) / n_eff)
+    x_sd = np.where(x_sd > 0, x_sd, 1.0)
+    Z = ((X - x_mu[:, None]) / x_sd[:, None]) * fm
+
+    # LP: min c'x s.t. A x = rhs, 0 <= x <= 1（A = [1; z]^T, c = -y）
+    def A_dot(v):
+        return np.stack([(v * fm).sum(axis=1), (v * Z).sum(axis=1)], axis=1)
+
+    def AtY(dy):
+        return (dy[:, 0:1] * fm) + dy[:, 1:2] * Z
+
+    def AQAt(qv):
+        qv = qv * fm
+        M = np.empty((len(idx), 2, 2))
+        M[:, 0, 0] = qv.sum(axis=1)
+        M[:, 0, 1] = M[:, 1, 0] = (qv * Z).sum(axis=1)
+        M[:, 1, 1] = (qv * Z * Z).sum(axis=1)
+        return M
+
+    c = -Y
+    u = fm
+    x = (1.0 - q) * fm
+    rhs_b = A_dot(x)
+    s = u - x
+
+    # 初期双対：最小二乗
+    yd = _solve2(AQAt(fm), A_dot(c))
+    r = c - AtY(yd)
+    r = r + 0.001 * (r == 0)
+    z = np.where(r > 0, r, 0.0) * fm
+    w = (z - r) * fm
+
+    def gap_of():
+        return (c * x * fm).sum(axis=1) - (yd * rhs_b).sum(axis=1) + (w * u).sum(axis=1)
+
+    safe = np.where(mask, 1.0, 0.0)
+    gap = gap_of()
+    for _ in range(QUANTREG_MAX_IT):
+        active = gap > QUANTREG_GAP_TOL * np.maximum(1.0, np.abs((c * x * fm).sum(axis=1)))
+        if not active.any():
+            break
+        am = active[:, None].astype(float)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xi_ = np.where(mask, 1.0 / np.where(mask, x, 1.0), 0.0)
+            si_ = np.where(mask, 1.0 / np.where(mask, s, 1.0), 0.0)
+            qv = np.where(mask, 1.0 / (z * xi_ + w * si_ + (1 - safe)), 0.0)
+        r = (z - w) * fm
+
+        M = AQAt(qv)
+        dy = _solve2(M, A_dot(qv * r))
+        dx = qv * (AtY(dy) - r)
+        ds = -dx
+        dz = -z * (dx * xi_ + 1.0) * fm
+        dw = -w * (ds * si_ + 1.0) * fm
+
+        fp = np.minimum(np.minimum(_step_bound(x, dx, mask), _step_bound(s, ds, mask)) * QUANTREG_STEP_BETA, 1.0)
+        fd = np.minimum(np.minimum(_step_bound(w, dw, mask), _step_bound(z, dz, mask)) * QUANTREG_STEP_BETA, 1.0)
+
+        corr = np.minimum(fp, fd) < 1.0
+        if corr.any():
+            mu = (z * x + w * s).sum(axis=1)
+            g = ((z + fd[:, None] * dz) * (x + fp[:, None] * dx)
+                 + (w + fd[:, None] * dw) * (s + fp[:, None] * ds)).sum(axis=1)
+            mu = np.where(mu > 0, mu * (g / np.where(mu > 0, mu, 1.0)) ** 3 / (2.0 * n_eff), 0.0)
+
+            dxdz = dx * dz
+            dsdw = ds * dw
+            xi = mu[:, None] * (xi_ - si_)
+            dy2 = _solve2(M, A_dot(qv * (r + dxdz - dsdw - xi)))
+            dx2 = qv * (AtY(dy2) + xi - r - dxdz + dsdw)
+            ds2 = -dx2
+            dz2 = (mu[:, None] * xi_ - z - xi_ * z * dx2 - dxdz) * fm
+            dw2 = (mu[:, None] * si_ - w - si_ * w * ds2 - dsdw) * fm
+
+            fp2 = np.minimum(np.minimum(_step_bound(x, dx2, mask), _step_bound(s, ds2, mask)) * QUANTREG_STEP_BETA, 1.0)
+            fd2 = np.minimum(np.minimum(_step_bound(w, dw2, mask), _step_bound(z, dz2, mask)) * QUANTREG_STEP_BETA, 1.0)
+
+            cm = corr[:, None]
+            dx = np.where(cm, dx2, dx)
+            ds = np.where(cm, ds2, ds)
+            dz = np.where(cm, dz2, dz)
+            dw = np.where(cm, dw2, dw)
+            dy = np.where(cm, dy2, dy)
+            fp = np.where(corr, fp2, fp)
+            fd = np.where(corr, fd2, fd)
+
+        fp = fp * active
+        fd = fd * active
+        x = x + fp[:, None] * dx * am
+        s = s + fp[:, None] * ds * am
+        yd = yd + fd[:, None] * dy * am
+        w = w + fd[:, None] * dw * am
+        z = z + fd[:, None] * dz * am
+        gap = gap_of()
+
+    # 双対変数の符号を戻し、スケーリングを元に戻す
+    a_z = -yd[:, 0]
+    b_z = -yd[:, 1]
+    b_fit = b_z / x_sd
+    a_fit = a_z - b_fit * x_mu
+    a_out[idx] = a_fit
+    b_out[idx] = b_fit
+    return a_out, b_out
+
+
+def quantreg_1d(x, y, q):
+    a, b = quantreg_1d_batch([x], [y], q)
+    return float(a[0]), float(b[0])
+
+
+def quantreg_vertex(x, y, q, i, j, tol=QUANTREG_VERTEX_TOL):
+    """
+    ★(x[i], y[i]) と (x[j], y[j]) を通る直線が q 分位点回帰の最適解かを単体法の最適性条件で調べる（O(n)）。
+      片方を直線上に残してもう片方を離す4方向の方向微分がどれも非負なら最適。
+      最適なら (a, b)、そうでない/退化（3点以上が直線上）なら None。
+    """
+    if x[i] == x[j]:
+        return None
+    b = (y[j] - y[i]) / (x[j] - x[i])
+    a = y[i] - b * x[i]
+    r = y - a - b * x
+    on_line = np.abs(r) <= tol * max(1.0, float(np.abs(y).max()))
+    on_line[[i, j]] = True
+    if on_line.sum() > 2:
+        return None
+    psi = np.where(r > 0, q, q - 1.0)[~on_line]
+    for k, l in ((i, j), (j, i)):
+        for sgn in (1.0, -1.0):
+            d1 = sgn / (x[l] - x[k])
+            xd = (d1 * (x - x[k]))[~on_line]
+            deriv = -(psi * xd).sum() + ((1.0 - q) * sgn if sgn > 0 else -q * sgn)
+            if deriv < -tol * (1.0 + np.abs(xd).sum()):
+                return None
+    return float(a), float(b)
+
+
+def quantreg_basis(x, y, q, a, b):
+    # 内点法の解に一番近い2点（残差の絶対値が最小の2本）が最適な基底ならその添字、でなければ None
+    if len(x) < 2 or not (math.isfinite(a) and math.isfinite(b)):
+        return None
+    i, j = (int(k) for k in np.argsort(np.abs(y - a - b * x), kind="stable")[:2])
+    return (i, j) if quantreg_vertex(x, y, q, i, j) is not None else None
+
+
+def _quantreg_statsmodels(x, y, q):
+    # statsmodels は検証用のオプション（重いので必要なときだけ import）
+    try:
+        import pandas as pd
+        import statsmodels.formula.api as smf
+    except ImportError as e:
+        raise RuntimeError("QUANTREG_BACKEND=statsmodels/verify needs statsmodels (pip install pandas statsmodels)") from e
+    df_fit = pd.DataFrame({"days": np.asarray(x, dtype=float), "logv": np.asarray(y, dtype=float)})
+    res = smf.quantreg("logv ~ days", df_fit).fit(q=q)
+    return float(res.params.get("Intercept", float("nan"))), float(res.params.get("days", float("nan")))
+
+
+def fit_nat_baseline(days, logv, q=NAT_QUANTILE):
+    if QUANTREG_BACKEND == "statsmodels":
+        return _quantreg_statsmodels(days, logv, q)
+
+    a, b = quantreg_1d(days, logv, q)
+    if QUANTREG_BACKEND == "verify":
+        a_sm, b_sm = _quantreg_statsmodels(days, logv, q)
+        if abs(a - a_sm) > QUANTREG_VERIFY_TOL * max(1.0, abs(a_sm)) or abs(b - b_sm) > QUANTREG_VERIFY_TOL * max(1.0, abs(b_sm)):
+            print(f"[quantreg] numpy/statsmodels mismatch: a={a} vs {a_sm}, b={b} vs {b_sm}")
+    return a, b
+
+
+LEVEL_NA, LEVEL_OK, LEVEL_WARN, LEVEL_RED = -1, 0, 1, 2
+LEVEL_NAMES = {LEVEL_NA: "NA", LEVEL_OK: "OK", LEVEL_WARN: "△", LEVEL_RED: "RED"}
+
+
+def parse_video_columns(videos, run_at):
+    """
+    ★videos API の items を1パスで列（NumPy 配列）に展開する。
+      video_id/title/publishedAt は文字列リスト、それ以外は型付き配列。
+      id か publishedAt が無い item は捨てる（従来通り）。
+    """
+    n = len(videos)
+    ids, titles, pubs = [], [], []
+    days = np.empty(n, dtype=float)
+    views = np.empty(n, dtype=np.int64)
+    likes = np.empty(n, dtype=np.int64)
+    dur = np.empty(n, dtype=np.int64)
+    short = np.empty(n, dtype=bool)
+
+    k = 0
     for v in videos:
         vid = v.get("id")
-        sn = v.get("snippet", {})
-        st = v.get("statistics", {})
-        cd = v.get("contentDetails", {})
-
         if not vid:
             continue
-
+        sn = v.get("snippet", {})
         pub_s = sn.get("publishedAt")
         if not pub_s:
             continue
+        st = v.get("statistics", {})
         pub = datetime.fromisoformat(pub_s.replace("Z", "+00:00"))
 
-        t_days = (run_at - pub).total_seconds() / (3600 * 24)
-        t_days = max(float(t_days), 1.0)
-
-        viewCount = int(st.get("viewCount", 0) or 0)
-        likeCount = int(st.get("likeCount", 0) or 0)
-
-        durationSec = iso8601_duration_to_seconds(cd.get("duration", ""))
+        d = iso8601_duration_to_seconds(v.get("contentDetails", {}).get("duration", ""))
 
+        ids.append(vid)
+        titles.append(sn.get("title", ""))
+        pubs.append(pub_s)
+        days[k] = max((run_at - pub).total_seconds() / (3600 * 24), 1.0)
+        views[k] = int(st.get("viewCount", 0) or 0)
+        likes[k] = int(st.get("likeCount", 0) or 0)
+        dur[k] = d
         # ★修正：durationSec==0（durationが取れてない）を Short 扱いにしない
         # ★60秒超でも「/shorts/」判定で拾う
-        isShort = ((durationSec > 0 and durationSec <= 60) or is_short_by_shorts_url(vid))
+        short[k] = (0 < d <= 60) or is_short_by_shorts_url(vid)
+        k += 1
+
+    return {
+        "video_id": ids,
+        "title": titles,
+        "publishedAt": pubs,
+        "days": days[:k],
+        "views": views[:k],
+        "likes": likes[:k],
+        "durationSec": dur[:k],
+        "isShort": short[:k],
+    }
 
-        rows.append(
-            {
-                "video_id": vid,
-                "title": sn.get("title", ""),
-                "publishedAt": pub_s,
-                "days": t_days,
-                "views": viewCount,
-                "likes": likeCount,
-                "durationSec": int(durationSec),
-                "isShort": bool(isShort),
-            }
-        )
 
-    df_all = pd.DataFrame(rows)
-    if df_all.empty:
-        # baseline に nan を入れても dumps_json で None 化される（＋allow_nan=Falseで検知もできる）
-        return [], {
-            "nat_quantile": NAT_QUANTILE,
-            "a_days": float("nan"),
-            "b_days": float("nan"),
-            "NAT_UPPER_RATIO": NAT_UPPER_RATIO,
-            "NAT_BIG_RATIO": NAT_BIG_RATIO,
-            "b0": float("nan"),
-            "b1": float("nan"),
-            "LIKES_SUSPECT_RATIO": LIKES_SUSPECT_RATIO,
-            "LIKES_BIG_RATIO": LIKES_BIG_RATIO,
-            "fit_mask": {},
-        }
+def _levels(ratio, suspect, big):
+    lv = np.zeros(len(ratio), dtype=np.int8)
+    lv[(ratio >= suspect) & (ratio < big)] = LEVEL_WARN
+    lv[ratio >= big] = LEVEL_RED
+    return lv
 
-    # ----------------------------
-    # NAT（再生×日数）側：フィットはショート含めてもOK（ただしフロントでは除外運用も可）
-    # ----------------------------
-    df_nat = df_all.copy()
-    df_nat["logv"] = np.log(np.clip(df_nat["views"].astype(float), 1.0, None))
 
-    df_fit = df_nat.copy()
-    if RECENT_DAYS_EXCLUDE and RECENT_DAYS_EXCLUDE > 0:
-        df_fit = df_fit[df_fit["days"] >= float(RECENT_DAYS_EXCLUDE)].copy()
+def _empty_baseline():
+    # baseline に nan を入れても dumps_json で None 化される（＋allow_nan=Falseで検知もできる）
+    return {
+        "nat_quantile": NAT_QUANTILE,
+        "a_days": float("nan"),
+        "b_days": float("nan"),
+        "NAT_UPPER_RATIO": NAT_UPPER_RATIO,
+        "NAT_BIG_RATIO": NAT_BIG_RATIO,
+        "b0": float("nan"),
+        "b1": float("nan"),
+        "LIKES_SUSPECT_RATIO": LIKES_SUSPECT_RATIO,
+        "LIKES_BIG_RATIO": LIKES_BIG_RATIO,
+        "fit_mask": {},
+    }
 
-    if not df_fit.empty and NAT_BUZZ_TOP_PCT and 0 < NAT_BUZZ_TOP_PCT < 100:
-        vcut = np.percentile(df_fit["views"].astype(float), NAT_BUZZ_TOP_PCT)
-        df_fit = df_fit[df_fit["views"].astype(float) <= float(vcut)].copy()
 
-    if df_fit.empty:
-        a_days = float("nan")
-        b_days = float("nan")
-    else:
-        model = smf.quantreg("logv ~ days", df_fit)
-        res = model.fit(q=NAT_QUANTILE)
-        a_days = float(res.params.get("Intercept", float("nan")))
-        b_days = float(res.params.get("days", float("nan")))
+def score_columns(t, vf, lf, short, a_days, b_days, like_b0, like_b1):
+    """
+    ★当て終わったベースラインで比率とレベルを出す（fit_columns と --red-only で共通）。
+    戻り値: (ratio_nat, nat_level, ratio_like, like_level)
+    """
+    n = len(t)
+    v_expected = np.exp(a_days + b_days * t)
+    ratio_nat = vf / np.clip(v_expected, 1.0, None)
+    nat_level = _levels(ratio_nat, NAT_UPPER_RATIO, NAT_BIG_RATIO)
+
+    like_ok = ~short if EXCLUDE_SHORTS else np.ones(n, dtype=bool)
+    ratio_like = np.full(n, np.nan, dtype=float)
+    like_level = np.full(n, LEVEL_NA, dtype=np.int8)
+
+    if not (math.isnan(like_b0) or math.isnan(like_b1)):
+        v_expected_like = np.exp(like_b0 + like_b1 * np.log(np.clip(lf, 1.0, None)))
+        ratio_like[like_ok] = (vf / np.clip(v_expected_like, 1.0, None))[like_ok]
+        like_level = _levels(ratio_like, LIKES_SUSPECT_RATIO, LIKES_BIG_RATIO)
+        like_level[~like_ok] = LEVEL_NA
+    return ratio_nat, nat_level, ratio_like, like_level
+
+
+def fit_param_key():
+    # フィットの結果を左右する設定（どれかが変われば前回の係数は使わない）
+    return hashlib.sha256(json.dumps([
+        GENERATOR_VERSION, QUANTREG_BACKEND, NAT_QUANTILE, RECENT_DAYS_EXCLUDE, NAT_BUZZ_TOP_PCT,
+        LIKES_GOOD_VIEWS_MIN, LIKES_MID_VIEWS_PCT, bool(EXCLUDE_SHORTS),
+    ]).encode("utf-8")).hexdigest()[:16]
+
+
+def _fingerprint(*parts):
+    h = hashlib.sha256()
+    for x in parts:
+        if isinstance(x, np.ndarray):
+            h.update(f"{x.dtype.str}{x.shape}".encode("ascii"))
+            h.update(np.ascontiguousarray(x).tobytes())
+        else:
+            h.update(json.dumps(x, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:32]
 
-    t = df_nat["days"].astype(float).to_numpy()
-    logv_center_all = a_days + b_days * t
-    v_expected = np.exp(logv_center_all)
-    ratio_nat = df_nat["views"].astype(float).to_numpy() / np.clip(v_expected, 1.0, None)
 
-    nat_level = np.array(["OK"] * len(df_nat), dtype=object)
-    nat_level[(ratio_nat >= NAT_UPPER_RATIO) & (ratio_nat < NAT_BIG_RATIO)] = "△"
-    nat_level[ratio_nat >= NAT_BIG_RATIO] = "RED"
+def _fit_nat_memo(prev, run_at, ids, pubs, tf, logv):
+    """
+    ★NAT の分位点回帰をメモを使って当てる。戻り値: (a_days, b_days, how, basis の動画ID組, 指紋)
+      how: reused（入力が同じ。days のずれだけ切片を動かす）/ warm（前回の基底が今回も最適）/ fitted
+    """
+    fp = _fingerprint(pubs, logv)
+    prev = prev or {}
+    same = prev.get("fp") == fp and prev.get("a_days") is not None and prev.get("b_days") is not None
+    # days は 1 日で下を切るので、切られた動画が入っていると days のずらしでは再現できない
+    if same and prev.get("run_at_utc") and bool((tf > 1.0).all()):
+        shift = (run_at - datetime.fromisoformat(prev["run_at_utc"])).total_seconds() / 86400
+        b = float(prev["b_days"])
+        return float(prev["a_days"]) - b * shift, b, "reused", prev.get("basis"), fp
+
+    if prev.get("basis"):
+        pos = {vid: k for k, vid in enumerate(ids)}
+        i, j = (pos.get(vid) for vid in prev["basis"])
+        if i is not None and j is not None:
+            ab = quantreg_vertex(tf, logv, NAT_QUANTILE, i, j)
+            if ab is not None:
+                return ab[0], ab[1], "warm", prev["basis"], fp
+
+    a, b = fit_nat_baseline(tf, logv, NAT_QUANTILE)
+    basis = quantreg_basis(tf, logv, NAT_QUANTILE, a, b) if QUANTREG_BACKEND == "numpy" else None
+    return a, b, "fitted", [ids[basis[0]], ids[basis[1]]] if basis else None, fp
+
+
+def fit_columns(cols, run_at=None, memo=None):
+    """
+    ★列から NAT/LIKES の両ベースラインを当て、比率とレベルを返す（DataFrame は作らない）。
+      memo（fit_memo.json の中身）を渡すと前回の係数を使い回し、memo を今回の内容に書き換える（run_at 必須）。
+    戻り値: (baseline, ratio_nat, nat_level, ratio_like, like_level)  ※level は LEVEL_* の int8
+    """
+    t = cols["days"]
+    vf = cols["views"].astype(float)
+    lf = cols["likes"].astype(float)
+    short = cols["isShort"]
+    n = len(t)
 
     # ----------------------------
-    # LIKES（再生×高評価）側：ショートは除外してフィット/判定
+    # NAT（再生×日数）側：フィットはショート含めてもOK（ただしフロントでは除外運用も可）
     # ----------------------------
-    if EXCLUDE_SHORTS and "isShort" in df_all.columns:
-        df_like_base = df_all[~df_all["isShort"]].copy()
-    else:
-        df_like_base = df_all.copy()
+    fit = np.ones(n, dtype=bool)
+    if RECENT_DAYS_EXCLUDE and RECENT_DAYS_EXCLUDE > 0:
+        fit &= t >= float(RECENT_DAYS_EXCLUDE)
 
-    df2 = df_like_base.copy()
-    df2 = df2[df2["likes"].astype(float) >= 1.0].copy()
-    df2 = df2[df2["views"].astype(float) >= float(LIKES_GOOD_VIEWS_MIN)].copy()
+    if fit.any() and NAT_BUZZ_TOP_PCT and 0 < NAT_BUZZ_TOP_PCT < 100:
+        vcut = np.percentile(vf[fit], NAT_BUZZ_TOP_PCT)
+        fit &= vf <= float(vcut)
 
-    if not df2.empty and LIKES_MID_VIEWS_PCT and 0 < LIKES_MID_VIEWS_PCT < 100:
-        vcut2 = np.percentile(df2["views"].astype(float), LIKES_MID_VIEWS_PCT)
-        df2 = df2[df2["views"].astype(float) <= float(vcut2)].copy()
+    params = fit_param_key()
+    prev = memo if memo is not None and memo.get("params") == params and QUANTREG_BACKEND == "numpy" else {}
+    nat_memo = likes_memo = None
 
-    if df2.empty:
-        like_b0 = float("nan")
-        like_b1 = float("nan")
+    if not fit.any():
+        a_days = float("nan")
+        b_days = float("nan")
     else:
-        logL = np.log(df2["likes"].astype(float).to_numpy())
-        logV = np.log(np.clip(df2["views"].astype(float).to_numpy(), 1.0, None))
-        A2 = np.vstack([logL, np.ones_like(logL)]).T
-        b1, b0 = np.linalg.lstsq(A2, logV, rcond=None)[0]
-        like_b0 = float(b0)
-        like_b1 = float(b1)
-
-    ratio_like = np.full(len(df_all), np.nan, dtype=float)
-    like_level = np.array(["NA"] * len(df_all), dtype=object)
-
-    if not (math.isnan(like_b0) or math.isnan(like_b1)):
-        likes_all = np.clip(df_all["likes"].astype(float).to_numpy(), 1.0, None)
-        logL_all = np.log(likes_all)
-        logV_expected = like_b0 + like_b1 * logL_all
-        v_expected_like = np.exp(logV_expected)
-        ratio_like_all = df_all["views"].astype(float).to_numpy() / np.clip(v_expected_like, 1.0, None)
-
-        if EXCLUDE_SHORTS and "isShort" in df_all.columns:
-            mask = ~df_all["isShort"].to_numpy(dtype=bool)
+        logv = np.log(np.clip(vf[fit], 1.0, None))
+        if memo is None:
+            a_days, b_days = fit_nat_baseline(t[fit], logv, NAT_QUANTILE)
         else:
-            mask = np.ones(len(df_all), dtype=bool)
-
-        ratio_like[mask] = ratio_like_all[mask]
-
-        like_level[:] = "OK"
-        like_level[(ratio_like >= LIKES_SUSPECT_RATIO) & (ratio_like < LIKES_BIG_RATIO)] = "△"
-        like_level[ratio_like >= LIKES_BIG_RATIO] = "RED"
-        if EXCLUDE_SHORTS and "isShort" in df_all.columns:
-            like_level[df_all["isShort"].to_numpy(dtype=bool)] = "NA"
+            fit_idx = np.flatnonzero(fit).tolist()
+            ids = [cols["video_id"][k] for k in fit_idx]
+            a_days, b_days, how, basis, fp = _fit_nat_memo(
+                prev.get("nat"), run_at, ids, [cols["publishedAt"][k] for k in fit_idx], t[fit], logv,
+            )
+            nat_memo = {
+                "fp": fp, "a_days": a_days, "b_days": b_days, "run_at_utc": run_at.isoformat(), "basis": basis, "how": how,
+            }
 
     # ----------------------------
-    # points 出力（durationSec/isShort を含める）
-    # - ratio_like は NaN を作らず None にする（ここでNaNを出すと grep で検知される）
+    # LIKES（再生×高評価）側：ショートは除外してフィット/判定
     # ----------------------------
-    points = []
-    df_out = df_all.reset_index(drop=True)
-
-    for i, r in df_out.iterrows():
-        rl = ratio_like[i]
-        rl_out = float(rl) if np.isfinite(rl) else None
-
-        p = {
-            "video_id": r["video_id"],
-            "title": r["title"],
-            "publishedAt": r["publishedAt"],
-            "days": float(r["days"]),
-            "views": int(r["views"]),
-            "likes": int(r["likes"]),
-            "ratio_nat": float(ratio_nat[i]),
-            "ratio_like": rl_out,
-            "nat_level": str(nat_level[i]),
-            "like_level": str(like_level[i]),
-            "durationSec": int(r.get("durationSec", 0)),
-            "isShort": bool(r.get("isShort", False)),
-        }
+    like_ok = ~short if EXCLUDE_SHORTS else np.ones(n, dtype=bool)
+    fit2 = like_ok & (lf >= 1.0) & (vf >= float(LIKES_GOOD_VIEWS_MIN))
 
-        if p["nat_level"] == "RED" or p["like_level"] == "RED":
-            p["display_label"] = "RED"
-        elif p["nat_level"] == "△" or p["like_level"] == "△":
-            p["display_label"] = "△"
-        else:
-            p["display_label"] = "OK"
+    if fit2.any() and LIKES_MID_VIEWS_PCT and 0 < LIKES_MID_VIEWS_PCT < 100:
+        vcut2 = np.percentile(vf[fit2], LIKES_MID_VIEWS_PCT)
+        fit2 &= vf <= float(vcut2)
 
-        if p["ratio_like"] is None:
-            p["anomaly_ratio"] = float(p["ratio_nat"])
+    if not fit2.any():
+        like_b0 = float("nan")
+        like_b1 = float("nan")
+    else:
+        fp2 = _fingerprint(lf[fit2], vf[fit2]) if memo is not None else None
+        old = prev.get("likes") or {}
+        if fp2 is not None and old.get("fp") == fp2 and old.get("b0") is not None and old.get("b1") is not None:
+            like_b0, like_b1, how2 = float(old["b0"]), float(old["b1"]), "reused"
         else:
-            p["anomaly_ratio"] = float(max(p["ratio_nat"], p["ratio_like"]))
-
-        points.append(p)
+            logL = np.log(lf[fit2])
+            logV = np.log(np.clip(vf[fit2], 1.0, None))
+            A2 = np.vstack([logL, np.ones_like(logL)]).T
+            b1, b0 = np.linalg.lstsq(A2, logV, rcond=None)[0]
+            like_b0 = float(b0)
+            like_b1 = float(b1)
+            how2 = "fitted"
+        if fp2 is not None:
+            likes_memo = {"fp": fp2, "b0": like_b0, "b1": like_b1, "how": how2}
+
+    ratio_nat, nat_level, ratio_like, like_level = score_columns(t, vf, lf, short, a_days, b_days, like_b0, like_b1)
 
     baseline = {
         "nat_quantile": NAT_QUANTILE,
@@ -445,14 +1737,507 @@ def compute_points_and_baseline(videos, run_at):
             "EXCLUDE_SHORTS_LIKES": bool(EXCLUDE_SHORTS),
         },
     }
-
-    return points, baseline
+    if memo is not None:
+        memo.clear()
+        memo.update({"params": params, "nat": nat_memo, "likes": likes_memo})
+    return baseline, ratio_nat, nat_level, ratio_like, like_level
 
 
-def update_state_and_red(points, state_path: Path):
-    sticky = set()
-    if state_path.exists():
-        try:
+def emit_points(cols, ratio_nat, nat_level, ratio_like, like_level):
+    # ----------------------------
+    # points 出力（durationSec/isShort を含める）
+    # - ratio_like は NaN を作らず None にする（ここでNaNを出すと grep で検知される）
+    # - display_label / anomaly_ratio も列で先に計算し、最後に1パスで dict 化する
+    # ----------------------------
+    like_finite = np.isfinite(ratio_like)
+    display = np.maximum(nat_level, like_level)
+    anomaly = np.where(like_finite, np.maximum(ratio_nat, np.where(like_finite, ratio_like, 0.0)), ratio_nat)
+
+    rl_out = [float(r) if f else None for r, f in zip(ratio_like.tolist(), like_finite.tolist())]
+    nat_s = [LEVEL_NAMES[c] for c in nat_level.tolist()]
+    like_s = [LEVEL_NAMES[c] for c in like_level.tolist()]
+    disp_s = [LEVEL_NAMES[max(c, LEVEL_OK)] for c in display.tolist()]
+
+    return [
+        {
+            "video_id": vid,
+            "title": title,
+            "publishedAt": pub,
+            "days": d,
+            "views": v,
+            "likes": l,
+            "ratio_nat": rn,
+            "ratio_like": rl,
+            "nat_level": nl,
+            "like_level": ll,
+            "durationSec": ds,
+            "isShort": sh,
+            "display_label": dl,
+            "anomaly_ratio": ar,
+        }
+        for vid, title, pub, d, v, l, rn, rl, nl, ll, ds, sh, dl, ar in zip(
+            cols["video_id"], cols["title"], cols["publishedAt"],
+            cols["days"].tolist(), cols["views"].tolist(), cols["likes"].tolist(),
+            ratio_nat.tolist(), rl_out, nat_s, like_s,
+            cols["durationSec"].tolist(), cols["isShort"].tolist(), disp_s, anomaly.tolist(),
+        )
+    ]
+
+
+def prefetch_video_shorts(videos):
+    # ★60秒超（または duration 不明）の動画だけ /shorts/ プローブが必要なので先にまとめて並列で引く
+    prefetch_shorts(
+        v.get("id") for v in videos
+        if not (0 < iso8601_duration_to_seconds(v.get("contentDetails", {}).get("duration", "")) <= 60)
+    )
+
+
+def _snap_log2(x, up):
+    # 2^(1/PLOT_CURVE_SNAP) 刻みに切り上げ/切り捨て
+    k = math.log2(max(float(x), 1.0)) * PLOT_CURVE_SNAP
+    return 2.0 ** ((math.ceil(k) if up else math.floor(k)) / PLOT_CURVE_SNAP)
+
+
+def plot_curves(baseline, tmax, lmin, lmax):
+    """
+    ★サイトが引く expected 曲線の標本（両モード）。upper はブラウザ側で倍率を掛けるだけ。
+      tmax は表示対象の最大 days、lmin/lmax は likes>0 の範囲（無ければ None）。係数が NaN のモードは出さない。
+    """
+    a, b, b0, b1 = (_baseline_float(baseline, k) for k in ("a_days", "b_days", "b0", "b1"))
+    curves = {}
+    if tmax is not None and math.isfinite(a) and math.isfinite(b):
+        t = np.linspace(1.0, _snap_log2(tmax, True), PLOT_CURVE_DAYS_SAMPLES)
+        curves["views_days"] = {"days": t.tolist(), "views": np.exp(a + b * t).tolist()}
+    if lmin is not None and math.isfinite(b0) and math.isfinite(b1):
+        logl = np.linspace(math.log(_snap_log2(lmin, False)), math.log(_snap_log2(lmax, True)), PLOT_CURVE_LIKES_SAMPLES)
+        curves["views_likes"] = {"likes": np.exp(logl).tolist(), "views": np.exp(b0 + b1 * logl).tolist()}
+    return curves
+
+
+class PlotSampler:
+    """
+    ★サイト用の描画データ（曲線の範囲と間引いた points）を列から作る。
+      add(cols) で表示対象の範囲と格子の材料を溜め、finish() で格子ごとの採用確率を決め、
+      select(...) でそのチャンクの残す行（bool 配列）を返す。全履歴モードはチャンクごとに add → 全部終えてから select。
+    """
+
+    def __init__(self, target=PLOT_LOD_TARGET, max_points=PLOT_LOD_MAX_POINTS):
+        self.target = target
+        self.max_points = max_points
+        self.n = 0
+        self.tmax = self.lmin = self.lmax = None
+        self.parts = []
+        self.keys = self.prob = None
+
+    @property
+    def active(self):
+        # 間引きが要る（= points_lod を書く）か。finish() の後で見る
+        return self.prob is not None
+
+    @staticmethod
+    def _visible(cols):
+        return ~cols["isShort"] & (cols["views"] > 0)
+
+    @staticmethod
+    def _log_bin(x):
+        return np.floor(np.log10(x.astype(float) + 1.0) / PLOT_LOD_LOG_STEP).astype(np.int64)
+
+    def _cell(self, days, views, likes):
+        dbin = np.minimum((days / self.tmax * PLOT_LOD_DAYS_BINS).astype(np.int64), PLOT_LOD_DAYS_BINS - 1)
+        return (dbin * 64 + self._log_bin(views)) * 64 + self._log_bin(likes)
+
+    def add(self, cols):
+        vis = self._visible(cols)
+        if not vis.any():
+            return
+        d, v, l = cols["days"][vis], cols["views"][vis], cols["likes"][vis]
+        self.parts.append((d, v, l))
+        self.n += len(d)
+        self.tmax = max(self.tmax or 1.0, float(d.max()))
+        lp = l[l > 0]
+        if len(lp):
+            self.lmin = min(self.lmin or float("inf"), float(lp.min()))
+            self.lmax = max(self.lmax or 0.0, float(lp.max()))
+
+    def finish(self):
+        parts, self.parts = self.parts, []
+        if self.n <= self.max_points:
+            return
+        cells = self._cell(*(np.concatenate(c) for c in zip(*parts)))
+        self.keys, counts = np.unique(cells, return_counts=True)
+        # 件数比例で割り当て、まばらな格子も最低1件は残す（外れた位置の点が消えないように）
+        self.prob = np.minimum(np.maximum(self.target * counts / self.n, 1.0) / counts, 1.0)
+
+    def curves(self, baseline):
+        return plot_curves(baseline, self.tmax, self.lmin, self.lmax)
+
+    def select(self, cols, display, ratio_like):
+        vis = self._visible(cols)
+        keep = (display >= LEVEL_WARN) | (np.nan_to_num(ratio_like, nan=0.0) >= NAT_UPPER_RATIO)
+        idx = np.flatnonzero(vis & ~keep)
+        cells = self._cell(cols["days"][idx], cols["views"][idx], cols["likes"][idx])
+        pos = np.minimum(np.searchsorted(self.keys, cells), len(self.keys) - 1)
+        prob = np.where(self.keys[pos] == cells, self.prob[pos], 1.0)
+        u = np.fromiter((zlib.crc32(cols["video_id"][i].encode("utf-8")) for i in idx.tolist()), dtype=float, count=len(idx))
+        sel = vis & keep
+        sel[idx] = u < prob * 2.0**32
+        return sel
+
+
+def compute_points_and_baseline(videos, run_at, memo=None, lod=None):
+    """
+    ★videos → (points, baseline)。baseline["curves"] にサイト用の曲線の標本も入れる。
+      lod にリストを渡すと、間引きが要るチャンネルなら間引いた points（points と同じ dict）をそこに足す。
+    """
+    prefetch_video_shorts(videos)
+
+    cols = parse_video_columns(videos, run_at)
+    if not cols["video_id"]:
+        return [], _empty_baseline()
+
+    baseline, ratio_nat, nat_level, ratio_like, like_level = fit_columns(cols, run_at, memo)
+    points = emit_points(cols, ratio_nat, nat_level, ratio_like, like_level)
+
+    plot = PlotSampler()
+    plot.add(cols)
+    plot.finish()
+    baseline["curves"] = plot.curves(baseline)
+    if lod is not None and plot.active:
+        sel = plot.select(cols, np.maximum(nat_level, like_level), ratio_like)
+        lod.extend(points[i] for i in np.flatnonzero(sel).tolist())
+    return points, baseline
+
+
+def _baseline_float(baseline, key):
+    v = baseline.get(key)
+    return float("nan") if v is None else float(v)
+
+
+def rescore_points(points, baseline, run_at):
+    """
+    ★points（dict）の days/比率/レベル/表示ラベルを、保存済みのベースラインでその場で計算し直す（--red-only 用）。
+      views/likes は呼び出し側で更新済みのものを使う。フィットはしない。
+    """
+    if not points:
+        return
+    cols = {
+        "video_id": [p["video_id"] for p in points],
+        "title": [p.get("title", "") for p in points],
+        "publishedAt": [p["publishedAt"] for p in points],
+        "days": np.array([
+            max((run_at - datetime.fromisoformat(p["publishedAt"].replace("Z", "+00:00"))).total_seconds() / (3600 * 24), 1.0)
+            for p in points
+        ]),
+        "views": np.array([int(p.get("views") or 0) for p in points], dtype=np.int64),
+        "likes": np.array([int(p.get("likes") or 0) for p in points], dtype=np.int64),
+        "durationSec": np.array([int(p.get("durationSec") or 0) for p in points], dtype=np.int64),
+        "isShort": np.array([bool(p.get("isShort")) for p in points], dtype=bool),
+    }
+    scored = score_columns(
+        cols["days"], cols["views"].astype(float), cols["likes"].astype(float), cols["isShort"],
+        *(_baseline_float(baseline, k) for k in ("a_days", "b_days", "b0", "b1")),
+    )
+    for p, fresh in zip(points, emit_points(cols, *scored)):
+        p.update(fresh)
+
+
+def points_to_columns(points, run_at_utc):
+    """
+    ★points（1動画1dict）を列ごとの配列にまとめる（キー名の繰り返しを無くす）。
+      nat_level/like_level/display_label は辞書符号化（dicts[field][code]）、isShort は 0/1。
+    """
+    fields = []
+    for p in points:
+        for k in p:
+            if k not in fields:
+                fields.append(k)
+
+    columns = {}
+    dicts = {}
+    for k in fields:
+        col = [p.get(k) for p in points]
+        if k in POINTS_DICT_FIELDS:
+            d = []
+            pos = {}
+            codes = []
+            for v in col:
+                if v not in pos:
+                    pos[v] = len(d)
+                    d.append(v)
+                codes.append(pos[v])
+            dicts[k] = d
+            col = codes
+        elif k == "isShort":
+            col = [1 if v else 0 for v in col]
+        columns[k] = col
+
+    return {
+        "format": POINTS_COLS_FORMAT,
+        "run_at_utc": run_at_utc,
+        "generator_version": GENERATOR_VERSION,
+        "count": len(points),
+        "dicts": dicts,
+        "columns": columns,
+    }
+
+
+def write_points_hashed(ch_dir: Path, prefix, points, run_at_utc, with_gzip=False):
+    # 内容ハッシュをファイル名に入れる（ブラウザは永久キャッシュできる）。同じ名前があれば書かない
+    body = dumps_json(points_to_columns(points, run_at_utc), profile="compact").encode("utf-8")
+    h = hashlib.sha256(body).hexdigest()[:POINTS_COLS_HASH_LEN]
+    name = f"{prefix}{h}.json"
+
+    if not (ch_dir / name).exists():
+        atomic_write_bytes(ch_dir / name, body)
+    if with_gzip and not (ch_dir / (name + ".gz")).exists():
+        atomic_write_bytes(ch_dir / (name + ".gz"), gzip.compress(body, compresslevel=9, mtime=0))
+    return name
+
+
+def remove_stale(ch_dir: Path, prefix, names, with_gzip=False):
+    # prefix で始まるファイルのうち names（とその .gz）以外を消す
+    keep = set(names) | ({n + ".gz" for n in names} if with_gzip else set())
+    for old in ch_dir.glob(prefix + "*"):
+        if old.name not in keep:
+            old.unlink()
+
+
+def write_points_columnar(ch_dir: Path, points, run_at_utc, with_gzip=False):
+    # 古いハッシュのファイルは消す
+    name = write_points_hashed(ch_dir, POINTS_COLS_PREFIX, points, run_at_utc, with_gzip)
+    remove_stale(ch_dir, POINTS_COLS_PREFIX, [name], with_gzip)
+    return name
+
+
+def write_points_lod(ch_dir: Path, lod, run_at_utc, with_gzip=False):
+    # 間引き版（要らないチャンネルは古いものを消すだけ）
+    names = [write_points_hashed(ch_dir, POINTS_LOD_PREFIX, lod, run_at_utc, with_gzip)] if lod else []
+    remove_stale(ch_dir, POINTS_LOD_PREFIX, names, with_gzip)
+
+
+def read_points_hashed(path: Path):
+    # write_points_hashed の逆（列 → 1動画1dict）
+    obj = json.loads(path.read_text(encoding="utf-8"))
+    cols, dicts = obj.get("columns", {}), obj.get("dicts", {})
+    out = []
+    for i in range(int(obj.get("count", 0))):
+        p = {}
+        for k, col in cols.items():
+            v = col[i]
+            p[k] = dicts[k][v] if k in dicts else (v == 1 if k == "isShort" else v)
+        out.append(p)
+    return out
+
+
+def write_manifest(generated_at_utc):
+    """
+    ★data/manifest.json：チャンネルごとの内容ハッシュ付き points ファイル名。
+      サイトはこれを no-store で読み、変わったチャンネルだけ取り直す。
+    """
+    channels = {}
+    ch_root = DATA_DIR / "channels"
+    if ch_root.exists():
+        for ch_dir in sorted(p for p in ch_root.iterdir() if p.is_dir()):
+            names = sorted(x.name for x in ch_dir.glob(POINTS_COLS_PREFIX + "*.json"))
+            if not names:
+                continue
+            name = names[-1]
+            ent = {
+                "points": f"channels/{ch_dir.name}/{name}",
+                "hash": name[len(POINTS_COLS_PREFIX):-len(".json")],
+            }
+            if (ch_dir / (name + ".gz")).exists():
+                ent["points_gz"] = ent["points"] + ".gz"
+            # 全履歴モードの残り（新しい順。ファイル名の NNNN が順番）
+            parts = sorted(x.name for x in ch_dir.glob(POINTS_PARTS_PREFIX + "*.json"))
+            if parts:
+                ent["parts"] = [f"channels/{ch_dir.name}/{x}" for x in parts]
+                if all((ch_dir / (x + ".gz")).exists() for x in parts):
+                    ent["parts_gz"] = True
+            # 描画用の間引き版（大きいチャンネルだけ）
+            lod = sorted(x.name for x in ch_dir.glob(POINTS_LOD_PREFIX + "*.json"))
+            if lod:
+                ent["lod"] = f"channels/{ch_dir.name}/{lod[-1]}"
+                if (ch_dir / (lod[-1] + ".gz")).exists():
+                    ent["lod_gz"] = ent["lod"] + ".gz"
+            channels[ch_dir.name] = ent
+
+    write_json_if_changed(
+        MANIFEST,
+        {
+            "generated_at_utc": generated_at_utc,
+            "generator_version": GENERATOR_VERSION,
+            "points_format": POINTS_COLS_FORMAT,
+            "channels": channels,
+        },
+        ignore_keys=("generated_at_utc",),
+    )
+
+
+def history_video_id_ok(video_id):
+    # HistoryStore の video_id 列（S11）にそのまま入るか
+    return isinstance(video_id, str) and len(video_id) == 11 and video_id.isascii()
+
+
+class HistoryStore:
+    """
+    ★(run, video_id) ごとに views/likes を1行ずつ追記する列指向ストア。
+      - 列ごとに固定長バイナリ（run_ts.i8 / video_id.S11 / views.i8 / likes.i8）を追記し、np.memmap で読む
+      - 行数は meta.json が正（追記途中で落ちた分は次回開いたときに切り捨てる）
+      - run_ts は単調増加なので、期間指定の読み出しは searchsorted だけで済む
+      - runs が HISTORY_MAX_RUNS + HISTORY_COMPACT_SLACK を超えたら古い run を捨てて詰める
+    """
+
+    COLUMNS = (("run_ts", "<i8"), ("video_id", "S11"), ("views", "<i8"), ("likes", "<i8"))
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.meta_path = root / "meta.json"
+        self.meta = {"version": 1, "rows": 0, "runs": []}
+        if self.meta_path.exists():
+            self.meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        self._repair()
+
+    def _path(self, name, dt):
+        return self.root / f"{name}.{np.dtype(dt).str.lstrip('<|')}"
+
+    def _repair(self):
+        rows = int(self.meta["rows"])
+        for name, dt in self.COLUMNS:
+            p = self._path(name, dt)
+            want = rows * np.dtype(dt).itemsize
+            if p.exists() and p.stat().st_size > want:
+                with p.open("r+b") as f:
+                    f.truncate(want)
+
+    def _write_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+
+    @property
+    def rows(self):
+        return int(self.meta["rows"])
+
+    def runs(self):
+        return list(self.meta["runs"])
+
+    def column(self, name):
+        dt = dict(self.COLUMNS)[name]
+        if self.rows == 0:
+            return np.empty(0, dtype=dt)
+        return np.memmap(self._path(name, dt), dtype=dt, mode="r", shape=(self.rows,))
+
+    def read_range(self, ts_from=None, ts_to=None):
+        # run_ts が [ts_from, ts_to) の行を列ごとに返す（memmap のスライスなのでコピーしない）
+        ts = self.column("run_ts")
+        lo = 0 if ts_from is None else int(np.searchsorted(ts, ts_from, side="left"))
+        hi = len(ts) if ts_to is None else int(np.searchsorted(ts, ts_to, side="left"))
+        return {name: self.column(name)[lo:hi] for name, _ in self.COLUMNS}
+
+    def snapshot(self, run_ts):
+        return self.read_range(run_ts, run_ts + 1)
+
+    def last_run_before(self, run_ts):
+        prev = [t for t in self.meta["runs"] if t < run_ts]
+        return prev[-1] if prev else None
+
+    def append(self, run_ts, video_ids, views, likes):
+        run_ts = int(run_ts)
+        if self.meta["runs"] and run_ts <= self.meta["runs"][-1]:
+            return False  # 同じ run（重複 watch_key など）は二重に書かない
+        # S11 に入らない video_id（11文字の ASCII 以外）は行ごと捨てて警告だけ出す（チャンネル全体は止めない）
+        ok = [history_video_id_ok(v) for v in video_ids]
+        if not all(ok):
+            bad = [v for v, good in zip(video_ids, ok) if not good]
+            print(f"[history] {self.root}: skipped {len(bad)} rows with a malformed video_id: {bad[:5]!r}")
+            video_ids = [v for v, good in zip(video_ids, ok) if good]
+            views = [x for x, good in zip(views, ok) if good]
+            likes = [x for x, good in zip(likes, ok) if good]
+        n = len(video_ids)
+        cols = {
+            "run_ts": np.full(n, run_ts, dtype="<i8"),
+            "video_id": np.asarray(video_ids, dtype="S11"),
+            "views": np.asarray(views, dtype="<i8"),
+            "likes": np.asarray(likes, dtype="<i8"),
+        }
+        ensure_dir(self.root)
+        for name, dt in self.COLUMNS:
+            with self._path(name, dt).open("ab") as f:
+                f.write(np.ascontiguousarray(cols[name], dtype=dt).tobytes())
+        self.meta["rows"] = self.rows + n
+        self.meta["runs"].append(run_ts)
+        self._write_meta()
+
+        if len(self.meta["runs"]) > HISTORY_MAX_RUNS + HISTORY_COMPACT_SLACK:
+            self.compact(HISTORY_MAX_RUNS)
+        return True
+
+    def compact(self, max_runs=HISTORY_MAX_RUNS):
+        # 直近 max_runs 回分だけ残して列ファイルを書き直す（tmp に書いてから置き換え）
+        runs = self.meta["runs"]
+        if len(runs) <= max_runs:
+            return
+        keep_from = runs[-max_runs]
+        data = {k: np.array(v) for k, v in self.read_range(keep_from).items()}
+        for name, dt in self.COLUMNS:
+            p = self._path(name, dt)
+            tmp = p.with_suffix(p.suffix + ".tmp")
+            tmp.write_bytes(np.ascontiguousarray(data[name], dtype=dt).tobytes())
+            os.replace(tmp, p)
+        self.meta["rows"] = int(len(data["run_ts"]))
+        self.meta["runs"] = runs[-max_runs:]
+        self._write_meta()
+
+
+def add_velocity_features(points, history: HistoryStore, run_ts):
+    """
+    ★前回 run からの伸びを points に追加する（週次スナップショット間の急な跳ねが操作のシグナル）。
+      - views_gain: 前回からの再生数増分
+      - views_gain_per_day: 上を run 間の日数で割ったもの
+      - like_view_growth: (高評価増分/再生増分) / (高評価/再生)。1 より小さいほど「高評価を伴わない再生の伸び」
+      前回 run に無い動画（新着）はすべて None。
+    """
+    n = len(points)
+    prev_ts = history.last_run_before(run_ts)
+    gain = np.full(n, np.nan)
+    gain_pd = np.full(n, np.nan)
+    growth = np.full(n, np.nan)
+
+    prev = history.snapshot(prev_ts) if (prev_ts is not None and n) else None
+    if prev is not None and len(prev["video_id"]):
+        pv = np.asarray(prev["video_id"])
+        order = np.argsort(pv)
+        pv_sorted = pv[order]
+
+        # 履歴に入らない video_id は空にして（前回の行に当たらない）伸びを NaN のままにする
+        vids = np.asarray([p["video_id"] if history_video_id_ok(p["video_id"]) else "" for p in points], dtype="S11")
+        views = np.asarray([p["views"] for p in points], dtype=float)
+        likes = np.asarray([p["likes"] for p in points], dtype=float)
+
+        pos = np.minimum(np.searchsorted(pv_sorted, vids), len(pv_sorted) - 1)
+        hit = pv_sorted[pos] == vids
+        src = order[pos]
+        pviews = np.where(hit, np.asarray(prev["views"], dtype=float)[src], np.nan)
+        plikes = np.where(hit, np.asarray(prev["likes"], dtype=float)[src], np.nan)
+
+        dt_days = max((run_ts - prev_ts) / 86400.0, 1e-6)
+        gain = views - pviews
+        gain_pd = gain / dt_days
+        dl = likes - plikes
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.where((gain > 0) & (likes > 0) & (views > 0), (dl / gain) / (likes / views), np.nan)
+
+    for p, g, gpd, gr in zip(points, gain.tolist(), gain_pd.tolist(), growth.tolist()):
+        p["views_gain"] = int(g) if math.isfinite(g) else None
+        p["views_gain_per_day"] = gpd if math.isfinite(gpd) else None
+        p["like_view_growth"] = gr if math.isfinite(gr) else None
+
+
+def update_state_and_red(points, state_path: Path):
+    sticky = set()
+    if state_path.exists():
+        try:
             old = json.loads(state_path.read_text(encoding="utf-8"))
             for vid in old.get("sticky_red", []):
                 if vid:
@@ -474,7 +2259,7 @@ def update_state_and_red(points, state_path: Path):
     red_top = [p["video_id"] for p in reds[:RED_TRACK_MAX]]
 
     state_obj = {"sticky_red": sorted(list(sticky)), "red_top": red_top}
-    state_path.write_text(dumps_json(state_obj), encoding="utf-8")
+    write_json_if_changed(state_path, state_obj)
     return state_obj
 
 
@@ -501,142 +2286,1483 @@ def append_watchlist_channel_id(channel_id: str) -> bool:
     return True
 
 
+def append_watchlist_channel_id_locked(channel_id: str) -> bool:
+    with _WATCHLIST_LOCK:
+        return append_watchlist_channel_id(channel_id)
+
+
 def parse_args():
     p = argparse.ArgumentParser(description="Weekly (or on-demand) YouTube anomaly monitor data generator")
     p.add_argument("--channel", default="", help="Process only this channel too (@handle or UC... channelId).")
+    p.add_argument("--ondemand", action="store_true", help="Process only --channel and patch its entry into the existing index.json.")
+    p.add_argument("--enqueue", action="store_true", help="Only queue --channel for the next --drain_queue run (data/ondemand_queue/).")
+    p.add_argument("--request_id", default="", help="Request id for --enqueue (default: generated). Used as the key in data/ondemand_status.json.")
+    p.add_argument("--drain_queue", action="store_true", help="Process every queued on-demand request in one run and write data/ondemand_status.json.")
     p.add_argument("--auto_watch_red_top", type=int, default=0, help="Auto append watchlist when red_top_count >= this.")
+    p.add_argument("--incremental", action="store_true", help="Reuse the previous playlist/points and only refresh statistics of known videos.")
+    p.add_argument("--quantreg_backend", default=QUANTREG_BACKEND, choices=["numpy", "statsmodels", "verify"], help="NAT baseline quantile regression implementation (statsmodels is optional).")
+    p.add_argument("--points_gzip", action="store_true", help="Also write a pre-gzipped copy of the columnar points file for the site.")
+    p.add_argument("--full_history_max", type=int, default=FULL_HISTORY_MAX_VIDEOS, help="Max uploads per channel listed in data/full_history.txt (full-history mode).")
+    p.add_argument("--refit", action="store_true", help="Ignore memoized baseline fits and always re-analyze channels with unchanged inputs.")
+    p.add_argument("--json_strict", action="store_true", help="Fail on NaN/Infinity in JSON outputs instead of writing null.")
+    p.add_argument("--profile", choices=("cprofile", "pyinstrument"), default="", help="Profile the run (main thread only; use with --concurrency 1).")
+    p.add_argument("--profile_out", default="", help="Profile output path (default weekly_profile.prof / .html).")
+    p.add_argument("--red_only", "--red-only", action="store_true", help="Only re-poll statistics of each channel's red_top videos and rescore them against the stored baseline.")
+    p.add_argument("--resume", action="store_true", help="Continue the run recorded in data/run_journal.jsonl: skip channels already written in it and only redo the rest.")
+    p.add_argument("--scheduled", action="store_true", help="Only refresh channels that are due by their priority tier, within the daily quota budget (data/schedule.json).")
+    p.add_argument("--daily_budget_units", type=int, default=SCHEDULE_DAILY_BUDGET_UNITS, help="Daily quota budget for --scheduled runs.")
+    p.add_argument("--batch_units", type=int, default=0, help="Cap the units a single --scheduled run may plan (0 = rest of today's budget).")
+    p.add_argument("--shard", type=parse_shard, default=None, help="Process only shard i of N (i/N, 0-based) and write a fragment for --merge.")
+    p.add_argument("--merge", action="store_true", help="Merge --shard fragments into index.json / watchlist_auto.txt and sync the site.")
+    p.add_argument("--replay", action="store_true", help="Re-run the analysis from stored raw videos responses (no network).")
+    p.add_argument("--replay_workers", type=int, default=0, help="Processes for --replay (0 = CPU count).")
+    p.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Channels (and API batches) processed in parallel.")
+    p.add_argument("--qps", type=float, default=YT_API_QPS, help="Shared YouTube Data API request rate limit (requests/sec, 0=unlimited).")
+    p.add_argument("--quota_units", type=int, default=YT_API_DAILY_QUOTA_UNITS, help="YouTube Data API quota units this run may spend (0=unlimited).")
     return p.parse_args()
 
 
-def main():
-    args = parse_args()
+def save_raw_videos(ch_dir: Path, videos, run_at_utc):
+    # /shorts/ プローブで Short と判定された動画も一緒に残す（再解析時にプローブ不要にする）
+    shorts = sorted(
+        v.get("id") for v in videos
+        if v.get("id") in _SHORTS_URL_CACHE and _SHORTS_URL_CACHE[v.get("id")][0] == 1
+    )
+    body = json.dumps(
+        {"run_at_utc": run_at_utc, "generator_version": GENERATOR_VERSION, "shorts": shorts, "videos": videos},
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+    atomic_write_bytes(ch_dir / RAW_VIDEOS_NAME, gzip.compress(body, compresslevel=9, mtime=0))
 
-    if not YT_API_KEY:
-        raise SystemExit("YT_API_KEY is required.")
 
-    run_at = now_utc()
+def load_raw_videos(ch_dir: Path):
+    return json.loads(gzip.decompress((ch_dir / RAW_VIDEOS_NAME).read_bytes()).decode("utf-8"))
+
+
+def load_fit_memo(ch_dir: Path):
+    try:
+        return json.loads((ch_dir / FIT_MEMO_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def channel_inputs_fingerprint(videos, args):
+    """
+    ★解析の入力（videos レスポンス＋Shorts 判定＋フィット設定＋出力オプション）の指紋。
+      Shorts が未判定/プローブ失敗の動画があるときは None（解析し直せば結果が変わりうるので飛ばさない）。
+    """
+    load_shorts_cache()
+    verdicts = []
+    for v in videos:
+        vid = v.get("id")
+        if not vid or 0 < iso8601_duration_to_seconds(v.get("contentDetails", {}).get("duration", "")) <= 60:
+            continue
+        ent = _shorts_cached(vid)
+        if ent is None or ent[0] < 0:
+            return None
+        verdicts.append(ent[0])
+    return _fingerprint(fit_param_key(), bool(args.points_gzip), videos, verdicts)
+
+
+def load_unchanged_channel(ch_dir: Path, inputs_fp):
+    # 前回と入力が同じなら前回の points/state を返す（無ければ None）
+    if not inputs_fp or load_fit_memo(ch_dir).get("inputs") != inputs_fp:
+        return None
+    try:
+        points = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8")).get("points", [])
+        st = json.loads((ch_dir / "state.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return points, st
+
+
+def analyze_and_write(ch_dir: Path, videos, run_at, args, record_run=True, inputs_fp=None):
+    """
+    ★videos から points/baseline/state を作って書き出す（通常実行と --replay で共通）。
+      record_run=False のときは runs.jsonl と履歴ストアには追記しない（同じ run の再計算なので）。
+      フィットは fit_memo.json を使い回す（--refit なら使わない）。inputs_fp は次回の丸ごとスキップ判定用に残す。
+    """
+    memo = {} if args.refit else load_fit_memo(ch_dir)
+    lod = []
+
+    with METRICS.stage("fit"):
+        points, baseline = compute_points_and_baseline(videos, run_at, memo, lod)
+
+    fit_how = {k: (memo.get(k) or {}).get("how") for k in ("nat", "likes")}
+    st = write_analysis(ch_dir, points, baseline, run_at, args, record_run, fit_how, lod)
+    with METRICS.stage("writes"):
+        write_json_if_changed(ch_dir / FIT_MEMO_NAME, {**memo, "inputs": inputs_fp}, profile="compact")
+        # 全履歴モードをやめたチャンネルの残り
+        remove_stale(ch_dir, POINTS_PARTS_PREFIX, [])
+    return points, st
+
+
+def write_analysis(ch_dir: Path, points, baseline, run_at, args, record_run=True, fit_how=None, lod=None):
+    # 解析済みの points/baseline から履歴・points・state・latest.json を書く（全履歴モードと共通）
+    # lod は描画用の間引き版（points と同じ dict なので伸びの列もここで入る）。空なら points_lod は消す
     run_at_utc = run_at.isoformat()
 
-    ensure_dir(DATA_DIR / "channels")
+    with METRICS.stage("history"):
+        history = HistoryStore(ch_dir / HISTORY_DIRNAME)
+        run_ts = int(run_at.timestamp())
+        add_velocity_features(points, history, run_ts)
+        if record_run:
+            history.append(
+                run_ts,
+                [p["video_id"] for p in points],
+                [p["views"] for p in points],
+                [p["likes"] for p in points],
+            )
 
-    watch = read_watchlist()
+    latest = {"run_at_utc": run_at_utc, "baseline": baseline}
 
-    extra = (args.channel or "").strip()
-    if extra:
-        watch_run = [extra] + [w for w in watch if w != extra]
-    else:
-        watch_run = list(watch)
+    with METRICS.stage("writes"):
+        # ★generator_version を必ず入れる（本番がこのコードを使ったか確認用）
+        write_json_if_changed(
+            ch_dir / "latest_points.json",
+            {
+                "run_at_utc": run_at_utc,
+                "generator_version": GENERATOR_VERSION,
+                "points": points
+            },
+        )
+        write_points_columnar(ch_dir, points, run_at_utc, with_gzip=args.points_gzip)
+        write_points_lod(ch_dir, lod, run_at_utc, with_gzip=args.points_gzip)
+
+        if record_run:
+            # 曲線の標本は係数から作り直せるので runs.jsonl には入れない
+            append_jsonl(ch_dir / "runs.jsonl", {
+                "generator_version": GENERATOR_VERSION,
+                "run_at_utc": run_at_utc,
+                "baseline": {k: v for k, v in baseline.items() if k != "curves"},
+                "fit": fit_how or {},
+            })
+
+    with METRICS.stage("state"):
+        st = update_state_and_red(points, ch_dir / "state.json")
+
+    with METRICS.stage("writes"):
+        write_json_if_changed(
+            ch_dir / "latest.json",
+            {"generator_version": GENERATOR_VERSION, **latest},
+            ignore_keys=("run_at_utc",),
+        )
+    return st
 
-    channels_index = []
-    warnings = []
 
-    for watch_key in watch_run:
+class FitReservoir:
+    """
+    ★フィット用の一様な無作為抽出（リザーバサンプリング。Algorithm R をチャンク単位でベクトル化）。
+      フィットに要る列（days/views/likes/isShort）だけを最大 k 行持つ。n は足した総行数。
+    """
+
+    FIELDS = ("days", "views", "likes", "isShort")
+
+    def __init__(self, k, seed):
+        self.k = int(k)
+        self.n = 0
+        self.rng = np.random.default_rng(seed)
+        self.buf = {}
+
+    def add(self, cols):
+        m = len(cols["days"])
+        if not m:
+            return
+        if not self.buf:
+            self.buf = {f: np.empty(self.k, dtype=cols[f].dtype) for f in self.FIELDS}
+
+        pos = np.arange(self.n, self.n + m)
+        fill = pos < self.k
+        for f in self.FIELDS:
+            self.buf[f][pos[fill]] = cols[f][fill]
+
+        # 埋まった後の i 行目（0始まり）は確率 k/(i+1) で無作為な枠を置き換える
+        rest = np.flatnonzero(~fill)
+        if len(rest):
+            slot = self.rng.integers(0, pos[rest] + 1)
+            hit = slot < self.k
+            for f in self.FIELDS:
+                self.buf[f][slot[hit]] = cols[f][rest[hit]]
+        self.n += m
+
+    def columns(self):
+        size = min(self.n, self.k)
+        return {f: self.buf[f][:size] for f in self.FIELDS}
+
+
+def iter_upload_chunks(playlist_id, max_results, run_at, chunk=FULL_HISTORY_CHUNK):
+    """
+    ★uploads を新しい順に chunk 件ずつ (playlistItems の items, 列) にして返す生成器（全件をメモリに持たない）。
+      ページを chunk 件ぶん溜めたら videos を並列に引き、/shorts/ プローブを済ませて列に展開する。
+    """
+    for pages in chunked(iter_playlist_pages(playlist_id, max_results), max(1, chunk // 50)):
+        items = [it for page in pages for it in page]
+        videos = fetch_videos([vid for vid in map(playlist_video_id, items) if vid])
+        prefetch_video_shorts(videos)
+        with METRICS.stage("fit"):
+            cols = parse_video_columns(videos, run_at)
+        yield items, cols
+
+
+def _spool_columns(path: Path, cols):
+    obj = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in cols.items()}
+    path.write_text(json.dumps(obj, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+
+
+def _unspool_columns(path: Path):
+    obj = json.loads(path.read_text(encoding="utf-8"))
+    return {
+        "video_id": obj["video_id"],
+        "title": obj["title"],
+        "publishedAt": obj["publishedAt"],
+        "days": np.asarray(obj["days"], dtype=float),
+        "views": np.asarray(obj["views"], dtype=np.int64),
+        "likes": np.asarray(obj["likes"], dtype=np.int64),
+        "durationSec": np.asarray(obj["durationSec"], dtype=np.int64),
+        "isShort": np.asarray(obj["isShort"], dtype=bool),
+    }
+
+
+def analyze_full_history(ch_dir: Path, cid, uploads, run_at, args):
+    """
+    ★全履歴モード：uploads を最大 --full_history_max 件まで流しながら解析して書き出す。
+      1周目：チャンクを一時ディレクトリに逃がしつつリザーバに抽出 → 抽出分でフィット
+      2周目：チャンクを読み戻して判定し、新しい MAX_VIDEOS 件＋古い RED/sticky を本体に、残りを parts に書く
+    戻り値: (本体の points, state, 全件の max anomaly_ratio, 全件数)
+    """
+    run_at_utc = run_at.isoformat()
+    max_n = int(args.full_history_max or FULL_HISTORY_MAX_VIDEOS)
+    sample = FitReservoir(FULL_HISTORY_FIT_SAMPLE, int(hashlib.sha256(cid.encode("utf-8")).hexdigest()[:8], 16))
+    plot = PlotSampler()
+
+    sticky = set()
+    try:
+        sticky = set(json.loads((ch_dir / "state.json").read_text(encoding="utf-8")).get("sticky_red", []))
+    except (OSError, ValueError):
+        pass
+
+    newest_items = []
+    main, part, names, lod = [], [], [], []
+    max_anom = 0.0
+    with tempfile.TemporaryDirectory(prefix="full_history_") as tmp:
+        spool = []
+        for items, cols in iter_upload_chunks(uploads, max_n, run_at):
+            newest_items.extend(items[: max(0, MAX_VIDEOS - len(newest_items))])
+            if not cols["video_id"]:
+                continue
+            sample.add(cols)
+            plot.add(cols)
+            spool.append(Path(tmp) / f"{len(spool):05d}.json")
+            _spool_columns(spool[-1], cols)
+
+        with METRICS.stage("fit"):
+            baseline = fit_columns(sample.columns())[0] if sample.n else _empty_baseline()
+        baseline["full_history"] = {"videos": sample.n, "fit_sample": min(sample.n, sample.k)}
+        # 曲線の範囲と間引きの格子は抽出ではなく全件から（parts も含めて描くので）
+        plot.finish()
+        baseline["curves"] = plot.curves(baseline)
+        coef = [_baseline_float(baseline, k) for k in ("a_days", "b_days", "b0", "b1")]
+
+        seen = 0
+        for path in spool:
+            cols = _unspool_columns(path)
+            with METRICS.stage("fit"):
+                scored = score_columns(
+                    cols["days"], cols["views"].astype(float), cols["likes"].astype(float), cols["isShort"], *coef,
+                )
+                pts = emit_points(cols, *scored)
+                if plot.active:
+                    sel = plot.select(cols, np.maximum(scored[1], scored[3]), scored[2])
+                    lod.extend(pts[i] for i in np.flatnonzero(sel).tolist())
+            for p in pts:
+                max_anom = max(max_anom, p.get("anomaly_ratio", 0.0) or 0.0)
+                if seen < MAX_VIDEOS or p["display_label"] == "RED" or p["video_id"] in sticky:
+                    main.append(p)
+                else:
+                    part.append(p)
+                seen += 1
+            with METRICS.stage("writes"):
+                while len(part) >= FULL_HISTORY_PART_POINTS:
+                    prefix = f"{POINTS_PARTS_PREFIX}{len(names):04d}."
+                    names.append(write_points_hashed(ch_dir, prefix, part[:FULL_HISTORY_PART_POINTS], run_at_utc, args.points_gzip))
+                    part = part[FULL_HISTORY_PART_POINTS:]
+
+    with METRICS.stage("writes"):
+        if part:
+            prefix = f"{POINTS_PARTS_PREFIX}{len(names):04d}."
+            names.append(write_points_hashed(ch_dir, prefix, part, run_at_utc, args.points_gzip))
+        remove_stale(ch_dir, POINTS_PARTS_PREFIX, names, args.points_gzip)
+
+    st = write_analysis(ch_dir, main, baseline, run_at, args, fit_how={"nat": "sampled", "likes": "sampled"}, lod=lod)
+
+    with METRICS.stage("writes"):
+        # 差分更新の入力（全履歴モードをやめたときに使う）は新しい MAX_VIDEOS 件だけ
+        write_json_if_changed(
+            ch_dir / "latest_500_playlistItems.json", {"full_fetch_at_utc": run_at_utc, "items": newest_items}, profile="compact",
+        )
+        # 全件分の生レスポンスとフィットのメモは持たない（古いものがあれば消す）
+        for name in (RAW_VIDEOS_NAME, FIT_MEMO_NAME):
+            (ch_dir / name).unlink(missing_ok=True)
+    return main, st, max_anom, sample.n
+
+
+class RunJournal:
+    """
+    ★実行ジャーナル（RUN_JOURNAL）。ヘッダ行のあとにチャンネルごとの段階を append_jsonl で追記するだけ。
+      落ちた瞬間の書きかけの最終行は、引き継ぐときに切り詰める。
+      stages: watch_key -> そのチャンネルの最後に済んだ段階（RUN_JOURNAL_RESUMABLE）の行
+    """
+
+    def __init__(self, path: Path, run_id, run_at_utc, stages=None):
+        self.path = path
+        self.run_id = run_id
+        self.run_at_utc = run_at_utc
+        self.stages = stages or {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    def start(cls, path: Path, run_at):
+        run_id = run_at.strftime("%Y%m%dT%H%M%SZ")
+        header = {"run_id": run_id, "run_at_utc": run_at.isoformat(), "generator_version": GENERATOR_VERSION}
+        atomic_write_bytes(path, (json.dumps(header, separators=(",", ":")) + "\n").encode("utf-8"))
+        return cls(path, run_id, run_at.isoformat())
+
+    @classmethod
+    def resume(cls, path: Path, now, window_hours=RUN_JOURNAL_WINDOW_HOURS):
+        # 引き継げるジャーナルが無い（無い/壊れている/古い）なら None
         try:
-            cid = resolve_channel_id(watch_key)
-            ch = fetch_channel(cid)
+            data = path.read_bytes()
+        except OSError:
+            return None
+        if data and not data.endswith(b"\n"):
+            # 書きかけの最終行を捨てる（このあと追記する行がつながらないように）
+            data = data[: data.rfind(b"\n") + 1]
+            with path.open("r+b") as f:
+                f.truncate(len(data))
+        rows = []
+        for line in data.splitlines():
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+        if not rows or not rows[0].get("run_id") or not rows[0].get("run_at_utc"):
+            return None
+        header = rows[0]
+        if (now - datetime.fromisoformat(header["run_at_utc"])).total_seconds() > window_hours * 3600:
+            return None
+        stages = {}
+        for row in rows[1:]:
+            if row.get("watch_key") and row.get("stage") in RUN_JOURNAL_RESUMABLE:
+                stages[row["watch_key"]] = row
+        return cls(path, header["run_id"], header["run_at_utc"], stages)
+
+    def last(self, watch_key):
+        return self.stages.get(watch_key)
+
+    def record(self, watch_key, stage, **fields):
+        row = {"watch_key": watch_key, "stage": stage, "at_utc": now_utc().isoformat(), **fields}
+        with self._lock:
+            append_jsonl(self.path, row)
+            if stage in RUN_JOURNAL_RESUMABLE:
+                self.stages[watch_key] = row
+
+    def checkpoint(self):
+        # Shorts キャッシュとチャンネルのメタ（handle 解決など、取り直すとクォータを使う）を時々保存する
+        with self._lock:
+            if time.monotonic() - self._flushed_at < RUN_JOURNAL_CACHE_FLUSH_SEC:
+                return
+            self._flushed_at = time.monotonic()
+            save_shorts_cache()
+            save_channel_meta()
+
+
+def load_resumed_channel(ch_dir: Path, row, run_at_utc):
+    """
+    ★--resume：ジャーナルの途中段階の行から、そのチャンネルの続きに要るものをディスクから読む。
+      fetched → ("fetched", videos)、analyzed → ("analyzed", (points, state))。
+      読めない / 別の run のものなら None（最初からやり直す）
+    """
+    try:
+        if row["stage"] == "analyzed":
+            pts = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8"))
+            if pts.get("run_at_utc") != run_at_utc:
+                return None
+            st = json.loads((ch_dir / "state.json").read_text(encoding="utf-8"))
+            return "analyzed", (pts.get("points", []), st)
+        raw = load_raw_videos(ch_dir)
+    except (OSError, ValueError):
+        return None
+    if raw.get("run_at_utc") != run_at_utc:
+        return None
+    # 保存時に Short と分かっていた動画はプローブし直さない
+    load_shorts_cache()
+    now = int(time.time())
+    with _SHORTS_CACHE_LOCK:
+        for vid in raw.get("shorts", []):
+            _SHORTS_URL_CACHE.setdefault(vid, [1, now])
+    return "fetched", raw.get("videos", [])
+
+
+def index_entry(cid, watch_key, title, points, st):
+    max_anom = max((p.get("anomaly_ratio", 0.0) or 0.0 for p in points), default=0.0)
+    return {
+        "channel_id": cid,
+        "watch_key": watch_key,
+        "title": title,
+        "sticky_red_count": len(st.get("sticky_red", [])),
+        "red_top_count": len(st.get("red_top", [])),
+        "max_anomaly_ratio": float(max_anom),
+    }
 
-            title = ch.get("snippet", {}).get("title", "")
-            uploads = ch.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
-            if not uploads:
-                raise RuntimeError("uploads playlist not found")
 
-            ch_dir = DATA_DIR / "channels" / cid
-            ensure_dir(ch_dir)
+def process_channel(watch_key, run_at, args, journal=None):
+    run_at_utc = run_at.isoformat()
 
-            (ch_dir / "channel.json").write_text(
-                dumps_json(ch),
-                encoding="utf-8",
-            )
+    # ★--resume：この run で取得済み（fetched）/解析済み（analyzed）なら API は呼ばずにディスクから続ける
+    row = journal.last(watch_key) if journal else None
+    resumed = None
+    if row and row.get("channel_id"):
+        resumed = load_resumed_channel(DATA_DIR / "channels" / row["channel_id"], row, run_at_utc)
+
+    cid = row["channel_id"] if resumed else resolve_channel_id(watch_key)
+    with channel_lock(cid):
+        ch_dir = DATA_DIR / "channels" / cid
+        if resumed:
+            ch = json.loads((ch_dir / "channel.json").read_text(encoding="utf-8"))
+        else:
+            ch = fetch_channel(cid)
 
+        title = ch.get("snippet", {}).get("title", "")
+        uploads = ch.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+        if not uploads:
+            raise RuntimeError("uploads playlist not found")
+
+        ensure_dir(ch_dir)
+
+        with METRICS.stage("writes"):
+            write_json_if_changed(ch_dir / "channel.json", ch)
+
+        # 全履歴モードは途中の段階をジャーナルに残さない（resumed にはならない）
+        full_history = not resumed and bool(read_full_history() & {watch_key, cid})
+        prev = load_previous_fetch(ch_dir, run_at) if args.incremental and not full_history and not resumed else None
+        unchanged = None
+        if resumed and resumed[0] == "analyzed":
+            points, st = resumed[1]
+        elif resumed:
+            videos = resumed[1]
+        elif full_history:
+            points, st, max_anom, total = analyze_full_history(ch_dir, cid, uploads, run_at, args)
+        elif prev:
+            pli, videos = fetch_incremental(uploads, prev[0], prev[1], MAX_VIDEOS)
+        else:
             pli = fetch_latest_playlist_items(uploads, MAX_VIDEOS)
-            (ch_dir / "latest_500_playlistItems.json").write_text(
-                dumps_json(pli),
-                encoding="utf-8",
-            )
+            pli = {"full_fetch_at_utc": run_at_utc, **pli}
 
             video_ids = []
             for it in pli.get("items", []):
-                vid = it.get("contentDetails", {}).get("videoId")
+                vid = playlist_video_id(it)
                 if vid:
                     video_ids.append(vid)
 
             videos = fetch_videos(video_ids)
 
-            points, baseline = compute_points_and_baseline(videos, run_at)
-
-            # ★generator_version を必ず入れる（本番がこのコードを使ったか確認用）
-            (ch_dir / "latest_points.json").write_text(
-                dumps_json({
-                    "run_at_utc": run_at_utc,
-                    "generator_version": GENERATOR_VERSION,
-                    "points": points
-                }),
-                encoding="utf-8",
-            )
-
-            latest = {"run_at_utc": run_at_utc, "baseline": baseline}
-
-            with (ch_dir / "runs.jsonl").open("a", encoding="utf-8") as f:
-                f.write(dumps_jsonl({"generator_version": GENERATOR_VERSION, **latest}) + "\n")
-
-            st = update_state_and_red(points, ch_dir / "state.json")
-            (ch_dir / "latest.json").write_text(
-                dumps_json({"generator_version": GENERATOR_VERSION, **latest}),
-                encoding="utf-8",
-            )
+        if not full_history and not (resumed and resumed[0] == "analyzed"):
+            if not resumed:
+                with METRICS.stage("writes"):
+                    # 差分更新の入力にしか使わないので compact（サイトは読まない）
+                    write_json_if_changed(ch_dir / "latest_500_playlistItems.json", pli, profile="compact")
+
+            # /shorts/ プローブは解析より先に済ませる（生レスポンスに Short 判定を入れて保存するため）
+            prefetch_video_shorts(videos)
+
+            # ★入力が前回とバイト単位で同じなら解析/履歴/書き出しを丸ごと飛ばす（出力も生レスポンスも前回のまま）
+            inputs_fp = channel_inputs_fingerprint(videos, args)
+            if not args.refit:
+                unchanged = load_unchanged_channel(ch_dir, inputs_fp)
+            if unchanged:
+                points, st = unchanged
+            else:
+                if not resumed:
+                    # 解析の前に保存してジャーナルに残す（ここから先で落ちても --resume は取り直さない）
+                    with METRICS.stage("writes"):
+                        save_raw_videos(ch_dir, videos, run_at_utc)
+                    if journal:
+                        journal.record(watch_key, "fetched", channel_id=cid)
+                points, st = analyze_and_write(ch_dir, videos, run_at, args, inputs_fp=inputs_fp)
+                if journal:
+                    journal.record(watch_key, "analyzed", channel_id=cid)
+
+    if args.auto_watch_red_top and int(args.auto_watch_red_top) > 0:
+        red_top_count = len(st.get("red_top", []))
+        latest_count = len(points)
+        channel_age_days = 0
+        if points:
+            channel_age_days = max(p.get("days", 0) or 0 for p in points)
+
+        if (
+            red_top_count >= int(args.auto_watch_red_top)
+            and latest_count >= AUTO_WATCH_MIN_LATEST_COUNT
+            and channel_age_days >= AUTO_WATCH_MIN_CHANNEL_AGE_DAYS
+        ):
+            appended = append_watchlist_channel_id_locked(cid)
+            if appended:
+                print("[ondemand] appended to watchlist:", cid)
+        else:
+            print("[ondemand] NOT appended:", cid)
 
-            max_anom = max((p.get("anomaly_ratio", 0.0) or 0.0 for p in points), default=0.0)
-
-            if args.auto_watch_red_top and int(args.auto_watch_red_top) > 0:
-                red_top_count = len(st.get("red_top", []))
-                latest_count = len(points)
-                channel_age_days = 0
-                if points:
-                    channel_age_days = max(p.get("days", 0) or 0 for p in points)
-
-                if (
-                    red_top_count >= int(args.auto_watch_red_top)
-                    and latest_count >= AUTO_WATCH_MIN_LATEST_COUNT
-                    and channel_age_days >= AUTO_WATCH_MIN_CHANNEL_AGE_DAYS
-                ):
-                    appended = append_watchlist_channel_id(cid)
-                    if appended:
-                        print("[ondemand] appended to watchlist:", cid)
-                else:
-                    print("[ondemand] NOT appended:", cid)
-
-            channels_index.append(
-                {
-                    "channel_id": cid,
-                    "watch_key": watch_key,
-                    "title": title,
-                    "sticky_red_count": len(st.get("sticky_red", [])),
-                    "red_top_count": len(st.get("red_top", [])),
-                    "max_anomaly_ratio": float(max_anom),
-                }
-            )
+    append_jsonl(ch_dir / METRICS_JSONL_NAME, {
+        "run_at_utc": run_at_utc,
+        "generator_version": GENERATOR_VERSION,
+        "watch_key": watch_key,
+        "unchanged": bool(unchanged),
+        **METRICS.export_channel(watch_key),
+    })
+    entry = index_entry(cid, watch_key, title, points, st)
+    if full_history:
+        # points は本体だけなので、全件での最大と動画数で上書きする
+        entry["max_anomaly_ratio"] = float(max(max_anom, entry["max_anomaly_ratio"]))
+        entry["full_history_videos"] = total
+    return entry
+
+
+def _replay_worker_init():
+    # 再解析は保存済みの入力だけで完結させる（ディスクの Shorts キャッシュも読まない）
+    global OFFLINE, _SHORTS_CACHE_LOADED
+    OFFLINE = True
+    _SHORTS_CACHE_LOADED = True
+
+
+def replay_channel(cid, watch_key, args):
+    ch_dir = DATA_DIR / "channels" / cid
+    raw = load_raw_videos(ch_dir)
+    with _SHORTS_CACHE_LOCK:
+        for vid in raw.get("shorts", []):
+            _SHORTS_URL_CACHE[vid] = [1, 0]
+
+    ch = json.loads((ch_dir / "channel.json").read_text(encoding="utf-8"))
+    title = ch.get("snippet", {}).get("title", "")
+    run_at = datetime.fromisoformat(raw["run_at_utc"])
+
+    points, st = analyze_and_write(ch_dir, raw.get("videos", []), run_at, args, record_run=False)
+    return index_entry(cid, watch_key, title, points, st)
+
+
+def _replay_one(job):
+    cid, watch_key, args = job
+    try:
+        return replay_channel(cid, watch_key, args), None
+    except Exception as e:
+        return None, {"watch_key": watch_key, "error": f"replay: {e}"}
 
-        except Exception as e:
-            warnings.append({"watch_key": watch_key, "error": str(e)})
 
+def finalize_run(run_at_utc, watch_count, channels_index, warnings, extra=None, sync_rels=None):
+    # index.json / watchlist_auto.txt / Shorts キャッシュ / manifest / site 同期（通常実行と --replay で共通）
+    # sync_rels を渡すと site にはそのパス（DATA_DIR からの相対）だけを出す
     channels_index.sort(key=lambda x: (x.get("max_anomaly_ratio", 0.0) or 0.0), reverse=True)
 
     index_obj = {
         "generated_at_utc": run_at_utc,
         "generator_version": GENERATOR_VERSION,
-        "watch_count": len(watch_run),
+        "watch_count": watch_count,
         "warnings": warnings,
         "channels": channels_index,
+        **(extra or {}),
+    }
+    with METRICS.stage("writes"):
+        write_json_if_changed(DATA_DIR / "index.json", index_obj)
+
+        auto = [ch["channel_id"] for ch in channels_index if (ch.get("sticky_red_count", 0) or 0) >= 3]
+        write_text_if_changed(WATCHLIST_AUTO, "\n".join(auto) + ("\n" if auto else ""))
+
+        if not OFFLINE:
+            save_shorts_cache()
+            save_channel_meta()
+        write_manifest(run_at_utc)
+
+    with METRICS.stage("site_sync"):
+        if sync_rels is None:
+            sync = sync_tree(DATA_DIR, SITE_DATA_DIR)
+        else:
+            sync = sync_paths(DATA_DIR, SITE_DATA_DIR, sync_rels)
+    print(
+        "site sync: copied {copied_files} files ({copied_bytes} bytes), "
+        "skipped {skipped_files} files ({skipped_bytes} bytes), removed {removed_files}".format(**sync)
+    )
+    return index_obj, sync
+
+
+def metrics_summary(m):
+    # index.json に載せる要約（詳細は heartbeat.json）
+    http = m["http"].values()
+    return {
+        "wall_sec": m["wall_sec"],
+        "quota_units": m["quota_units"],
+        "http_requests": sum(h["requests"] for h in http),
+        "http_retries": sum(h["retries"] for h in http),
+        "http_errors": sum(h["errors"] for h in http),
+        "shorts_cache_hit_rate": m["shorts_cache"]["hit_rate"],
+    }
+
+
+def write_heartbeat(run_at_utc, index_obj, sync, metrics=None, mode="weekly"):
+    # ★data/heartbeat.json：最後の実行の結果と計測（サイトには出さない）
+    if metrics is None:
+        metrics = {
+            **METRICS.export(),
+            "channels": {key: METRICS.export_channel(key) for key in sorted(METRICS.channels)},
+        }
+    write_json_if_changed(DATA_DIR / "heartbeat.json", {
+        "run_at_utc": run_at_utc,
+        "finished_at_utc": now_utc().isoformat(),
+        "generator_version": GENERATOR_VERSION,
+        "mode": mode,
+        "status": "partial" if index_obj.get("warnings") else "ok",
+        "watch_count": index_obj.get("watch_count", 0),
+        "channels_ok": len(index_obj.get("channels", [])),
+        "channels_failed": len(index_obj.get("warnings", [])),
+        "site_sync": sync,
+        "metrics": metrics,
+    })
+
+
+def replay_main(args):
+    """
+    ★--replay：保存済みの videos 生レスポンスから全チャンネルを再解析する（API/プローブ 0 回）。
+      対象は現在の index.json のチャンネル（無ければ生レスポンスのある全チャンネル）。
+      チャンネル単位でプロセス並列。各チャンネルの run_at は元の実行時刻を使うので結果は決定的。
+      全履歴モードのチャンネルは生レスポンスを持たないので index の行をそのまま引き継ぐ。
+    """
+    # メインプロセスもワーカーと同じくオフライン扱いにする（finalize_run がキャッシュを書き直さないように）
+    _replay_worker_init()
+    old_index = {}
+    if (DATA_DIR / "index.json").exists():
+        old_index = json.loads((DATA_DIR / "index.json").read_text(encoding="utf-8"))
+
+    rows = old_index.get("channels", [])
+    jobs = [
+        (ch["channel_id"], ch.get("watch_key") or ch["channel_id"], args)
+        for ch in rows if "full_history_videos" not in ch
+    ]
+    if not rows:
+        ch_root = DATA_DIR / "channels"
+        jobs = [(d.name, d.name, args) for d in sorted(ch_root.glob("*")) if (d / RAW_VIDEOS_NAME).exists()]
+
+    workers = int(args.replay_workers or 0) or (os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_replay_worker_init) as ex:
+        results = iter(list(ex.map(_replay_one, jobs)))
+
+    channels_index, warnings = [], []
+    for ch in rows or jobs:
+        entry, warn = (ch, None) if "full_history_videos" in ch else next(results)
+        if entry is not None:
+            channels_index.append(entry)
+        if warn is not None:
+            warnings.append(warn)
+
+    finalize_run(
+        old_index.get("generated_at_utc") or now_utc().isoformat(),
+        old_index.get("watch_count", len(jobs)),
+        channels_index,
+        warnings,
+        extra={"replayed_at_utc": now_utc().isoformat()},
+    )
+    print(f"replay done. channels={len(channels_index)}")
+    if warnings:
+        print("warnings:", warnings)
+
+
+def red_only_main(args):
+    """
+    ★--red-only：各チャンネルの state.json の red_top だけを videos.list(part=statistics) で取り直し、
+      latest.json のベースラインで比率/レベルを計算し直して latest_points.json / state.json / index.json を更新する。
+      ID は全チャンネル分をまとめて 50 件ずつ投げるので、クォータは ceil(追跡中の動画数 / 50) ユニット。
+      フィットも履歴の追記もしない（伸びは最後の週次 run との比較）。
+    """
+    global _LIMITER, _API, _IO_POOL
+
+    if not YT_API_KEY:
+        raise SystemExit("YT_API_KEY is required.")
+    index_path = DATA_DIR / "index.json"
+    if not index_path.exists():
+        raise SystemExit("--red-only needs data/index.json from a weekly run.")
+    old_index = json.loads(index_path.read_text(encoding="utf-8"))
+
+    concurrency = max(1, int(args.concurrency or 1))
+    _LIMITER = RateLimiter(qps=args.qps, daily_units=args.quota_units)
+    _API = YouTubeApiClient(_LIMITER, pool_size=max(YT_API_POOL_SIZE, concurrency * 2))
+
+    run_at = now_utc()
+    run_at_utc = run_at.isoformat()
+
+    tracked = []
+    for ent in old_index.get("channels", []):
+        ch_dir = DATA_DIR / "channels" / ent["channel_id"]
+        try:
+            pts_obj = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8"))
+            red_top = json.loads((ch_dir / "state.json").read_text(encoding="utf-8")).get("red_top", [])
+            baseline = json.loads((ch_dir / "latest.json").read_text(encoding="utf-8")).get("baseline", {})
+        except (OSError, ValueError):
+            tracked.append((ent, None))
+            continue
+        tracked.append((ent, (ch_dir, pts_obj, set(red_top), baseline)))
+
+    ids = list(dict.fromkeys(vid for _, t in tracked if t for vid in sorted(t[2])))
+    if concurrency > 1:
+        _IO_POOL = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="yt-io")
+    try:
+        stats = {v.get("id"): v.get("statistics", {}) for v in fetch_videos(ids, part=VIDEO_PARTS_STATS, fields=VIDEO_FIELDS_STATS)}
+    finally:
+        if _IO_POOL is not None:
+            _IO_POOL.shutdown(wait=True)
+            _IO_POOL = None
+
+    channels_index = []
+    refreshed = 0
+    for ent, t in tracked:
+        if t is None:
+            channels_index.append(ent)
+            continue
+        ch_dir, pts_obj, red_top, baseline = t
+        points = pts_obj.get("points", [])
+        hit = [p for p in points if p.get("video_id") in red_top and p.get("video_id") in stats]
+        for p in hit:
+            st = stats[p["video_id"]]
+            p["views"] = int(st.get("viewCount", 0) or 0)
+            p["likes"] = int(st.get("likeCount", 0) or 0)
+
+        with METRICS.stage("fit"):
+            rescore_points(hit, baseline, run_at)
+        with METRICS.stage("history"):
+            add_velocity_features(hit, HistoryStore(ch_dir / HISTORY_DIRNAME), int(run_at.timestamp()))
+        refreshed += len(hit)
+
+        with METRICS.stage("writes"):
+            write_json_if_changed(ch_dir / "latest_points.json", {
+                "run_at_utc": pts_obj.get("run_at_utc"),
+                "generator_version": GENERATOR_VERSION,
+                "red_refreshed_at_utc": run_at_utc,
+                "points": points,
+            })
+            write_points_columnar(ch_dir, points, pts_obj.get("run_at_utc"), with_gzip=args.points_gzip)
+            # red_top は間引き版にも必ず入っているので、取り直した分だけ差し替える
+            lod_names = sorted(ch_dir.glob(POINTS_LOD_PREFIX + "*.json"))
+            if hit and lod_names:
+                fresh = {p["video_id"]: p for p in hit}
+                lod = [fresh.get(p["video_id"], p) for p in read_points_hashed(lod_names[-1])]
+                write_points_lod(ch_dir, lod, pts_obj.get("run_at_utc"), with_gzip=args.points_gzip)
+        with METRICS.stage("state"):
+            st = update_state_and_red(points, ch_dir / "state.json")
+            if hit:
+                # points を書き換えたので、次の通常実行は入力が同じでも飛ばさずに解析し直す
+                memo = load_fit_memo(ch_dir)
+                if memo.get("inputs"):
+                    write_json_if_changed(ch_dir / FIT_MEMO_NAME, {**memo, "inputs": None}, profile="compact")
+        entry = index_entry(ent["channel_id"], ent.get("watch_key"), ent.get("title", ""), points, st)
+        if "full_history_videos" in ent:
+            # parts 側は判定し直さないので、全件での最大は前回の値も残す
+            entry["max_anomaly_ratio"] = float(max(entry["max_anomaly_ratio"], ent.get("max_anomaly_ratio") or 0.0))
+            entry["full_history_videos"] = ent["full_history_videos"]
+        channels_index.append(entry)
+
+    base_keys = ("generated_at_utc", "generator_version", "watch_count", "warnings", "channels")
+    index_obj, sync = finalize_run(
+        old_index.get("generated_at_utc") or run_at_utc,
+        old_index.get("watch_count", len(channels_index)),
+        channels_index,
+        old_index.get("warnings", []),
+        extra={**{k: v for k, v in old_index.items() if k not in base_keys}, "red_refreshed_at_utc": run_at_utc},
+    )
+    write_heartbeat(run_at_utc, index_obj, sync, mode="red_only")
+
+    print(f"red-only done. tracked={len(ids)} refreshed={refreshed} channels={len(channels_index)}")
+    print(f"quota units used: {_LIMITER.used_units}", _API.units_used())
+
+
+def process_ondemand(jobs, run_at, args):
+    """
+    ★--ondemand / --drain_queue 共通：jobs（(watch_key, そのチャンネル用の args) のリスト）だけを並列に解析する。
+    戻り値: jobs と同じ順の (entry, warn)
+    """
+    global _IO_POOL
+
+    def run_one(job):
+        watch_key, job_args = job
+        with METRICS.channel(watch_key):
+            try:
+                return process_channel(watch_key, run_at, job_args), None
+            except Exception as e:
+                return None, {"watch_key": watch_key, "error": str(e)}
+
+    concurrency = max(1, int(args.concurrency or 1))
+    if concurrency > 1:
+        _IO_POOL = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="yt-io")
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="yt-ch") as ex:
+                return list(ex.map(run_one, jobs))
+        finally:
+            _IO_POOL.shutdown(wait=True)
+            _IO_POOL = None
+    return [run_one(job) for job in jobs]
+
+
+def patch_index(jobs, results, run_at_utc, extra_rels=(), mode="ondemand"):
+    """
+    ★index.json の jobs のチャンネルの行だけを差し替える。他のチャンネルの行と警告はそのまま（並びは max_anomaly_ratio の降順）。
+      site/data にはそのチャンネルのディレクトリと index.json / manifest.json / watchlist（＋extra_rels）だけを出す。
+    """
+    old_index = {}
+    if (DATA_DIR / "index.json").exists():
+        old_index = json.loads((DATA_DIR / "index.json").read_text(encoding="utf-8"))
+
+    channels_index = list(old_index.get("channels", []))
+    warnings = list(old_index.get("warnings", []))
+    done = []
+    for (watch_key, _), (entry, warn) in zip(jobs, results):
+        # 同じチャンネルの行は（別の watch_key で登録されていても）差し替える。watch_key は既存の行のものを残す
+        cid = entry["channel_id"] if entry else cached_channel_id(watch_key)
+        rows = []
+        for ch in channels_index:
+            if ch.get("watch_key") == watch_key or (cid and ch.get("channel_id") == cid):
+                if entry is not None:
+                    entry["watch_key"] = ch.get("watch_key") or entry["watch_key"]
+                continue
+            rows.append(ch)
+        if entry is not None:
+            rows.append(entry)
+        channels_index = rows
+        warnings = [w for w in warnings if w.get("watch_key") != watch_key]
+        if warn is not None:
+            warnings.append(warn)
+        done.append({"watch_key": watch_key, "channel_id": cid})
+
+    base_keys = ("generated_at_utc", "generator_version", "watch_count", "warnings", "channels")
+    rels = ["index.json", MANIFEST.name, WATCHLIST.name, WATCHLIST_AUTO.name, *extra_rels]
+    rels += [f"channels/{d['channel_id']}" for d in done if d["channel_id"]]
+    index_obj, sync = finalize_run(
+        old_index.get("generated_at_utc") or run_at_utc,
+        old_index.get("watch_count", len(channels_index)),
+        channels_index,
+        warnings,
+        extra={
+            **{k: v for k, v in old_index.items() if k not in base_keys},
+            "ondemand": {"run_at_utc": run_at_utc, "channels": done},
+        },
+        sync_rels=rels,
+    )
+    write_heartbeat(run_at_utc, index_obj, sync, mode=mode)
+    return index_obj
+
+
+def ondemand_main(args):
+    """
+    ★--ondemand：--channel の1チャンネルだけを解析し、index.json のそのチャンネルの行だけを差し替える。
+    """
+    global _LIMITER, _API
+
+    if not YT_API_KEY:
+        raise SystemExit("YT_API_KEY is required.")
+    watch_key = (args.channel or "").strip()
+    if not watch_key:
+        raise SystemExit("--ondemand needs --channel.")
+
+    concurrency = max(1, int(args.concurrency or 1))
+    _LIMITER = RateLimiter(qps=args.qps, daily_units=args.quota_units)
+    _API = YouTubeApiClient(_LIMITER, pool_size=max(YT_API_POOL_SIZE, concurrency * 2))
+
+    run_at = now_utc()
+    ensure_dir(DATA_DIR / "channels")
+
+    jobs = [(watch_key, args)]
+    results = process_ondemand(jobs, run_at, args)
+    patch_index(jobs, results, run_at.isoformat())
+
+    entry, warn = results[0]
+    print(f"ondemand done. channel={entry['channel_id'] if entry else watch_key} ok={entry is not None}")
+    print(f"quota units used: {_LIMITER.used_units}", _API.units_used())
+    if warn is not None:
+        print("warnings:", [warn])
+
+
+def enqueue_main(args):
+    """
+    ★--enqueue：--channel をオンデマンドのキュー（data/ondemand_queue/<request_id>.json）に積むだけ（API は叩かない）。
+      1リクエスト1ファイルなので、同時に積んだ別々のコミットが git 上でぶつからない。
+    """
+    channel = (args.channel or "").strip()
+    if not channel:
+        raise SystemExit("--enqueue needs --channel.")
+    now = now_utc()
+    rid = (args.request_id or "").strip() or f"{now:%Y%m%dT%H%M%S}-{random.getrandbits(32):08x}"
+    if not ONDEMAND_REQUEST_ID_RE.fullmatch(rid):
+        raise SystemExit(f"invalid --request_id: {rid!r}")
+
+    path = ONDEMAND_QUEUE_DIR / f"{rid}.json"
+    if path.exists():
+        print(f"already queued: {rid}")
+        return
+    write_json_if_changed(path, {
+        "request_id": rid,
+        "channel": channel,
+        "auto_watch_red_top": int(args.auto_watch_red_top or 0),
+        "requested_at_utc": now.isoformat(),
+    })
+    print(f"queued: {rid} channel={channel}")
+
+
+def load_ondemand_queue():
+    # 積まれた順（requested_at_utc）に返す。読めないファイルは channel 無しのリクエストとして扱う（エラーで返して消す）
+    reqs = []
+    for path in sorted(ONDEMAND_QUEUE_DIR.glob("*.json")):
+        try:
+            req = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            req = {}
+        req.setdefault("request_id", path.stem)
+        reqs.append((path, req))
+    reqs.sort(key=lambda pr: (pr[1].get("requested_at_utc") or "", pr[1]["request_id"]))
+    return reqs
+
+
+def _seconds_between(a, b):
+    try:
+        return round((datetime.fromisoformat(b) - datetime.fromisoformat(a)).total_seconds(), 3)
+    except (TypeError, ValueError):
+        return None
+
+
+def drain_queue_main(args):
+    """
+    ★--drain_queue：オンデマンドのキューを1プロセスでまとめて処理する。
+      - 同じチャンネル（@handle と UC... の重複も含む）は1回だけ解析する
+      - index.json / watchlist.txt の更新と site 同期は最後に1回（--ondemand と同じ差し替え）
+      - リクエストごとの状態と待ち時間を data/ondemand_status.json に書く（サイトはこれをポーリングする）
+      - 処理したキューのファイルは消す
+    """
+    global _LIMITER, _API
+
+    queue = load_ondemand_queue()
+    if not queue:
+        print("ondemand queue is empty.")
+        return
+    if not YT_API_KEY:
+        raise SystemExit("YT_API_KEY is required.")
+
+    concurrency = max(1, int(args.concurrency or 1))
+    _LIMITER = RateLimiter(qps=args.qps, daily_units=args.quota_units)
+    _API = YouTubeApiClient(_LIMITER, pool_size=max(YT_API_POOL_SIZE, concurrency * 2))
+
+    run_at = now_utc()
+    run_at_utc = run_at.isoformat()
+    ensure_dir(DATA_DIR / "channels")
+
+    keys = list(dict.fromkeys((req.get("channel") or "").strip() for _, req in queue))
+    keys = [k for k in keys if k]
+    kept, dropped = dedupe_watch_keys(keys, concurrency)
+    alias = {w: k for w, k in dropped}
+
+    # 同じチャンネルを複数のリクエストが頼んだら、auto_watch_red_top は一番ゆるい（小さい正の）値を使う
+    thresholds = {}
+    for _, req in queue:
+        w = (req.get("channel") or "").strip()
+        t = int(req.get("auto_watch_red_top") or 0)
+        if w and t > 0:
+            k = alias.get(w, w)
+            thresholds[k] = min(thresholds.get(k, t), t)
+    jobs = [(w, argparse.Namespace(**{**vars(args), "auto_watch_red_top": thresholds.get(w, 0)})) for w in kept]
+    print(f"ondemand queue: {len(queue)} requests, {len(jobs)} channels")
+
+    results = dict(zip(kept, process_ondemand(jobs, run_at, args)))
+    finished_at_utc = now_utc().isoformat()
+
+    status = {}
+    if ONDEMAND_STATUS.exists():
+        try:
+            status = json.loads(ONDEMAND_STATUS.read_text(encoding="utf-8")).get("requests", {})
+        except ValueError:
+            status = {}
+    for path, req in queue:
+        w = (req.get("channel") or "").strip()
+        k = alias.get(w, w)
+        entry, warn = results.get(k, (None, {"error": "invalid request"}))
+        requested_at = req.get("requested_at_utc")
+        status[req["request_id"]] = {
+            "channel": w,
+            "status": "done" if entry is not None else "error",
+            "channel_id": entry["channel_id"] if entry else None,
+            "error": (warn or {}).get("error"),
+            "coalesced_with": k if k != w else None,
+            "requested_at_utc": requested_at,
+            "started_at_utc": run_at_utc,
+            "finished_at_utc": finished_at_utc,
+            "queue_wait_sec": _seconds_between(requested_at, run_at_utc),
+            "latency_sec": _seconds_between(requested_at, finished_at_utc),
+        }
+        path.unlink(missing_ok=True)
+
+    horizon = (run_at - timedelta(days=ONDEMAND_STATUS_KEEP_DAYS)).isoformat()
+    status = {rid: st for rid, st in status.items() if (st.get("finished_at_utc") or "") >= horizon}
+    write_json_if_changed(ONDEMAND_STATUS, {
+        "updated_at_utc": finished_at_utc,
+        "requests": dict(sorted(status.items(), key=lambda kv: kv[1].get("requested_at_utc") or "")),
+    })
+
+    patch_index(jobs, [results[w] for w in kept], run_at_utc, extra_rels=[ONDEMAND_STATUS.name], mode="ondemand_queue")
+
+    failed = [st for st in status.values() if st["finished_at_utc"] == finished_at_utc and st["status"] == "error"]
+    print(f"ondemand queue done. requests={len(queue)} channels={len(jobs)} failed={len(failed)}")
+    print(f"quota units used: {_LIMITER.used_units}", _API.units_used())
+
+
+def load_schedule():
+    if SCHEDULE_FILE.exists():
+        try:
+            return json.loads(SCHEDULE_FILE.read_text(encoding="utf-8"))
+        except ValueError:
+            pass
+    return {"ledger": {}, "channels": {}}
+
+
+def schedule_tier(sticky_red_count, max_anomaly_ratio, uploads_per_week):
+    if sticky_red_count >= 3 or max_anomaly_ratio >= NAT_BIG_RATIO:
+        return "hot"
+    if sticky_red_count >= 1 or max_anomaly_ratio >= NAT_UPPER_RATIO or uploads_per_week >= SCHEDULE_BUSY_UPLOADS_PER_WEEK:
+        return "warm"
+    if uploads_per_week >= 1:
+        return "cool"
+    return "cold"
+
+
+def estimate_channel_units(watch_key, ent, run_at, incremental):
+    """
+    ★1チャンネル分のクォータを使う前に見積もる（YT_QUOTA_COST ベース、リトライは含まない）。
+      全件: channels + playlistItems ページ数 + videos バッチ数（全履歴モードは常にこちら）
+      差分: channels + 1ページ + 新着バッチ 1 + 既知動画の statistics バッチ数
+    """
+    cost = YT_QUOTA_COST.get("channels", 1)
+    if cached_channel_id(watch_key) is None:
+        cost += YT_QUOTA_COST.get("channels", 1)  # forHandle の解決
+    full_history = bool(ent.get("full_history"))
+    n = min(int(ent.get("videos") or MAX_VIDEOS), FULL_HISTORY_MAX_VIDEOS if full_history else MAX_VIDEOS)
+    batches = max(1, math.ceil(n / 50))
+    full_at = ent.get("full_fetch_at_utc")
+    fresh = bool(full_at) and (run_at - datetime.fromisoformat(full_at)).total_seconds() < INCREMENTAL_FULL_REFRESH_DAYS * 86400
+    if incremental and fresh and not full_history:
+        cost += YT_QUOTA_COST.get("playlistItems", 1) + YT_QUOTA_COST.get("videos", 1) * (1 + batches)
+    else:
+        cost += YT_QUOTA_COST.get("playlistItems", 1) * batches + YT_QUOTA_COST.get("videos", 1) * batches
+    return cost
+
+
+def plan_batch(watch_run, schedule, run_at, budget_units, incremental, always=()):
+    """
+    ★今回回すチャンネルを選ぶ。
+      - 期限（next_due_utc）が来たものだけが候補。未実行のチャンネルは最優先
+      - 期限切れの度合い（超過日数 / 更新間隔）が大きい順に、見積もりの合計が budget_units に収まるだけ
+      - always（--channel）は予算に関係なく入れる
+    戻り値: (選んだ watch_key の set, 計画の明細 list)
+    """
+    chans = schedule.get("channels", {})
+    cands = []
+    for pos, w in enumerate(watch_run):
+        ent = chans.get(w, {})
+        est = estimate_channel_units(w, ent, run_at, incremental)
+        due = ent.get("next_due_utc")
+        if w in always or not ent.get("last_run_at_utc"):
+            urgency = math.inf
+        elif due and datetime.fromisoformat(due) <= run_at:
+            interval = SCHEDULE_TIERS.get(ent.get("tier"), SCHEDULE_TIERS["cold"])
+            urgency = (run_at - datetime.fromisoformat(due)).total_seconds() / 86400 / interval
+        else:
+            continue
+        cands.append((urgency, pos, w, est))
+    cands.sort(key=lambda c: (-c[0], c[1]))
+
+    chosen, plan, spent = set(), [], 0
+    for urgency, pos, w, est in cands:
+        take = w in always or spent + est <= budget_units
+        if take:
+            chosen.add(w)
+            spent += est
+        plan.append({
+            "watch_key": w,
+            "tier": chans.get(w, {}).get("tier"),
+            "estimated_units": est,
+            "urgency": None if math.isinf(urgency) else round(urgency, 3),
+            "selected": take,
+        })
+    return chosen, plan
+
+
+def update_schedule(schedule, watch_run, jobs, results, run_at, carried=None):
+    # 実行したチャンネルの最終実行/コスト/ティア/次回期限を更新する。失敗は SCHEDULE_FAIL_RETRY_DAYS 後に再試行
+    # carried: --resume で前のプロセスが済ませたチャンネルのクォータ（このプロセスの計測には載っていない）
+    carried = carried or {}
+    chans = schedule.setdefault("channels", {})
+    for w in [w for w in chans if w not in watch_run]:  # watchlist から外れたもの
+        del chans[w]
+    run_at_utc = run_at.isoformat()
+    for (_, w), (entry, warn) in zip(jobs, results):
+        ent = chans.setdefault(w, {})
+        m = METRICS.export_channel(w)
+        ent["last_run_at_utc"] = run_at_utc
+        ent["last_cost_units"] = carried.get(w, m["quota_units"])
+        if entry is None:
+            ent["last_error"] = (warn or {}).get("error")
+            ent["next_due_utc"] = (run_at + timedelta(days=SCHEDULE_FAIL_RETRY_DAYS)).isoformat()
+            continue
+        ent.pop("last_error", None)
+        ch_dir = DATA_DIR / "channels" / entry["channel_id"]
+        try:
+            pts = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8")).get("points", [])
+            pli = json.loads((ch_dir / "latest_500_playlistItems.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pts, pli = [], {}
+        recent = sum(1 for p in pts if (p.get("days") or 0) <= SCHEDULE_UPLOAD_WINDOW_DAYS)
+        uploads = recent / (SCHEDULE_UPLOAD_WINDOW_DAYS / 7.0)
+        tier = schedule_tier(entry.get("sticky_red_count", 0), entry.get("max_anomaly_ratio", 0.0) or 0.0, uploads)
+        ent.update({
+            "channel_id": entry["channel_id"],
+            "tier": tier,
+            "videos": entry.get("full_history_videos") or len(pts),
+            "full_history": "full_history_videos" in entry,
+            "uploads_per_week": round(uploads, 2),
+            "full_fetch_at_utc": pli.get("full_fetch_at_utc"),
+            "next_due_utc": (run_at + timedelta(days=SCHEDULE_TIERS[tier])).isoformat(),
+        })
+
+    day = run_at.date().isoformat()
+    ledger = schedule.setdefault("ledger", {})
+    ledger[day] = ledger.get(day, 0) + METRICS.export()["quota_units"] + sum(carried.values())
+    for d in sorted(ledger)[:-7]:  # 1週間分だけ残す
+        del ledger[d]
+
+
+def parse_shard(v):
+    # "i/N"（0 <= i < N）
+    try:
+        i, n = (int(x) for x in v.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard expects i/N, got {v!r}")
+    if not (n >= 1 and 0 <= i < n):
+        raise argparse.ArgumentTypeError(f"--shard expects 0 <= i < N, got {v!r}")
+    return i, n
+
+
+def shard_of(watch_key, n):
+    """
+    ★watch_key の担当シャード（安定ハッシュ。実行環境や watchlist の並びに依存しない）。
+      UC... はチャンネルIDそのもの、@handle は解決に API が要るので小文字のハンドルで分ける。
+    """
+    key = (watch_key or "").strip()
+    if not key.startswith("UC"):
+        key = "@" + key.lstrip("@").lower()
+    return int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:16], 16) % n
+
+
+def shard_paths(i, n):
+    d = DATA_DIR / SHARDS_DIRNAME
+    return d / f"index.{i}-of-{n}.json", d / f"shorts_cache.{i}-of-{n}.json", d / f"channel_meta.{i}-of-{n}.json"
+
+
+def write_shard_fragment(shard, run_at_utc, watch_count, dropped, rows):
+    """
+    ★--shard の出力：自分の担当分の index 行（watch_run 全体での位置つき）と Shorts / メタデータのキャッシュ。
+      index.json / watchlist_auto.txt / manifest / site は触らない（--merge でまとめて作る）。
+      watch_count は重複をまとめる前の watch_run 全体の件数、dropped は自分の担当分でまとめた件数。
+    """
+    i, n = shard
+    frag_path, cache_path, meta_path = shard_paths(i, n)
+    write_json_if_changed(frag_path, {
+        "run_at_utc": run_at_utc,
+        "generator_version": GENERATOR_VERSION,
+        "shard": [i, n],
+        "watch_count": watch_count,
+        "dropped": dropped,
+        "rows": [{"pos": pos, "entry": entry, "warning": warn} for pos, entry, warn in rows],
+        "metrics": METRICS.export(),
+    })
+    save_shorts_cache(cache_path)
+    save_channel_meta(meta_path)
+
+
+def merge_main(args):
+    """
+    ★--merge：--shard i/N の断片を index.json / watchlist_auto.txt にまとめる。
+      行は watch_run 全体での位置に戻してから並べ替えるので、1プロセスで回したときと同じ順序・内容になる。
+    """
+    frags = {}
+    for path in sorted((DATA_DIR / SHARDS_DIRNAME).glob("index.*-of-*.json")):
+        frag = json.loads(path.read_text(encoding="utf-8"))
+        frags[tuple(frag["shard"])] = (path, frag)
+    if not frags:
+        raise SystemExit(f"no shard fragments in {DATA_DIR / SHARDS_DIRNAME}")
+
+    counts = {n for _, n in frags}
+    if len(counts) != 1:
+        raise SystemExit(f"shard fragments disagree on N: {sorted(counts)}")
+    n = counts.pop()
+    missing = [i for i in range(n) if (i, n) not in frags]
+    if missing:
+        raise SystemExit(f"missing shard fragments: {[f'{i}/{n}' for i in missing]}")
+
+    rows = sorted((r for _, frag in frags.values() for r in frag["rows"]), key=lambda r: r["pos"])
+    # シャードをまたぐ重複（@handle と UC... が別シャードに分かれたもの）は watch_run で先の方を残す
+    channels_index, seen, cross = [], set(), 0
+    for r in rows:
+        entry = r.get("entry")
+        if entry is None:
+            continue
+        if entry["channel_id"] in seen:
+            print(f"[dedupe] {entry.get('watch_key')} is the same channel as an earlier shard row, skipped")
+            cross += 1
+            continue
+        seen.add(entry["channel_id"])
+        channels_index.append(entry)
+    warnings = [r["warning"] for r in rows if r.get("warning") is not None]
+    run_at_utc = max(frag["run_at_utc"] for _, frag in frags.values())
+    watch_count = max(frag["watch_count"] for _, frag in frags.values())
+    watch_count -= sum(frag.get("dropped", 0) for _, frag in frags.values()) + cross
+
+    for i in range(n):
+        _, cache_path, meta_path = shard_paths(i, n)
+        if cache_path.exists():
+            merge_shorts_cache(cache_path)
+        if meta_path.exists():
+            merge_channel_meta(meta_path)
+
+    shard_metrics = [frags[(i, n)][1].get("metrics") or {} for i in range(n)]
+    summary = {
+        "wall_sec": max((m.get("wall_sec", 0.0) for m in shard_metrics), default=0.0),
+        "quota_units": sum(m.get("quota_units", 0) for m in shard_metrics),
+        "http_requests": sum(h["requests"] for m in shard_metrics for h in m.get("http", {}).values()),
+        "http_retries": sum(h["retries"] for m in shard_metrics for h in m.get("http", {}).values()),
+        "http_errors": sum(h["errors"] for m in shard_metrics for h in m.get("http", {}).values()),
+        "shards": n,
     }
-    (DATA_DIR / "index.json").write_text(dumps_json(index_obj), encoding="utf-8")
+    index_obj, sync = finalize_run(run_at_utc, watch_count, channels_index, warnings, extra={"metrics": summary})
+    write_heartbeat(run_at_utc, index_obj, sync, metrics={**summary, "shards": shard_metrics}, mode="merge")
+
+    for i in range(n):
+        for path in shard_paths(i, n):
+            path.unlink(missing_ok=True)
+    print(f"merge done. shards={n} channels={len(channels_index)}")
+    if warnings:
+        print("warnings:", warnings)
+
+
+def run_profiled(kind, out, fn):
+    """
+    ★--profile：実行全体をプロファイルする（どちらもメインスレッドのみ。全体を見るなら --concurrency 1）。
+      - cprofile   : out に pstats 形式で保存し、累積時間の上位を表示
+      - pyinstrument: out に HTML で保存し、テキストのツリーを表示（pip install pyinstrument）
+    """
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise SystemExit("--profile pyinstrument needs pyinstrument (pip install pyinstrument)") from e
+        prof = Profiler()
+        prof.start()
+        try:
+            return fn()
+        finally:
+            prof.stop()
+            Path(out or "weekly_profile.html").write_text(prof.output_html(), encoding="utf-8")
+            print(prof.output_text(unicode=True))
+
+    import cProfile, pstats
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        return fn()
+    finally:
+        prof.disable()
+        prof.dump_stats(out or "weekly_profile.prof")
+        pstats.Stats(prof).sort_stats("cumulative").print_stats(30)
+
+
+def main():
+    global QUANTREG_BACKEND, JSON_STRICT, METRICS
+
+    args = parse_args()
+    QUANTREG_BACKEND = args.quantreg_backend
+    JSON_STRICT = args.json_strict
+    METRICS = RunMetrics()
+
+    if args.replay:
+        fn = replay_main
+    elif args.merge:
+        fn = merge_main
+    elif args.enqueue:
+        fn = enqueue_main
+    elif args.drain_queue:
+        fn = drain_queue_main
+    elif args.ondemand:
+        fn = ondemand_main
+    elif args.red_only:
+        fn = red_only_main
+    else:
+        fn = run_weekly
+    if args.profile:
+        return run_profiled(args.profile, args.profile_out, lambda: fn(args))
+    return fn(args)
 
-    auto = [ch["channel_id"] for ch in channels_index if (ch.get("sticky_red_count", 0) or 0) >= 3]
-    WATCHLIST_AUTO.write_text("\n".join(auto) + ("\n" if auto else ""), encoding="utf-8")
 
-    ensure_dir(SITE_DATA_DIR)
-    copy_tree(DATA_DIR, SITE_DATA_DIR)
+def run_weekly(args):
+    global _LIMITER, _API, _IO_POOL
 
-    print("weekly done.")
+    if not YT_API_KEY:
+        raise SystemExit("YT_API_KEY is required.")
+    if args.shard and args.auto_watch_red_top:
+        # 各シャードが別々のチェックアウトで watchlist.txt を書き換えると合流できない
+        raise SystemExit("--auto_watch_red_top cannot be combined with --shard.")
+    if args.shard and args.scheduled:
+        raise SystemExit("--scheduled cannot be combined with --shard.")
+
+    concurrency = max(1, int(args.concurrency or 1))
+    _LIMITER = RateLimiter(qps=args.qps, daily_units=args.quota_units)
+    _API = YouTubeApiClient(_LIMITER, pool_size=max(YT_API_POOL_SIZE, concurrency * 2))
+
+    # ★--resume：期限内のジャーナルがあればその run の続き（run_at も引き継ぐ）。無ければ新しい run
+    journal = RunJournal.resume(RUN_JOURNAL, now_utc()) if args.resume else None
+    if journal:
+        run_at = datetime.fromisoformat(journal.run_at_utc)
+        written = sum(1 for row in journal.stages.values() if row["stage"] == "written")
+        print(f"resume: run {journal.run_id} ({journal.run_at_utc}), {written} channels already written")
+    else:
+        if args.resume:
+            print("resume: no run journal within the window, starting a new run")
+        run_at = now_utc()
+        journal = RunJournal.start(RUN_JOURNAL, run_at)
+    run_at_utc = run_at.isoformat()
+
+    ensure_dir(DATA_DIR / "channels")
+
+    watch = read_watchlist()
+
+    extra = (args.channel or "").strip()
+    if extra:
+        watch_run = [extra] + [w for w in watch if w != extra]
+    else:
+        watch_run = list(watch)
+
+    watch_run = list(dict.fromkeys(watch_run))
+    watch_total = len(watch_run)
+
+    # ★--shard i/N：自分の担当分だけ回す（位置は watch_run 全体のものを持ち回る）
+    jobs = list(enumerate(watch_run))
+    if args.shard:
+        jobs = [(pos, w) for pos, w in jobs if shard_of(w, args.shard[1]) == args.shard[0]]
+
+    # 同じチャンネルの重複をまとめるのは回す分だけ（シャードごとに全ハンドルを解決しない）。
+    # シャードをまたぐ重複は --merge で落とす
+    units_before = _LIMITER.used_units
+    _, dropped = dedupe_watch_keys([w for _, w in jobs], concurrency)
+    resolve_units = _LIMITER.used_units - units_before  # --scheduled の予算から先に引く
+    for w, kept in dropped:
+        print(f"[dedupe] {w} is the same channel as {kept}, skipped")
+    if dropped:
+        gone = {w for w, _ in dropped}
+        jobs = [(pos, w) for pos, w in jobs if w not in gone]
+        watch_run = [w for w in watch_run if w not in gone]
+
+    # ★--scheduled：期限の来たチャンネルだけを今日の残り予算の範囲で回す
+    if args.scheduled:
+        schedule = load_schedule()
+        spent_today = schedule.get("ledger", {}).get(run_at.date().isoformat(), 0)
+        budget = int(args.daily_budget_units) - int(spent_today)
+        if args.batch_units and int(args.batch_units) > 0:
+            budget = min(budget, int(args.batch_units))
+        # 重複まとめのハンドル解決は全チャンネル分を済ませてあるので、その分を引いた残りで選ぶ（台帳には METRICS の合計で載る）
+        budget = max(0, budget - resolve_units)
+        chosen, plan = plan_batch(watch_run, schedule, run_at, budget, args.incremental, always=[extra] if extra else ())
+        jobs = [(pos, w) for pos, w in jobs if w in chosen]
+        est = sum(p["estimated_units"] for p in plan if p["selected"])
+        print(
+            f"scheduled: {len(jobs)}/{len(watch_run)} channels, due {len(plan)}, "
+            f"estimated {est} units of {budget} (spent today {spent_today}, resolve {resolve_units})"
+        )
+
+    carried = {}  # --resume で前のプロセスが済ませたチャンネル -> そのときのクォータ（スケジューラの記録用）
+
+    def run_one(watch_key):
+        row = journal.last(watch_key)
+        if row and row["stage"] == "written":
+            carried[watch_key] = int(row.get("quota_units") or 0)
+            return row["entry"], None
+        with METRICS.channel(watch_key):
+            try:
+                entry = process_channel(watch_key, run_at, args, journal)
+                journal.record(
+                    watch_key, "written",
+                    channel_id=entry["channel_id"], quota_units=METRICS.export_channel(watch_key)["quota_units"], entry=entry,
+                )
+            except Exception as e:
+                journal.record(watch_key, "failed", error=str(e))
+                return None, {"watch_key": watch_key, "error": str(e)}
+        return entry, None
+
+    # ★チャンネル単位で並列実行。結果は watch_run の順で集めるので index.json の順序は逐次実行と同じ
+    # キャッシュの途中保存（journal.checkpoint）はワーカーではなくこのスレッドだけが、チャンネルが終わるたびに呼ぶ
+    if concurrency > 1:
+        _IO_POOL = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="yt-io")
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="yt-ch") as ex:
+                futures = [ex.submit(run_one, w) for _, w in jobs]
+                for _ in as_completed(futures):
+                    journal.checkpoint()
+                results = [f.result() for f in futures]
+        finally:
+            _IO_POOL.shutdown(wait=True)
+            _IO_POOL = None
+    else:
+        results = []
+        for _, w in jobs:
+            results.append(run_one(w))
+            journal.checkpoint()
+
+    channels_index = [entry for entry, _ in results if entry is not None]
+    warnings = [warn for _, warn in results if warn is not None]
+
+    if args.scheduled:
+        update_schedule(schedule, watch_run, jobs, results, run_at, carried)
+        schedule["last_plan"] = {"run_at_utc": run_at_utc, "budget_units": budget, "channels": plan}
+        write_json_if_changed(SCHEDULE_FILE, schedule)
+        # 今回回さなかったチャンネルは前回の index の行をそのまま使う（並びは全件実行と同じ規則）
+        old_index = {}
+        if (DATA_DIR / "index.json").exists():
+            old_index = json.loads((DATA_DIR / "index.json").read_text(encoding="utf-8"))
+        old_rows = {ch.get("watch_key"): ch for ch in old_index.get("channels", [])}
+        fresh = {w: (entry, warn) for (_, w), (entry, warn) in zip(jobs, results)}
+        channels_index, warnings = [], []
+        for w in watch_run:
+            entry, warn = fresh.get(w, (old_rows.get(w), None))
+            if entry is not None:
+                channels_index.append(entry)
+            if warn is not None:
+                warnings.append(warn)
+
+    if args.shard:
+        write_shard_fragment(
+            args.shard, run_at_utc, watch_total, len(dropped),
+            [(pos, entry, warn) for (pos, _), (entry, warn) in zip(jobs, results)],
+        )
+        print(f"shard {args.shard[0]}/{args.shard[1]} done. channels={len(channels_index)}/{len(jobs)}")
+    else:
+        extra_index = {"metrics": metrics_summary(METRICS.export())}
+        if args.scheduled:
+            extra_index["schedule"] = {
+                "refreshed": [w for _, w in jobs],
+                "due": len(plan),
+                "budget_units": budget,
+            }
+        index_obj, sync = finalize_run(run_at_utc, len(watch_run), channels_index, warnings, extra=extra_index)
+        write_heartbeat(run_at_utc, index_obj, sync, mode="scheduled" if args.scheduled else "weekly")
+        print("weekly done.")
+    print(f"quota units used: {_LIMITER.used_units}", _API.units_used())
+    stages = METRICS.export()["stages"]
+    print("stages:", ", ".join(f"{k}={v['sec']:.2f}s" for k, v in sorted(stages.items(), key=lambda kv: -kv[1]["sec"])))
     if warnings:
         print("warnings:", warnings)
 
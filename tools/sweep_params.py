@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+検出パラメータのスイープ（全チャンネルの points を一度だけ配列に読み込み、組み合わせをまとめて評価する）。
+
+  python tools/sweep_params.py [--nat_quantile 0.5,0.6,0.7] [--nat_buzz_top_pct 90,95,99]
+      [--likes_mid_views_pct 70,80,90] [--nat_upper 2,3,4] [--nat_big 6,10,15]
+      [--likes_suspect 2,3,4] [--likes_big 6,10,15] [--workers 0] [--out sweep.json] [--top 20]
+
+- 入力は各チャンネルの latest_points.json（days/views/likes/isShort は前回の実行時点の値）と state.json の sticky_red
+- フィットが変わるのは NAT_QUANTILE / NAT_BUZZ_TOP_PCT（NAT）と LIKES_MID_VIEWS_PCT（LIKES）だけ
+  - NAT は (分位点, マスク) ごとに1回、全チャンネルを quantreg_1d_batch でまとめて解く（この単位でプロセス並列）
+  - LIKES は最小二乗なのでマスクごとに親プロセスで先に当てておく
+- しきい値（NAT_UPPER/BIG_RATIO, LIKES_SUSPECT/BIG_RATIO）の組み合わせは (組み合わせ数 x 動画数) の配列で一度に判定する
+- 組み合わせごとに RED/△ の数、RED のあるチャンネル数、sticky への新規追加数（churn）、
+  現在のラベルとの一致率と RED の Jaccard を出す（現在のパラメータの行は一致率 1.0 になるはず）
+"""
+import argparse, itertools, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import run_weekly as rw  # noqa: E402
+
+LABEL_CODES = {"RED": rw.LEVEL_RED, "△": rw.LEVEL_WARN}
+SORT_KEYS = ("red", "warn", "sticky_new", "label_agreement", "red_jaccard", "channels_with_red")
+
+
+# ============================
+# 入力
+# ============================
+def load_points(data_dir: Path):
+    index_path = data_dir / "index.json"
+    if index_path.exists():
+        cids = [ch["channel_id"] for ch in json.loads(index_path.read_text(encoding="utf-8")).get("channels", [])]
+    else:
+        cids = sorted(p.name for p in (data_dir / "channels").iterdir() if (p / "latest_points.json").exists())
+
+    cols = {k: [] for k in ("days", "views", "likes", "isShort", "label", "sticky")}
+    offsets = [0]
+    kept = []
+    for cid in cids:
+        ch_dir = data_dir / "channels" / cid
+        try:
+            points = json.loads((ch_dir / "latest_points.json").read_text(encoding="utf-8")).get("points", [])
+        except (OSError, ValueError):
+            continue
+        try:
+            sticky = set(json.loads((ch_dir / "state.json").read_text(encoding="utf-8")).get("sticky_red", []))
+        except (OSError, ValueError):
+            sticky = set()
+        for p in points:
+            cols["days"].append(float(p.get("days") or 1.0))
+            cols["views"].append(int(p.get("views") or 0))
+            cols["likes"].append(int(p.get("likes") or 0))
+            cols["isShort"].append(bool(p.get("isShort")))
+            cols["label"].append(LABEL_CODES.get(p.get("display_label"), rw.LEVEL_OK))
+            cols["sticky"].append(p.get("video_id") in sticky)
+        offsets.append(offsets[-1] + len(points))
+        kept.append(cid)
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return {
+        "channels": kept,
+        "offsets": offsets,
+        "ch": np.repeat(np.arange(len(kept)), np.diff(offsets)),
+        "days": np.asarray(cols["days"], dtype=float),
+        "views": np.asarray(cols["views"], dtype=float),
+        "likes": np.asarray(cols["likes"], dtype=float),
+        "isShort": np.asarray(cols["isShort"], dtype=bool),
+        "label": np.asarray(cols["label"], dtype=np.int8),
+        "sticky": np.asarray(cols["sticky"], dtype=bool),
+    }
+
+
+def _segments(D):
+    return zip(D["offsets"][:-1].tolist(), D["offsets"][1:].tolist())
+
+
+# ============================
+# フィット（fit_columns と同じマスク）
+# ============================
+def fit_nat_all(D, q, buzz_pct):
+    xs, ys = [], []
+    for lo, hi in _segments(D):
+        t, vf = D["days"][lo:hi], D["views"][lo:hi]
+        fit = np.ones(hi - lo, dtype=bool)
+        if rw.RECENT_DAYS_EXCLUDE and rw.RECENT_DAYS_EXCLUDE > 0:
+            fit &= t >= float(rw.RECENT_DAYS_EXCLUDE)
+        if fit.any() and buzz_pct and 0 < buzz_pct < 100:
+            fit &= vf <= float(np.percentile(vf[fit], buzz_pct))
+        xs.append(t[fit])
+        ys.append(np.log(np.clip(vf[fit], 1.0, None)))
+    return rw.quantreg_1d_batch(xs, ys, q)
+
+
+def fit_likes_all(D, mid_pct):
+    n_ch = len(D["channels"])
+    b0 = np.full(n_ch, np.nan)
+    b1 = np.full(n_ch, np.nan)
+    for k, (lo, hi) in enumerate(_segments(D)):
+        vf, lf, short = D["views"][lo:hi], D["likes"][lo:hi], D["isShort"][lo:hi]
+        like_ok = ~short if rw.EXCLUDE_SHORTS else np.ones(hi - lo, dtype=bool)
+        fit2 = like_ok & (lf >= 1.0) & (vf >= float(rw.LIKES_GOOD_VIEWS_MIN))
+        if fit2.any() and mid_pct and 0 < mid_pct < 100:
+            fit2 &= vf <= float(np.percentile(vf[fit2], mid_pct))
+        if not fit2.any():
+            continue
+        logL = np.log(lf[fit2])
+        A2 = np.vstack([logL, np.ones_like(logL)]).T
+        b1[k], b0[k] = np.linalg.lstsq(A2, np.log(np.clip(vf[fit2], 1.0, None)), rcond=None)[0]
+    return b0, b1
+
+
+# ============================
+# しきい値の組み合わせをまとめて判定
+# ============================
+def evaluate(D, a, b, b0, b1, thresholds):
+    """
+    thresholds: (T, 4) の [nat_upper, nat_big, likes_suspect, likes_big]
+    戻り値: 指標名 -> (T,) の配列
+    """
+    ch, t, vf, lf = D["ch"], D["days"], D["views"], D["likes"]
+    with np.errstate(invalid="ignore", over="ignore"):
+        ratio_nat = vf / np.clip(np.exp(a[ch] + b[ch] * t), 1.0, None)
+        like_ok = (~D["isShort"] if rw.EXCLUDE_SHORTS else np.ones(len(t), dtype=bool)) & np.isfinite(b0[ch] + b1[ch])
+        ratio_like = np.where(like_ok, vf / np.clip(np.exp(b0[ch] + b1[ch] * np.log(np.clip(lf, 1.0, None))), 1.0, None), np.nan)
+
+        th = thresholds[:, :, None]
+        red = (ratio_nat >= th[:, 1]) | (ratio_like >= th[:, 3])
+        warn = ~red & ((ratio_nat >= th[:, 0]) | (ratio_like >= th[:, 2]))
+
+    code = red * rw.LEVEL_RED + warn * rw.LEVEL_WARN
+    cur_red = D["label"] == rw.LEVEL_RED
+    inter = (red & cur_red).sum(axis=1)
+    union = (red | cur_red).sum(axis=1)
+    starts = D["offsets"][:-1]
+    return {
+        "red": red.sum(axis=1),
+        "warn": warn.sum(axis=1),
+        "channels_with_red": (np.add.reduceat(red, starts, axis=1) > 0).sum(axis=1) if len(starts) else np.zeros(len(th), int),
+        "sticky_new": (red & ~D["sticky"]).sum(axis=1),
+        "label_agreement": (code == D["label"]).mean(axis=1),
+        "red_jaccard": np.where(union > 0, inter / np.maximum(union, 1), 1.0),
+    }
+
+
+# ============================
+# 並列実行（NAT の (分位点, マスク) 単位）
+# ============================
+_W = {}
+
+
+def _worker_init(D, likes_fits, thresholds):
+    _W.update(D=D, likes_fits=likes_fits, thresholds=thresholds)
+
+
+def _run_nat(job):
+    q, buzz = job
+    D, thresholds = _W["D"], _W["thresholds"]
+    a, b = fit_nat_all(D, q, buzz)
+    rows = []
+    for mid, (b0, b1) in _W["likes_fits"].items():
+        m = evaluate(D, a, b, b0, b1, thresholds)
+        for k, (up, big, sus, lbig) in enumerate(thresholds.tolist()):
+            rows.append({
+                "params": {
+                    "NAT_QUANTILE": q,
+                    "NAT_BUZZ_TOP_PCT": buzz,
+                    "LIKES_MID_VIEWS_PCT": mid,
+                    "NAT_UPPER_RATIO": up,
+                    "NAT_BIG_RATIO": big,
+                    "LIKES_SUSPECT_RATIO": sus,
+                    "LIKES_BIG_RATIO": lbig,
+                },
+                **{name: v[k].item() for name, v in m.items()},
+            })
+    return rows
+
+
+def floats(s):
+    return [float(x) for x in s.split(",") if x.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Vectorized sweep over the detection parameters of tools/run_weekly.py")
+    ap.add_argument("--data_dir", default=str(rw.DATA_DIR), help="data/ directory with index.json and channels/.")
+    ap.add_argument("--nat_quantile", type=floats, default=[0.5, 0.55, 0.6, 0.65, 0.7])
+    ap.add_argument("--nat_buzz_top_pct", type=floats, default=[90, 95, 99])
+    ap.add_argument("--likes_mid_views_pct", type=floats, default=[70, 80, 90])
+    ap.add_argument("--nat_upper", type=floats, default=[2.0, 3.0, 4.0])
+    ap.add_argument("--nat_big", type=floats, default=[6.0, 10.0, 15.0])
+    ap.add_argument("--likes_suspect", type=floats, default=[2.0, 3.0, 4.0])
+    ap.add_argument("--likes_big", type=floats, default=[6.0, 10.0, 15.0])
+    ap.add_argument("--workers", type=int, default=0, help="Processes for the NAT fits (0 = CPU count).")
+    ap.add_argument("--sort", default="label_agreement", choices=SORT_KEYS, help="Sort key of the printed table (descending).")
+    ap.add_argument("--top", type=int, default=20, help="Rows of the printed table.")
+    ap.add_argument("--out", default="", help="Write all rows as JSON here instead of stdout.")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    D = load_points(Path(args.data_dir))
+    if not len(D["days"]):
+        raise SystemExit(f"no points under {args.data_dir}")
+    t_load = time.perf_counter() - t0
+
+    thresholds = np.array([
+        th for th in itertools.product(args.nat_upper, args.nat_big, args.likes_suspect, args.likes_big)
+        if th[0] < th[1] and th[2] < th[3]
+    ], dtype=float).reshape(-1, 4)
+    likes_fits = {mid: fit_likes_all(D, mid) for mid in args.likes_mid_views_pct}
+    jobs = list(itertools.product(args.nat_quantile, args.nat_buzz_top_pct))
+    n_combos = len(jobs) * len(likes_fits) * len(thresholds)
+
+    workers = min(len(jobs), int(args.workers or 0) or (os.cpu_count() or 1))
+    t1 = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(D, likes_fits, thresholds)) as ex:
+            rows = [r for chunk in ex.map(_run_nat, jobs) for r in chunk]
+    else:
+        _worker_init(D, likes_fits, thresholds)
+        rows = [r for job in jobs for r in _run_nat(job)]
+    t_eval = time.perf_counter() - t1
+
+    current = {
+        "NAT_QUANTILE": rw.NAT_QUANTILE, "NAT_BUZZ_TOP_PCT": rw.NAT_BUZZ_TOP_PCT, "LIKES_MID_VIEWS_PCT": rw.LIKES_MID_VIEWS_PCT,
+        "NAT_UPPER_RATIO": rw.NAT_UPPER_RATIO, "NAT_BIG_RATIO": rw.NAT_BIG_RATIO,
+        "LIKES_SUSPECT_RATIO": rw.LIKES_SUSPECT_RATIO, "LIKES_BIG_RATIO": rw.LIKES_BIG_RATIO,
+    }
+    for r in rows:
+        r["current"] = all(float(r["params"][k]) == float(v) for k, v in current.items())
+
+    print(
+        f"{len(D['channels'])} channels, {len(D['days'])} points, {n_combos} combinations "
+        f"({len(jobs)} NAT fits x {len(likes_fits)} LIKES fits x {len(thresholds)} thresholds), "
+        f"workers={workers}, load {t_load:.2f}s, sweep {t_eval:.2f}s",
+        file=sys.stderr,
+    )
+    def show(r):
+        p = r["params"]
+        print(
+            f"{p['NAT_QUANTILE']:>5g} {p['NAT_BUZZ_TOP_PCT']:>5g} {p['LIKES_MID_VIEWS_PCT']:>5g} "
+            f"{p['NAT_UPPER_RATIO']:>5g} {p['NAT_BIG_RATIO']:>5g} {p['LIKES_SUSPECT_RATIO']:>5g} {p['LIKES_BIG_RATIO']:>5g} "
+            f"{r['red']:>6} {r['warn']:>6} {r['channels_with_red']:>4} {r['sticky_new']:>5} "
+            f"{r['label_agreement']:>7.4f} {r['red_jaccard']:>6.3f}",
+            file=sys.stderr,
+        )
+
+    print(f"{'q':>5} {'buzz':>5} {'mid':>5} {'up':>5} {'big':>5} {'lsus':>5} {'lbig':>5} "
+          f"{'RED':>6} {'△':>6} {'ch':>4} {'new':>5} {'agree':>7} {'jacc':>6}", file=sys.stderr)
+    for r in sorted(rows, key=lambda r: -r[args.sort])[:args.top]:
+        show(r)
+    cur = [r for r in rows if r["current"]]
+    if cur:
+        print("-- current parameters --", file=sys.stderr)
+        for r in cur:
+            show(r)
+
+    report = {
+        "generator_version": rw.GENERATOR_VERSION,
+        "channels": D["channels"],
+        "points": int(len(D["days"])),
+        "combinations": n_combos,
+        "sweep_sec": round(t_eval, 3),
+        "current": current,
+        "rows": rows,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()